@@ -1,27 +1,105 @@
-from django.contrib import admin
+import datetime
 
-from .models import Author, Category, Book, BookAvailability
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.paginator import Paginator
+from django.db.models import Case, Value, When
+from django.forms.models import BaseInlineFormSet
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+
+from . import circulation, typeahead
+from .forms import RenewBookForm
+from .models import Author, Category, Book, BookAvailability, CatalogCounters, Hold
+
+
+class CountersPaginator(Paginator):
+    """
+    Paginator reading the total of an unfiltered changelist from
+    CatalogCounters instead of running COUNT(*) over the whole table.
+    """
+    def __init__(self, *args, counter_field=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter_field = counter_field
+
+    @cached_property
+    def count(self):
+        if self.counter_field and not self.object_list.query.where:
+            return getattr(CatalogCounters.load(), self.counter_field)
+        return super().count
+
+
+class CountersPaginatorMixin:
+    counter_field = None
+    # The "N total" link would run a second COUNT(*) on filtered lists.
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return CountersPaginator(queryset, per_page, orphans, allow_empty_first_page,
+                                 counter_field=self.counter_field)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    search_fields = ['^name']
+
+
+class BoundedInlineFormSet(BaseInlineFormSet):
+    """Only the first `max_rows` related objects are rendered and editable."""
+    max_rows = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            self._queryset = super().get_queryset()[:self.max_rows]
+        return self._queryset
 
-admin.site.register(Category)
 
 class BooksAvailabilityInline(admin.TabularInline):
     model = BookAvailability
+    formset = BoundedInlineFormSet
+    fields = ('imprint', 'status', 'due_back', 'borrower')
+    autocomplete_fields = ['borrower']
+    show_change_link = True
+    extra = 0
 
 @admin.register(Author)
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(CountersPaginatorMixin, admin.ModelAdmin):
     list_display = ('last_name', 'first_name')
     fields = ['first_name', 'last_name', 'biography']
+    search_fields = ['^last_name', '^first_name']
+    counter_field = 'num_authors'
     pass
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(CountersPaginatorMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'display_category')
+    list_select_related = ('author',)
+    search_fields = ['^title', '=isbn']
+    autocomplete_fields = ['author', 'category']
     inlines = [BooksAvailabilityInline]
-    pass
+    counter_field = 'num_books'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('category')
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and request.resolver_match.url_name == 'autocomplete':
+            # Autocomplete widgets (the book of a copy...) read the typeahead index instead of LIKE queries.
+            suggestions = typeahead.index.suggest(search_term.replace('"', ''), typeahead.TOP_SIZE,
+                                                  {typeahead.BOOK, typeahead.ISBN})
+            pks = [pk for _, pk, _ in suggestions]
+            # Keep the ranking of the index, the best books first.
+            position = Case(*[When(pk=pk, then=Value(rank)) for rank, pk in enumerate(pks)])
+            return queryset.filter(pk__in=pks).order_by(position), False
+        return super().get_search_results(request, queryset, search_term)
 
 @admin.register(BookAvailability)
-class BookAvailabilityAdmin(admin.ModelAdmin):
+class BookAvailabilityAdmin(CountersPaginatorMixin, admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'due_back', 'borrower')
+    list_select_related = ('book', 'borrower')
     list_filter = ('status', 'due_back')
+    autocomplete_fields = ['book', 'borrower']
+    counter_field = 'num_availabilities'
     fieldsets = (
         (None, {
             'fields': ('book', 'imprint', 'id')
@@ -30,4 +108,51 @@ class BookAvailabilityAdmin(admin.ModelAdmin):
             'fields': ('status', 'due_back','borrower')
         }),
     )
-    pass
+    actions = ['renew_selected', 'return_selected', 'mark_available_selected']
+
+    def has_mark_returned_permission(self, request):
+        return request.user.has_perm('catalog.can_mark_returned')
+
+    def report(self, request, count, pks, done):
+        self.message_user(request, '{0} exemplaire(s) {1} sur {2} sélectionné(s).'.format(count, done, len(pks)),
+                          messages.SUCCESS if count else messages.WARNING)
+
+    @admin.action(permissions=['mark_returned'], description='Prolonger les emprunts sélectionnés')
+    def renew_selected(self, request, queryset):
+        # The ids are read before the update, which may take the copies out of a filtered changelist.
+        pks = list(queryset.values_list('pk', flat=True))
+        if 'apply' in request.POST:
+            form = RenewBookForm(request.POST)
+            if form.is_valid():
+                count = circulation.bulk_renew(pks, form.cleaned_data['renewal_date'])
+                self.report(request, count, pks, 'prolongé(s)')
+                return None
+        else:
+            form = RenewBookForm(initial={'renewal_date': datetime.date.today() + circulation.LOAN_PERIOD})
+        return TemplateResponse(request, 'admin/catalog/bookavailability/renew_selected.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Prolonger les emprunts',
+            'opts': self.model._meta,
+            'form': form,
+            'count': len(pks),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(permissions=['mark_returned'], description='Marquer les emprunts sélectionnés comme rendus')
+    def return_selected(self, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
+        self.report(request, circulation.bulk_return(pks), pks, 'rendu(s)')
+
+    @admin.action(permissions=['mark_returned'], description='Remettre en rayon les exemplaires en attente ou réservés')
+    def mark_available_selected(self, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
+        self.report(request, circulation.bulk_mark_available(pks), pks, 'disponible(s)')
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('book', 'patron', 'requested_at')
+    list_select_related = ('book', 'patron')
+    autocomplete_fields = ['book', 'patron']
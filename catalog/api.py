@@ -0,0 +1,214 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
+
+from . import isbn, typeahead
+from .models import Author, Book, BookAvailability, Category
+
+MAX_LIMIT = 1000
+DEFAULT_LIMIT = 100
+MAX_BULK = 500
+MAX_SUGGESTIONS = 20
+
+
+class Resource:
+    """
+    A read-only JSON collection. `fields` maps public field names to ORM
+    lookups; only the requested ones are selected from the database.
+    `filters` maps query parameters to lookups accepting a comma separated
+    list of values, for bulk fetches.
+    """
+
+    def __init__(self, model, fields, default_fields, filters):
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields
+        self.filters = filters
+
+    def projection(self, request):
+        names = request.GET.get('fields')
+        names = [name.strip() for name in names.split(',') if name.strip()] if names else list(self.default_fields)
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError('Champs inconnus: {0}'.format(', '.join(unknown)))
+        if 'id' not in names:
+            names.insert(0, 'id')
+        return names
+
+    def queryset(self, request):
+        queryset = self.model.objects.order_by('pk')
+        for parameter, lookup in self.filters.items():
+            if parameter in request.GET:
+                values = [value for value in request.GET[parameter].split(',') if value]
+                if len(values) > MAX_BULK:
+                    raise ValueError('Au plus {0} valeurs pour {1}'.format(MAX_BULK, parameter))
+                queryset = queryset.filter(**{lookup + '__in': values})
+        return queryset
+
+    def rows(self, queryset, names):
+        # values_list + zip is cheaper than values() for wide result sets.
+        lookups = [self.fields[name] for name in names]
+        return [dict(zip(names, row)) for row in queryset.values_list(*lookups)]
+
+    def list(self, request):
+        try:
+            names = self.projection(request)
+            queryset = self.queryset(request)
+            limit = max(1, min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+            after = request.GET.get('after')
+            if after:
+                queryset = queryset.filter(pk__gt=self.model._meta.pk.to_python(after))
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        except ValidationError:
+            return JsonResponse({'error': 'Paramètre invalide'}, status=400)
+
+        try:
+            rows = self.rows(queryset[:limit + 1], names)
+        except (OverflowError, ValidationError):
+            # Malformed values in a bulk filter, e.g. a copy id which is not a UUID, or ids too large
+            # for the database.
+            return JsonResponse({'error': 'Paramètre invalide'}, status=400)
+        next_after = rows[limit - 1]['id'] if len(rows) > limit else None
+        return JsonResponse({'results': rows[:limit], 'next': next_after})
+
+    def detail(self, request, pk):
+        try:
+            names = self.projection(request)
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        rows = self.rows(self.model.objects.filter(pk=pk), names)
+        if not rows:
+            return JsonResponse({'error': 'Introuvable'}, status=404)
+        return JsonResponse(rows[0])
+
+
+books = Resource(
+    Book,
+    fields={
+        'id': 'id',
+        'title': 'title',
+        'year': 'year',
+        'isbn': 'isbn',
+        'content': 'content',
+        'author_id': 'author_id',
+        'author_first_name': 'author__first_name',
+        'author_last_name': 'author__last_name',
+        'total_copies': 'total_copies',
+        'available_copies': 'available_copies',
+        'updated_at': 'updated_at',
+    },
+    default_fields=('id', 'title', 'isbn', 'author_id'),
+    filters={'ids': 'pk', 'isbn': 'isbn', 'author': 'author_id'},
+)
+
+authors = Resource(
+    Author,
+    fields={'id': 'id', 'first_name': 'first_name', 'last_name': 'last_name', 'biography': 'biography'},
+    default_fields=('id', 'first_name', 'last_name'),
+    filters={'ids': 'pk'},
+)
+
+categories = Resource(
+    Category,
+    fields={'id': 'id', 'name': 'name'},
+    default_fields=('id', 'name'),
+    filters={'ids': 'pk'},
+)
+
+copies = Resource(
+    BookAvailability,
+    fields={'id': 'id', 'book_id': 'book_id', 'imprint': 'imprint', 'status': 'status', 'due_back': 'due_back'},
+    default_fields=('id', 'book_id', 'status', 'due_back'),
+    filters={'ids': 'pk', 'book': 'book_id', 'status': 'status'},
+)
+
+
+@require_GET
+def book_list(request):
+    return books.list(request)
+
+
+@require_GET
+def book_detail(request, pk):
+    return books.detail(request, pk)
+
+
+@require_GET
+def author_list(request):
+    return authors.list(request)
+
+
+@require_GET
+def author_detail(request, pk):
+    return authors.detail(request, pk)
+
+
+@require_GET
+def category_list(request):
+    return categories.list(request)
+
+
+@require_GET
+def copy_list(request):
+    return copies.list(request)
+
+
+@require_GET
+def suggest(request):
+    """Titles, ISBNs and authors starting with `q`, from the in-process index (catalog.typeahead)."""
+    kinds = {name: kind for kind, name in typeahead.KINDS.items()}
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), MAX_SUGGESTIONS))
+        selected = request.GET.get('kinds')
+        selected = {kinds[name] for name in selected.split(',') if name} if selected else None
+    except (ValueError, KeyError):
+        return JsonResponse({'error': 'Paramètre invalide'}, status=400)
+
+    results = []
+    for kind, pk, label in typeahead.index.suggest(request.GET.get('q', ''), limit, selected):
+        url = reverse('author-detail' if kind == typeahead.AUTHOR else 'book-detail', args=[pk])
+        results.append({'kind': typeahead.KINDS[kind], 'id': pk, 'label': label, 'url': url})
+    return JsonResponse({'results': results})
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def books_by_isbn(request):
+    """
+    Books and availability of up to MAX_BULK ISBNs, in any form, with one
+    query on the unique ISBN index: `?isbn=` comma separated, or a POST of
+    {"isbn": [...]} for a whole shelf. Read only, hence no CSRF token.
+    """
+    try:
+        if request.method == 'POST':
+            values = json.loads(request.body)['isbn']
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                raise ValueError
+        else:
+            values = request.GET.get('isbn', '').split(',')
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Paramètre invalide'}, status=400)
+    values = list(dict.fromkeys(value.strip() for value in values if value.strip()))
+    if len(values) > MAX_BULK:
+        return JsonResponse({'error': 'Au plus {0} valeurs pour isbn'.format(MAX_BULK)}, status=400)
+
+    keys = {}
+    for value in values:
+        try:
+            keys[value] = isbn.to_isbn13(value)
+        except ValueError:
+            # Still looked up, as older books may have a reference which is not an ISBN.
+            keys[value] = None
+    books = {}
+    queryset = Book.objects.filter(isbn__in={key or value for value, key in keys.items()})
+    for pk, key, title, author_id, total, available in queryset.values_list(
+            'pk', 'isbn', 'title', 'author_id', 'total_copies', 'available_copies'):
+        books[key] = {'id': pk, 'title': title, 'author_id': author_id, 'total_copies': total,
+                      'available_copies': available, 'url': reverse('book-detail', args=[pk])}
+    return JsonResponse({'results': [{'query': value, 'isbn': key, 'book': books.get(key or value)}
+                                     for value, key in keys.items()]})
@@ -0,0 +1,114 @@
+"""
+Async versions of the read-only catalog pages, served by the ASGI deployment
+(see catalog.urls_async). They share querysets, pagination and page caching
+with the views of catalog.views; only the database and cache accesses are
+awaited, so a slow query no longer holds a worker thread for the whole request.
+"""
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.utils.translation import gettext as _
+
+from catalog import views
+from catalog.forms import BookFilterForm
+from catalog.caching import aconditional_response
+from catalog.models import CatalogCounters
+from catalog.pagination import Keyset
+
+
+def _load_user(request):
+    """Evaluate request.user and the permissions read by layout.html."""
+    user = request.user
+    if user.is_authenticated:
+        user.get_all_permissions()
+    return user
+
+
+async def index(request):
+    await sync_to_async(_load_user)(request)
+    counters = await CatalogCounters.aload()
+    return render(request, 'index.html', context=views.index_context(counters))
+
+
+async def _object_list(request, view_class, extra_context=None):
+    if view_class.page_kwarg in request.GET:
+        # Offset pages from old links are left to the sync view.
+        return await sync_to_async(view_class.as_view())(request)
+
+    await sync_to_async(_load_user)(request)
+    keyset = Keyset(view_class.keyset_ordering)
+    rows, state = keyset.slice(view_class.queryset, request.GET.get(view_class.cursor_kwarg),
+                               view_class.paginate_by)
+    page = keyset.page([obj async for obj in rows], state, view_class.paginate_by)
+
+    model_name = view_class.model._meta.model_name
+    context = {
+        'object_list': page.object_list,
+        '{0}_list'.format(model_name): page.object_list,
+        'paginator': None,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        **(extra_context or {}),
+    }
+    return render(request, 'catalog/{0}_list.html'.format(model_name), context)
+
+
+async def _object_detail(request, view_class, pk):
+    model = view_class.model
+
+    async def render_page():
+        try:
+            obj = await view_class.queryset.aget(pk=pk)
+        except model.DoesNotExist:
+            raise Http404(_('No %(verbose_name)s found matching the query') % {'verbose_name': model._meta.verbose_name})
+        return render(request, 'catalog/{0}_detail.html'.format(model._meta.model_name),
+                      {'object': obj, model._meta.model_name: obj})
+
+    await sync_to_async(_load_user)(request)
+    return await aconditional_response(request, model, pk, render_page)
+
+
+async def book_list(request):
+    form = BookFilterForm(request.GET)
+    if any(name in request.GET for name in form.fields):
+        # Filtered lists are left to the sync view.
+        return await sync_to_async(views.BookListView.as_view())(request)
+    extra_context = await sync_to_async(views.book_list_context)(form, request.GET)
+    return await _object_list(request, views.BookListView, extra_context)
+
+
+async def book_detail(request, pk):
+    return await _object_detail(request, views.BookDetailView, pk)
+
+
+async def author_list(request):
+    return await _object_list(request, views.AuthorListView)
+
+
+async def author_detail(request, pk):
+    return await _object_detail(request, views.AuthorDetailView, pk)
+
+
+# Exports larger than this are spooled to disk.
+EXPORT_SPOOL_SIZE = 8 * 2 ** 20
+
+
+def _spooled_export(request, dataset, file_format):
+    response = views.export(request, dataset, file_format)
+    if not response.streaming:
+        return response
+    stream = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    for part in response.streaming_content:
+        stream.write(part)
+    stream.seek(0)
+    spooled = FileResponse(stream, content_type=response['Content-Type'])
+    spooled['Content-Disposition'] = response['Content-Disposition']
+    return spooled
+
+
+async def export(request, dataset, file_format):
+    # The ASGI handler of Django 4.1 iterates streaming responses in the event loop, where the queries of
+    # catalog.exports can't run: the export is written to a temporary file in a thread, then sent from it.
+    return await sync_to_async(_spooled_export)(request, dataset, file_format)
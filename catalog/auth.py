@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+# Short: invalidations only reach the cache of the process saving the change, see settings.
+CACHE_TIMEOUT = getattr(settings, 'CATALOG_AUTH_CACHE_TIMEOUT', 10)
+
+
+def user_key(pk):
+    return 'catalog:auth:user:{0}'.format(pk)
+
+
+def permissions_key(pk):
+    return 'catalog:auth:permissions:{0}'.format(pk)
+
+
+def forget_users(pks):
+    """Drop the cached users and permissions of the given users, see CachedModelBackend."""
+    pks = {pk for pk in pks if pk is not None}
+    if pks:
+        cache.delete_many([key(pk) for pk in pks for key in (user_key, permissions_key)])
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend keeping the logged in users and their permissions in the
+    cache, so that authenticated requests don't query the user, user
+    permission and group permission tables. catalog.signals forgets the
+    entries of a user when the user, its groups or the permissions of those
+    change, in the cache of the current process: with a cache per process,
+    the others keep them until CATALOG_AUTH_CACHE_TIMEOUT expires.
+    """
+
+    def get_user(self, user_id):
+        key = user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, CACHE_TIMEOUT)
+        return user
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
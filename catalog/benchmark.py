@@ -0,0 +1,43 @@
+import datetime
+import json
+import math
+import statistics
+import subprocess
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(durations):
+    """Latency summary, in milliseconds, of durations given in seconds."""
+    samples = [duration * 1000 for duration in durations]
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(report, path):
+    """Add run metadata to `report` and save it as JSON, for comparison across commits."""
+    report.setdefault('revision', git_revision())
+    report.setdefault('date', datetime.datetime.now(datetime.timezone.utc).isoformat())
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(report, stream, indent=2, ensure_ascii=False)
+        stream.write('\n')
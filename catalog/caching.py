@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .routers import use_primary
+
+# Seconds a version or a rendered page stays in the cache. Invalidation deletes
+# version keys explicitly, the timeout only bounds staleness when the cache is
+# not shared between processes.
+CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def version_key(model, pk):
+    return 'catalog:version:{0}:{1}'.format(model._meta.model_name, pk)
+
+
+def get_version(model, pk):
+    """
+    Return the modification timestamp (epoch microseconds) of an object, from
+    the cache when possible, or None if the object does not exist.
+
+    Versions are read from the primary: one read from a lagging replica would
+    stay cached until the next change of the object.
+    """
+    key = version_key(model, pk)
+    version = cache.get(key)
+    if version is None:
+        updated_at = model.objects.using(router.db_for_write(model)).filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        version = int(updated_at.timestamp() * 1000000)
+        cache.set(key, version, CACHE_TIMEOUT)
+    return version
+
+
+async def aget_version(model, pk):
+    """Async version of get_version."""
+    key = version_key(model, pk)
+    version = await cache.aget(key)
+    if version is None:
+        updated_at = await model.objects.using(router.db_for_write(model)).filter(pk=pk).values_list('updated_at', flat=True).afirst()
+        if updated_at is None:
+            return None
+        version = int(updated_at.timestamp() * 1000000)
+        await cache.aset(key, version, CACHE_TIMEOUT)
+    return version
+
+
+def touch(model, pks):
+    """
+    Bump `updated_at` on the given objects and drop their cached versions, so
+    pages rendered from them are no longer served.
+    """
+    pks = [pk for pk in set(pks) if pk is not None]
+    if not pks:
+        return
+    model.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+    invalidate(model, pks)
+
+
+def invalidate(model, pks):
+    """
+    Drop the cached versions of the given objects once the current transaction
+    commits: dropped earlier, a concurrent request could cache the version
+    still committed again, and a rollback would leave nothing to drop.
+    """
+    keys = [version_key(model, pk) for pk in pks]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _validators(request, model, pk, version):
+    # The sidebar differs per user, so the validators do too.
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    etag = quote_etag('{0}-{1}-{2}-{3}'.format(model._meta.model_name, pk, version, viewer))
+    return etag, int(version // 1000000)
+
+
+def _page_key(model, pk, version):
+    return 'catalog:page:{0}:{1}:{2}'.format(model._meta.model_name, pk, version)
+
+
+def _finish(request, response, etag, last_modified):
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_vary_headers(response, ('Cookie',))
+    if request.user.is_authenticated:
+        # The layout shows the user: kept by the browser only, and revalidated.
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalDetailMixin:
+    """
+    DetailView mixin answering with 304 when the client already has the
+    current version of the object, and serving anonymous requests from a page
+    cache keyed by that version. Neither path touches the ORM once the version
+    is cached. Pages are rendered from the primary, where the version is read:
+    a body rendered from a lagging replica would be revalidated with 304 once
+    the replica caught up.
+    """
+
+    def get(self, request, *args, **kwargs):
+        pk = kwargs[self.pk_url_kwarg]
+        version = get_version(self.model, pk)
+        if version is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, last_modified = _validators(request, self.model, pk, version)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            page_key = _page_key(self.model, pk, version)
+            cacheable = not request.user.is_authenticated
+            page = cache.get(page_key) if cacheable else None
+            if page is not None:
+                response = HttpResponse(page)
+            else:
+                # Rendered from the primary, like the version its validators and cache key come from.
+                with use_primary():
+                    response = super().get(request, *args, **kwargs)
+                    response.render()
+                if cacheable and response.status_code == 200:
+                    cache.set(page_key, response.content, CACHE_TIMEOUT)
+
+        return _finish(request, response, etag, last_modified)
+
+
+async def aconditional_response(request, model, pk, render):
+    """
+    Async counterpart of ConditionalDetailMixin for the object `pk` of
+    `model`: `render` is a coroutine function producing the full page.
+    request.user must already be loaded.
+    """
+    version = await aget_version(model, pk)
+    if version is None:
+        return await render()
+
+    etag, last_modified = _validators(request, model, pk, version)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        page_key = _page_key(model, pk, version)
+        cacheable = not request.user.is_authenticated
+        page = await cache.aget(page_key) if cacheable else None
+        if page is not None:
+            response = HttpResponse(page)
+        else:
+            with use_primary():
+                response = await render()
+            if cacheable and response.status_code == 200:
+                await cache.aset(page_key, response.content, CACHE_TIMEOUT)
+
+    return _finish(request, response, etag, last_modified)
@@ -0,0 +1,196 @@
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .caching import invalidate, touch
+from .models import Author, Book, BookAvailability, CatalogCounters, Hold
+
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+
+class CirculationError(Exception):
+    """The copy is not in a state allowing the requested operation."""
+
+
+def _transition(pk, condition, changes, message):
+    """
+    Apply `changes` to the copy `pk` with a single UPDATE guarded by
+    `condition`, so that of several concurrent requests for the same copy
+    exactly one succeeds. Counters and page versions maintained by the signal
+    handlers are adjusted here since queryset updates send no signals.
+    Return the book of the copy.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not BookAvailability.objects.filter(pk=pk, **condition).update(updated_at=now, **changes):
+            raise CirculationError(message)
+        was_open = condition.get('status') == 'a'
+        is_open = changes.get('status', condition.get('status')) == 'a'
+        delta = int(is_open) - int(was_open)
+        CatalogCounters.increment(num_availabilities_open=delta)
+        book_id, author_id = BookAvailability.objects.filter(pk=pk).values_list('book_id', 'book__author_id').first()
+        if book_id is not None:
+            Book.increment_copies(book_id, available=delta, updated_at=now)
+            invalidate(Book, [book_id])
+            touch(Author, [author_id])
+    return book_id
+
+
+def _bulk_transition(pks, condition, changes):
+    """
+    _transition for many copies: a single UPDATE applies `changes` to the
+    copies of `pks` still matching `condition`, the others are left out. The
+    changed copies are found back by their new `updated_at`, then the counters
+    and page versions of their books and authors are adjusted with one query
+    each. Return the number of copies changed and their books.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        count = BookAvailability.objects.filter(pk__in=pks, **condition).update(updated_at=now, **changes)
+        if not count:
+            return 0, set()
+        rows = BookAvailability.objects.filter(pk__in=pks, updated_at=now).values_list('book_id', 'book__author_id')
+        book_ids = {book_id for book_id, _ in rows if book_id is not None}
+        author_ids = {author_id for _, author_id in rows}
+        was_open = condition.get('status') == 'a'
+        is_open = changes.get('status', condition.get('status')) == 'a'
+        delta = int(is_open) - int(was_open)
+        CatalogCounters.increment(num_availabilities_open=delta * count)
+        if book_ids:
+            books = Book.objects.filter(pk__in=book_ids)
+            if delta:
+                Book.recount_copies(books, updated_at=now)
+            else:
+                books.update(updated_at=now)
+            invalidate(Book, book_ids)
+            touch(Author, author_ids)
+    return count, book_ids
+
+
+def _serve_holds(book_id):
+    """
+    Reserve the available copies of a book for its oldest holds. Called inside
+    a transaction after a write, so that on SQLite the database lock is held
+    and no other transaction can serve the same holds or copies.
+    Return the patrons served.
+    """
+    served = []
+    copies = BookAvailability.objects.filter(book_id=book_id, status__exact='a').values_list('pk', flat=True)
+    for pk in copies:
+        head = Hold.objects.filter(book_id=book_id).order_by('id').values_list('pk', 'patron_id').first()
+        if head is None:
+            break
+        Hold.objects.filter(pk=head[0]).delete()
+        _transition(pk, {'status': 'a'}, {'status': 'r', 'borrower_id': head[1], 'due_back': None},
+                    "Cet exemplaire n'est pas disponible.")
+        served.append(head[1])
+    return served
+
+
+def serve_holds(book_id):
+    """
+    Serve the holds on a book one of whose copies was put on the shelf by a
+    save (admin, new copy), see catalog.signals. Return the patrons served.
+    """
+    with transaction.atomic():
+        return _serve_holds(book_id)
+
+
+def _take_turn(book_id, user):
+    """
+    Refuse an available copy of a book others are queued for, unless `user`
+    is at the head of the queue: the hold of `user` is then used up. Called
+    inside the transaction of the copy's update, which took the lock.
+    """
+    head = Hold.objects.filter(book_id=book_id).order_by('id').values_list('pk', 'patron_id').first()
+    if head is None:
+        return
+    if head[1] != user.pk:
+        raise CirculationError("D'autres lecteurs attendent ce livre.")
+    Hold.objects.filter(pk=head[0]).delete()
+
+
+def checkout(pk, user, due_back=None):
+    """Lend a copy reserved by `user`, or an available copy nobody ahead of `user` waits for, to `user`."""
+    changes = {'status': 'o', 'borrower': user, 'due_back': due_back or datetime.date.today() + LOAN_PERIOD}
+    try:
+        _transition(pk, {'status': 'r', 'borrower': user}, changes, "Cet exemplaire n'est pas disponible.")
+    except CirculationError:
+        with transaction.atomic():
+            book_id = _transition(pk, {'status': 'a'}, changes, "Cet exemplaire n'est pas disponible.")
+            _take_turn(book_id, user)
+
+
+def reserve(pk, user):
+    """Hold an available copy nobody ahead of `user` waits for, for `user`."""
+    with transaction.atomic():
+        book_id = _transition(pk, {'status': 'a'}, {'status': 'r', 'borrower': user, 'due_back': None},
+                              "Cet exemplaire n'est pas disponible.")
+        _take_turn(book_id, user)
+
+
+def return_copy(pk):
+    """Mark a lent copy as returned, and reserve it for the first hold on its book if any."""
+    with transaction.atomic():
+        book_id = _transition(pk, {'status': 'o'}, {'status': 'a', 'borrower': None, 'due_back': None},
+                              "Cet exemplaire n'est pas emprunté.")
+        _serve_holds(book_id)
+
+
+def renew(pk, due_back):
+    """Move the due date of a lent copy."""
+    _transition(pk, {'status': 'o'}, {'due_back': due_back}, "Cet exemplaire n'est pas emprunté.")
+
+
+def bulk_renew(pks, due_back):
+    """Move the due date of the lent copies among `pks`, return the number of copies renewed."""
+    return _bulk_transition(pks, {'status': 'o'}, {'due_back': due_back})[0]
+
+
+def bulk_return(pks):
+    """Mark the lent copies among `pks` as returned and serve the holds on their books, return the number returned."""
+    with transaction.atomic():
+        count, book_ids = _bulk_transition(pks, {'status': 'o'}, {'status': 'a', 'borrower': None, 'due_back': None})
+        _serve_books_holds(book_ids)
+    return count
+
+
+def bulk_mark_available(pks):
+    """
+    Put back on the shelf the copies among `pks` which are pending or reserved,
+    and serve the holds on their books. Return the number of copies changed.
+    """
+    with transaction.atomic():
+        count, book_ids = _bulk_transition(pks, {'status__in': ('d', 'r')},
+                                           {'status': 'a', 'borrower': None, 'due_back': None})
+        _serve_books_holds(book_ids)
+    return count
+
+
+def _serve_books_holds(book_ids):
+    if book_ids:
+        for book_id in Hold.objects.filter(book_id__in=book_ids).order_by().values_list('book_id', flat=True).distinct():
+            _serve_holds(book_id)
+
+
+def place_hold(book_id, user):
+    """
+    Queue `user` for a copy of the book. Return the hold, or None when a copy
+    was available and is now reserved for `user`.
+    """
+    try:
+        with transaction.atomic():
+            # Inserting first takes the lock before the available copies are read.
+            hold = Hold.objects.create(book_id=book_id, patron=user)
+            if user.pk in _serve_holds(book_id):
+                return None
+    except IntegrityError:
+        raise CirculationError("Vous êtes déjà dans la file d'attente de ce livre.")
+    return hold
+
+
+def cancel_hold(pk, user):
+    """Leave the queue."""
+    if not Hold.objects.filter(pk=pk, patron=user).delete()[0]:
+        raise CirculationError("Cette réservation n'existe plus.")
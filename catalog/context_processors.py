@@ -0,0 +1,6 @@
+from catalog.caching import CACHE_TIMEOUT
+
+
+def fragment_cache(request):
+    """Timeout of the {% cache %} fragments of the catalog templates."""
+    return {'catalog_cache_timeout': CACHE_TIMEOUT}
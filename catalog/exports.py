@@ -0,0 +1,80 @@
+import csv
+import json
+
+from .models import Author, Book, BookAvailability
+
+CHUNK_SIZE = 2000
+
+# Exported columns per dataset, as values_list() lookups.
+DATASETS = {
+    'books': (Book, ('id', 'isbn', 'title', 'year', 'author_id', 'author__last_name', 'author__first_name')),
+    'authors': (Author, ('id', 'last_name', 'first_name')),
+    'loans': (BookAvailability, ('id', 'book_id', 'book__title', 'imprint', 'status', 'due_back',
+                                 'borrower__username')),
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def iter_rows(dataset, chunk_size=CHUNK_SIZE):
+    """
+    Yield the rows of `dataset` as dicts, reading the table in primary key order
+    one chunk at a time so memory use and query length stay constant.
+    """
+    model, columns = DATASETS[dataset]
+    queryset = model.objects.order_by('pk').values_list(*columns)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        rows = [dict(zip(columns, values)) for values in chunk]
+        if dataset == 'books':
+            # One query per chunk for the many-to-many categories.
+            categories = {}
+            links = Book.category.through.objects.filter(book_id__in=[row['id'] for row in rows])
+            for book_id, name in links.values_list('book_id', 'category__name').order_by('category__name'):
+                categories.setdefault(book_id, []).append(name)
+            for row in rows:
+                row['categories'] = categories.get(row['id'], [])
+        yield from rows
+        last_pk = chunk[-1][0]
+
+
+def columns_for(dataset):
+    columns = list(DATASETS[dataset][1])
+    if dataset == 'books':
+        columns.append('categories')
+    return columns
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '|'.join(value)
+    return value
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes, for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def iter_lines(dataset, file_format, chunk_size=CHUNK_SIZE):
+    """Yield the export of `dataset` as text lines in `file_format`."""
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        columns = columns_for(dataset)
+        yield writer.writerow(columns)
+        for row in iter_rows(dataset, chunk_size):
+            yield writer.writerow([_format_value(row[column]) for column in columns])
+    else:
+        for row in iter_rows(dataset, chunk_size):
+            yield json.dumps(row, default=str, ensure_ascii=False) + '\n'
@@ -6,16 +6,85 @@ import datetime
 from django import forms
 
 
+def validate_renewal_date(data):
+    if data < datetime.date.today():
+        raise ValidationError(_("Date invalide - Date antérieur à aujourd'hui"))
+    if data > datetime.date.today() + datetime.timedelta(weeks=4):
+        raise ValidationError(
+            _("Date invalide - Vous ne pouvez pas aller au-delà du mois prochain"))
+
+
 class RenewBookForm(forms.Form):
     renewal_date = forms.DateField(
             help_text="Entrez une date jusqu'au mois prochain maximum.")
 
     def clean_renewal_date(self):
         data = self.cleaned_data['renewal_date']
+        validate_renewal_date(data)
+        return data
+
+
+class CopiesField(forms.Field):
+    """Identifiers of the copies selected by checkboxes named after the field."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        uuid_field = forms.UUIDField()
+        return [uuid_field.clean(pk) for pk in value]
+
+
+class BulkCirculationForm(forms.Form):
+    """Renewal or return of the copies selected in the list of all loans."""
+    ACTIONS = (
+        ('renew', 'Prolonger'),
+        ('return', 'Retour'),
+    )
+
+    copies = CopiesField(error_messages={'required': _('Aucun exemplaire sélectionné')})
+    action = forms.ChoiceField(choices=ACTIONS)
+    renewal_date = forms.DateField(required=False, help_text="Entrez une date jusqu'au mois prochain maximum.")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('action') == 'renew':
+            data = cleaned_data.get('renewal_date')
+            if data is None:
+                self.add_error('renewal_date', _('Date de retour requise pour prolonger'))
+            else:
+                try:
+                    validate_renewal_date(data)
+                except ValidationError as error:
+                    self.add_error('renewal_date', error)
+        return cleaned_data
+
+class BookFilterForm(forms.Form):
+    """Filters of the book list, from its query string."""
+    # Bounds keeping the values within the integers the database compares.
+    category = forms.IntegerField(required=False, min_value=1, max_value=2 ** 63 - 1, widget=forms.HiddenInput)
+    year_min = forms.IntegerField(required=False, min_value=-9999, max_value=9999, label='De')
+    year_max = forms.IntegerField(required=False, min_value=-9999, max_value=9999, label='À')
+    available = forms.BooleanField(required=False, label='Disponible maintenant')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        year_min, year_max = cleaned_data.get('year_min'), cleaned_data.get('year_max')
+        if year_min is not None and year_max is not None and year_min > year_max:
+            raise ValidationError(_("Période invalide - L'année de début est postérieure à l'année de fin"))
+        return cleaned_data
 
-        if data < datetime.date.today():
-            raise ValidationError(_("Date invalide - Date antérieur à aujourd'hui"))
-        if data > datetime.date.today() + datetime.timedelta(weeks=4):
-            raise ValidationError(
-                _("Date invalide - Vous ne pouvez pas aller au-delà du mois prochain"))
-        return data
\ No newline at end of file
+    def filter(self, queryset):
+        """Apply the valid filters to a Book queryset."""
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data['category']:
+            queryset = queryset.filter(category=data['category'])
+        if data['year_min'] is not None:
+            queryset = queryset.filter(year__gte=data['year_min'])
+        if data['year_max'] is not None:
+            queryset = queryset.filter(year__lte=data['year_max'])
+        if data['available']:
+            queryset = queryset.filter(available_copies__gt=0)
+        return queryset
@@ -0,0 +1,79 @@
+"""
+ISBNs are stored as canonical ISBN-13: 13 digits, without separators. ISBN-10
+are converted, with a 978 prefix and a recomputed check digit.
+"""
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+ISBN10 = re.compile(r'\d{9}[\dX]', re.ASCII)
+ISBN13 = re.compile(r'97[89]\d{10}', re.ASCII)
+
+# Longest input accepted by forms: 13 digits and 4 separators.
+INPUT_LENGTH = 17
+
+
+def isbn13_check_digit(digits):
+    return str(-sum(int(digit) * (3 if position % 2 else 1) for position, digit in enumerate(digits[:12])) % 10)
+
+
+def to_isbn13(value):
+    """Canonical ISBN-13 of an ISBN-10 or ISBN-13 with optional dashes or spaces, ValueError if invalid."""
+    digits = re.sub(r'[\s-]', '', value).upper()
+    if ISBN10.fullmatch(digits):
+        total = sum((10 - position) * (10 if digit == 'X' else int(digit)) for position, digit in enumerate(digits))
+        if total % 11:
+            raise ValueError('Clé de contrôle invalide: {0}'.format(value))
+        digits = '978' + digits[:9]
+        return digits + isbn13_check_digit(digits)
+    if ISBN13.fullmatch(digits):
+        if digits[12] != isbn13_check_digit(digits):
+            raise ValueError('Clé de contrôle invalide: {0}'.format(value))
+        return digits
+    raise ValueError('ISBN invalide: {0}'.format(value))
+
+
+def canonical(value):
+    """Canonical ISBN-13 of `value` if it is a valid ISBN, `value` unchanged otherwise."""
+    try:
+        return to_isbn13(value)
+    except ValueError:
+        return value
+
+
+class ISBNField(models.CharField):
+    """
+    CharField storing canonical ISBN-13. Forms, the admin and full_clean reject
+    invalid ISBNs; save and lookups convert valid ones and keep the others, as
+    the references of older records may not be ISBNs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 13)
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return value
+        try:
+            return to_isbn13(value)
+        except ValueError as error:
+            raise ValidationError(str(error), code='invalid')
+
+    def get_prep_value(self, value):
+        # Unlike to_python, which validates, queries and saves keep what is not an ISBN, and find a
+        # book whatever the form of its ISBN.
+        value = models.Field.get_prep_value(self, value)
+        return value if value is None else canonical(str(value))
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if value:
+            value = canonical(value)
+            setattr(model_instance, self.attname, value)
+        return value
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'max_length': INPUT_LENGTH, **kwargs})
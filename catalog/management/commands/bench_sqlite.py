@@ -0,0 +1,162 @@
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog.benchmark import summarize, write_report
+from catalog.models import Book, BookAvailability
+from catalog.sqlite import apply_pragmas
+
+# Page of the book list after a title, then the copies of a book, as the list and detail views read them.
+READ_PAGE = ('SELECT b.id, b.title, b.isbn, a.first_name, a.last_name FROM catalog_book b '
+             'LEFT OUTER JOIN catalog_author a ON a.id = b.author_id '
+             'WHERE b.title >= ? ORDER BY b.title, b.id LIMIT 11')
+READ_COPIES = 'SELECT id, status, due_back, imprint FROM catalog_bookavailability WHERE book_id = ?'
+
+# A circulation transition (catalog.circulation._transition): guarded update, counters, book counters and version.
+TRANSITION = ('UPDATE catalog_bookavailability SET status = ?, borrower_id = ?, due_back = ?, updated_at = ? '
+              'WHERE id = ? AND status = ?')
+COUNTERS = 'UPDATE catalog_catalogcounters SET num_availabilities_open = num_availabilities_open + ? WHERE id = 1'
+TOUCH = ('UPDATE catalog_book SET updated_at = ?, available_copies = available_copies + ? '
+         'WHERE id = (SELECT book_id FROM catalog_bookavailability WHERE id = ?)')
+
+
+class Command(BaseCommand):
+    help = ("Mesure le débit de lectures et d'emprunts/retours concurrents sur une copie de la base SQLite, "
+            "avec la configuration SQLite par défaut de Django puis avec CATALOG_SQLITE_PRAGMAS et des "
+            "connexions persistantes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help="Threads de lecture.")
+        parser.add_argument('--writers', type=int, default=2, help="Threads d'emprunts et de retours.")
+        parser.add_argument('--duration', type=float, default=5, help="Durée de chaque mesure, en secondes.")
+        parser.add_argument('--output', help="Fichier JSON où enregistrer les résultats.")
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("La base principale n'est pas une base SQLite.")
+        titles = list(Book.objects.order_by('?').values_list('title', flat=True)[:500])
+        book_ids = list(Book.objects.order_by('?').values_list('id', flat=True)[:500])
+        copy_ids = [pk.hex for pk in BookAvailability.objects.filter(status__exact='a')
+                    .order_by('?').values_list('id', flat=True)[:500]]
+        user_ids = list(User.objects.values_list('id', flat=True)[:100])
+        if not titles or not copy_ids or not user_ids:
+            raise CommandError('Catalogue vide: lancez seed_benchmark auparavant.')
+        self.workload = titles, book_ids, copy_ids, user_ids
+
+        profiles = {
+            # Django without tuning: rollback journal, full fsync, a connection per request.
+            'default': ({'journal_mode': 'delete'}, False),
+            'tuned': (settings.CATALOG_SQLITE_PRAGMAS, True),
+        }
+        report = {
+            'readers': options['readers'],
+            'writers': options['writers'],
+            'duration_s': options['duration'],
+            'pragmas': settings.CATALOG_SQLITE_PRAGMAS,
+            'profiles': {},
+        }
+        primary.ensure_connection()
+        with tempfile.TemporaryDirectory() as directory:
+            for name, (pragmas, persistent) in profiles.items():
+                path = os.path.join(directory, '{0}.sqlite3'.format(name))
+                target = sqlite3.connect(path)
+                primary.connection.backup(target)
+                target.execute('PRAGMA journal_mode = {0}'.format(pragmas.get('journal_mode', 'delete')))
+                target.close()
+
+                result = self.run(path, pragmas, persistent, options)
+                report['profiles'][name] = result
+                self.stdout.write('{0:<8} lectures {1[throughput_rps]:.0f}/s p95={1[p95_ms]:.1f}ms  '
+                                  'écritures {2[throughput_rps]:.0f}/s p95={2[p95_ms]:.1f}ms  '
+                                  'verrouillées {3}'.format(name, result['reads'], result['writes'], result['locked']))
+
+        default, tuned = report['profiles']['default'], report['profiles']['tuned']
+        report['gain'] = {kind: round(tuned[kind]['throughput_rps'] / max(default[kind]['throughput_rps'], 0.1), 2)
+                          for kind in ('reads', 'writes')}
+        self.stdout.write(self.style.SUCCESS('Gain: lectures x{0[reads]}, écritures x{0[writes]}'.format(report['gain'])))
+        if options['output']:
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS('Résultats enregistrés dans {0}'.format(options['output'])))
+
+    def run(self, path, pragmas, persistent, options):
+        stop = threading.Event()
+        durations = {'reads': [], 'writes': []}
+        locked = []
+
+        def connect():
+            # Autocommit with explicit transactions, as Django opens its connections.
+            connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA foreign_keys = ON')
+            apply_pragmas(connection, {name: value for name, value in pragmas.items() if name != 'journal_mode'})
+            return connection
+
+        def worker(kind, operation, seed):
+            generator = random.Random(seed)
+            samples = []
+            connection = connect() if persistent else None
+            while not stop.is_set():
+                started = time.perf_counter()
+                current = connection or connect()
+                try:
+                    operation(current, generator)
+                except sqlite3.OperationalError:
+                    locked.append(kind)
+                    if current.in_transaction:
+                        current.execute('ROLLBACK')
+                else:
+                    samples.append(time.perf_counter() - started)
+                finally:
+                    if not persistent:
+                        current.close()
+            if connection is not None:
+                connection.close()
+            durations[kind].extend(samples)
+
+        threads = ([threading.Thread(target=worker, args=('reads', self.read, seed))
+                    for seed in range(options['readers'])]
+                   + [threading.Thread(target=worker, args=('writes', self.circulate, 1000 + seed))
+                      for seed in range(options['writers'])])
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        result = {'locked': len(locked)}
+        for kind, samples in durations.items():
+            result[kind] = summarize(samples) if samples else {'count': 0}
+            result[kind].setdefault('p95_ms', 0)
+            result[kind]['throughput_rps'] = round(len(samples) / elapsed, 1)
+        return result
+
+    def read(self, connection, generator):
+        titles, book_ids, _, _ = self.workload
+        connection.execute(READ_PAGE, [generator.choice(titles)]).fetchall()
+        connection.execute(READ_COPIES, [generator.choice(book_ids)]).fetchall()
+
+    def circulate(self, connection, generator):
+        """Lend a copy then return it: two write transactions."""
+        _, _, copy_ids, user_ids = self.workload
+        copy_id = generator.choice(copy_ids)
+        due_back = (datetime.date.today() + datetime.timedelta(weeks=3)).isoformat()
+        for status, borrower_id, due, condition, delta in (('o', generator.choice(user_ids), due_back, 'a', -1),
+                                                            ('a', None, None, 'o', 1)):
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat(' ')
+            connection.execute('BEGIN')
+            if connection.execute(TRANSITION, [status, borrower_id, due, now, copy_id, condition]).rowcount:
+                connection.execute(COUNTERS, [delta])
+                connection.execute(TOUCH, [now, delta, copy_id])
+            connection.execute('COMMIT')
@@ -0,0 +1,82 @@
+import random
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmark import summarize, write_report
+from catalog.management.commands.seed_benchmark import WORDS
+from catalog.typeahead import BOOK, ISBN, PrefixIndex, book_entries
+
+
+class Command(BaseCommand):
+    help = ("Mesure la construction de l'index des suggestions et la latence des recherches par préfixe "
+            "sur un catalogue synthétique, sans base de données.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=1000000, help="Nombre de titres indexés.")
+        parser.add_argument('--queries', type=int, default=2000, help="Recherches par longueur de préfixe.")
+        parser.add_argument('--updates', type=int, default=1000, help="Mises à jour incrémentales mesurées.")
+        parser.add_argument('--seed', type=int, default=1, help="Graine du générateur aléatoire.")
+        parser.add_argument('--output', help="Fichier JSON où enregistrer les résultats.")
+
+    def handle(self, *args, **options):
+        if options['titles'] < 1:
+            raise CommandError('--titles doit être positif.')
+        self.random = random.Random(options['seed'])
+        titles = [self.title(number) for number in range(options['titles'])]
+
+        started = time.perf_counter()
+        index = PrefixIndex()
+        entries = []
+        for pk, (title, isbn) in enumerate(titles, start=1):
+            entries.extend(book_entries(pk, title, isbn, self.random.randrange(10)))
+        index.load(entries)
+        build = time.perf_counter() - started
+        del entries
+
+        report = {
+            'titles': options['titles'],
+            'entries': len(index),
+            'build_s': round(build, 3),
+            'memory_mb': round(self.memory(index) / 2 ** 20, 1),
+            'lookups': {},
+        }
+        self.stdout.write('{0} entrées indexées en {1:.2f}s, ~{2} Mo'.format(
+            report['entries'], build, report['memory_mb']))
+
+        for length in range(1, 9):
+            durations = []
+            for _ in range(options['queries']):
+                title, isbn = self.random.choice(titles)
+                prefix = (title if self.random.random() < 0.8 else isbn)[:length]
+                started = time.perf_counter()
+                index.lookup(prefix, 10, {BOOK, ISBN})
+                durations.append(time.perf_counter() - started)
+            report['lookups'][length] = summary = summarize(durations)
+            self.stdout.write('préfixe de {0}: p50 {1} ms, p95 {2} ms, p99 {3} ms'.format(
+                length, summary['p50_ms'], summary['p95_ms'], summary['p99_ms']))
+
+        durations = []
+        for _ in range(options['updates']):
+            pk = self.random.randrange(1, options['titles'] + 1)
+            title, isbn = self.title(pk)
+            started = time.perf_counter()
+            index.replace((BOOK, ISBN), pk, book_entries(pk, title, isbn, self.random.randrange(10)))
+            durations.append(time.perf_counter() - started)
+        report['updates'] = summarize(durations)
+        self.stdout.write('mise à jour: p50 {p50_ms} ms, p95 {p95_ms} ms, p99 {p99_ms} ms'.format(
+            **report['updates']))
+
+        if options['output']:
+            write_report(report, options['output'])
+
+    def title(self, number):
+        words = ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(1, 4)))
+        return '{0} {1}'.format(words.capitalize(), number), '978{0:010d}'.format(number)
+
+    def memory(self, index):
+        """Rough size of the index: arrays, lists and their strings, the entries dict excluded."""
+        size = sum(sys.getsizeof(values) for values in (index.keys, index.labels, index.refs, index.ranks))
+        return size + sum(sys.getsizeof(key) for key in index.keys) + sum(
+            sys.getsizeof(label) for label in set(index.labels))
@@ -0,0 +1,166 @@
+import asyncio
+import concurrent.futures
+import io
+import time
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from catalog.benchmark import summarize, write_report
+from catalog.models import Author, Book
+from catalog.urls_async import ASYNC_VIEWS
+
+# Cache used unless --cache is given, so that every request reaches the database.
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit des pages en lecture du catalogue servies en WSGI (vues synchrones, "
+            "pool de threads) et en ASGI (vues asynchrones), avec une latence simulée sur chaque "
+            "requête SQL, sur la base courante, par exemple après seed_benchmark.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requêtes mesurées par route et par serveur.")
+        parser.add_argument('--latency', type=float, default=50, help="Latence ajoutée à chaque requête SQL, en ms.")
+        parser.add_argument('--workers', type=int, default=4, help="Threads du serveur WSGI.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Connexions simultanées des clients.")
+        parser.add_argument('--routes', nargs='*', help="Noms des routes à mesurer, toutes par défaut.")
+        parser.add_argument('--cache', action='store_true', help="Garde le cache configuré au lieu de le désactiver.")
+        parser.add_argument('--output', help="Fichier JSON où enregistrer les résultats.")
+        parser.add_argument('--host', default='localhost', help="Nom d'hôte des requêtes, accepté par ALLOWED_HOSTS.")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers doit être positif.')
+        book = Book.objects.order_by('pk').first()
+        author = Author.objects.filter(book__isnull=False).order_by('pk').first()
+        if book is None or author is None:
+            raise CommandError('Catalogue vide: lancez seed_benchmark auparavant.')
+
+        arguments = {'index': [], 'books': [], 'book-detail': [book.pk], 'authors': [], 'author-detail': [author.pk]}
+        names = list(ASYNC_VIEWS)
+        if options['routes']:
+            unknown = set(options['routes']) - set(names)
+            if unknown:
+                raise CommandError('Routes inconnues: {0}'.format(', '.join(sorted(unknown))))
+            names = [name for name in names if name in options['routes']]
+
+        latency = options['latency'] / 1000
+
+        def slow_database(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        # Every connection the servers open goes through this hook: WSGI workers
+        # keep theirs between requests (CONN_MAX_AGE), ASGI opens one per request.
+        def add_latency(sender, connection, **kwargs):
+            if slow_database not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_database)
+
+        report = {
+            'requests': options['requests'],
+            'latency_ms': options['latency'],
+            'workers': options['workers'],
+            'concurrency': options['concurrency'],
+            'cache': options['cache'],
+            'routes': {},
+        }
+        caches = {} if options['cache'] else {'CACHES': NO_CACHE}
+        connection_created.connect(add_latency)
+        try:
+            with override_settings(**caches):
+                for name in names:
+                    with override_settings(ROOT_URLCONF='djanbrary.urls'):
+                        url = reverse(name, args=arguments[name])
+                        wsgi = self.run_wsgi(url, options)
+                    with override_settings(ROOT_URLCONF='djanbrary.urls_async'):
+                        asgi = asyncio.run(self.run_asgi(url, options))
+                    report['routes'][name] = {'url': url, 'wsgi': wsgi, 'asgi': asgi}
+                    self.stdout.write('{0:<14} WSGI {1[status]} {1[throughput_rps]:.1f} req/s p95={1[p95_ms]:.1f}ms  '
+                                      'ASGI {2[status]} {2[throughput_rps]:.1f} req/s p95={2[p95_ms]:.1f}ms'.format(
+                                          name, wsgi, asgi))
+        finally:
+            connection_created.disconnect(add_latency)
+
+        if options['output']:
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS('Résultats enregistrés dans {0}'.format(options['output'])))
+
+    def run_wsgi(self, url, options):
+        """Serve `requests` requests from a pool of `workers` threads, as a threaded WSGI server does."""
+        handler = WSGIHandler()
+        path, _, query = url.partition('?')
+
+        def request():
+            environ = {
+                'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': path, 'QUERY_STRING': query,
+                'SERVER_NAME': options['host'], 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': options['host'], 'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': io.StringIO(),
+            }
+            status = []
+            started = time.perf_counter()
+            response = handler(environ, lambda line, headers: status.append(int(line.split()[0])))
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+            return status[0], time.perf_counter() - started
+
+        def serve(count):
+            # The connections a worker opens belong to its thread: close them before the thread ends.
+            try:
+                return [request() for _ in range(count)]
+            finally:
+                connections.close_all()
+
+        workers = options['workers']
+        shares = [options['requests'] // workers + (number < options['requests'] % workers) for number in range(workers)]
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            results = [result for share in pool.map(serve, shares) for result in share]
+        return self.result(results, time.perf_counter() - started)
+
+    async def run_asgi(self, url, options):
+        """Serve `requests` requests on one event loop, `concurrency` at a time, as an ASGI server does."""
+        handler = ASGIHandler()
+        path, _, query = url.partition('?')
+        slots = asyncio.Semaphore(options['concurrency'])
+
+        async def request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'query_string': query.encode(), 'root_path': '',
+                'headers': [(b'host', options['host'].encode())],
+                'client': ('127.0.0.1', 0), 'server': (options['host'], 80),
+            }
+            status = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with slots:
+                started = time.perf_counter()
+                await handler(scope, receive, send)
+                return status[0], time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(request() for _ in range(options['requests'])))
+        return self.result(results, time.perf_counter() - started)
+
+    def result(self, results, elapsed):
+        statuses = {status for status, _ in results}
+        result = summarize([duration for _, duration in results])
+        result.update(status=statuses.pop() if len(statuses) == 1 else sorted(statuses),
+                      throughput_rps=round(len(results) / elapsed, 1))
+        return result
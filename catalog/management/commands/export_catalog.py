@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from catalog.exports import DATASETS, FORMATS, iter_lines
+
+
+class Command(BaseCommand):
+    help = "Exporte les livres, les auteurs ou les exemplaires en CSV ou JSONL, par blocs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', default='-', help="Fichier de sortie, '-' pour la sortie standard.")
+
+    def handle(self, *args, **options):
+        lines = iter_lines(options['dataset'], options['format'])
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+                stream.writelines(lines)
@@ -0,0 +1,203 @@
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.isbn import canonical
+from catalog.models import Author, Book, BookAvailability, Category, CatalogCounters, CategoryFacet, YearFacet, current_year
+
+# Records carry isbn, title, year, content, author_first_name, author_last_name,
+# categories, imprint and copies (the number of copies to create). `categories`
+# is a list in JSONL and a '|' separated string in CSV. Records whose year or
+# number of copies is not an integer are reported with their line number and
+# skipped.
+
+
+def record_author(record):
+    return ((record.get('author_first_name') or '').strip(), (record.get('author_last_name') or '').strip())
+
+
+def record_categories(record):
+    names = record.get('categories') or []
+    if isinstance(names, str):
+        names = names.split('|')
+    return [name.strip() for name in names if name.strip()]
+
+
+def record_number(record, name, default, minimum=None):
+    value = record.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('{0} invalide: {1!r}'.format(name, value))
+    if minimum is not None and number < minimum:
+        raise ValueError('{0} invalide: {1!r}'.format(name, value))
+    return number
+
+
+def clean_record(record):
+    """Copy of `record` with an integer year and number of copies, ValueError if it is invalid."""
+    if not isinstance(record, dict):
+        raise ValueError('objet attendu: {0!r}'.format(record))
+    return dict(record, year=record_number(record, 'year', current_year()),
+                copies=record_number(record, 'copies', 0, minimum=0))
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_jsonl(stream):
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as error:
+            raise CommandError('Ligne {0} invalide: {1}'.format(line_number, error))
+
+
+class Command(BaseCommand):
+    help = ("Importe des livres, auteurs, catégories et exemplaires depuis un fichier CSV ou JSONL, "
+            "par lots, en ignorant les ISBN déjà présents.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier à importer, ou '-' pour l'entrée standard.")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help="Format du fichier, déduit de l'extension par défaut.")
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Nombre de livres insérés par transaction.")
+        parser.add_argument('--status', default='a', choices=[code for code, _ in BookAvailability.LOAN_STATUS],
+                            help="Statut des exemplaires créés.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size doit être positif.')
+        self.status = options['status']
+
+        if path != '-' and not os.path.exists(path):
+            raise CommandError('Fichier introuvable: {0}'.format(path))
+
+        # Lookup maps for the small dimension tables; books are deduplicated per batch against the database.
+        self.authors = {}
+        for author_id, first_name, last_name in Author.objects.values_list('id', 'first_name', 'last_name').order_by('-id'):
+            self.authors[(first_name, last_name)] = author_id
+        self.categories = {name: category_id for category_id, name in Category.objects.values_list('id', 'name').order_by('-id')}
+
+        self.totals = dict.fromkeys(('read', 'books', 'skipped', 'invalid', 'authors', 'categories', 'copies'), 0)
+        started = time.monotonic()
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            records = read_jsonl(stream) if file_format == 'jsonl' else read_csv(stream)
+            while True:
+                batch = list(itertools.islice(records, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch)
+                if options['verbosity'] > 1:
+                    self.report(started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        CategoryFacet.rebuild()
+        YearFacet.rebuild()
+        self.report(started, style=self.style.SUCCESS)
+
+    def report(self, started, style=None):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        message = ('{read} lignes lues, {books} livres créés, {skipped} ignorés, {invalid} invalides, '
+                   '{authors} auteurs, {categories} catégories, {copies} exemplaires').format(**self.totals)
+        message += ' en {0:.1f}s ({1:.0f} livres/s)'.format(elapsed, self.totals['books'] / elapsed)
+        self.stdout.write(style(message) if style else message)
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        self.totals['read'] += len(batch)
+
+        records = {}
+        for line_number, record in batch:
+            try:
+                record = clean_record(record)
+            except ValueError as error:
+                self.stderr.write('Ligne {0} ignorée: {1}'.format(line_number, error))
+                self.totals['invalid'] += 1
+                continue
+            # The canonical ISBN-13, so that a book is found whatever the form of its ISBN.
+            isbn = canonical(str(record.get('isbn') or '').strip())
+            if not isbn or isbn in records:
+                self.totals['skipped'] += 1
+                continue
+            records[isbn] = record
+        existing = set(Book.objects.filter(isbn__in=list(records)).values_list('isbn', flat=True))
+        for isbn in existing:
+            del records[isbn]
+        self.totals['skipped'] += len(existing)
+        if not records:
+            return
+
+        new_authors = {}
+        new_categories = {}
+        for record in records.values():
+            key = record_author(record)
+            if any(key) and key not in self.authors:
+                new_authors[key] = Author(first_name=key[0], last_name=key[1])
+            for name in record_categories(record):
+                if name not in self.categories:
+                    new_categories[name] = Category(name=name)
+        for key, author in zip(new_authors, Author.objects.bulk_create(new_authors.values())):
+            self.authors[key] = author.id
+        for name, category in zip(new_categories, Category.objects.bulk_create(new_categories.values())):
+            self.categories[name] = category.id
+
+        books = []
+        for isbn, record in records.items():
+            key = record_author(record)
+            books.append(Book(
+                isbn=isbn,
+                title=record.get('title') or '',
+                year=record['year'],
+                content=record.get('content') or '',
+                author_id=self.authors.get(key) if any(key) else None,
+                # bulk_create sends no signals, so the copy counters are set here.
+                total_copies=record['copies'],
+                available_copies=record['copies'] if self.status == 'a' else 0,
+            ))
+        books = Book.objects.bulk_create(books)
+
+        links = []
+        copies = []
+        BookCategory = Book.category.through
+        for book, record in zip(books, records.values()):
+            for category_id in {self.categories[name] for name in record_categories(record)}:
+                links.append(BookCategory(book_id=book.id, category_id=category_id))
+            for _ in range(record['copies']):
+                copies.append(BookAvailability(book_id=book.id, imprint=record.get('imprint') or '', status=self.status))
+        BookCategory.objects.bulk_create(links)
+        BookAvailability.objects.bulk_create(copies)
+
+        # bulk_create sends no signals, so the index counters are adjusted here.
+        CatalogCounters.increment(
+            num_books=len(books),
+            num_authors=len(new_authors),
+            num_availabilities=len(copies),
+            num_availabilities_open=len(copies) if self.status == 'a' else 0,
+        )
+
+        self.totals['books'] += len(books)
+        self.totals['authors'] += len(new_authors)
+        self.totals['categories'] += len(new_categories)
+        self.totals['copies'] += len(copies)
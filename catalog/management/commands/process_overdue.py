@@ -0,0 +1,114 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from catalog.models import BookAvailability
+
+
+class Command(BaseCommand):
+    help = ("Envoie un rappel groupé par emprunteur pour les emprunts en retard ou à rendre bientôt. "
+            "Les exemplaires déjà relancés aujourd'hui sont ignorés, la commande peut donc être relancée "
+            "après une interruption.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=3,
+                            help="Relance aussi les emprunts à rendre dans ce nombre de jours.")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Utilisateurs dont les emprunts sont lus puis relancés à la fois.")
+        parser.add_argument('--dry-run', action='store_true', help="Compte les rappels sans les envoyer.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size doit être positif.')
+        today = datetime.date.today()
+        started = time.monotonic()
+
+        rows = borrowers = sent = skipped = 0
+        connection = None if options['dry_run'] else get_connection()
+        if connection is not None:
+            connection.open()
+        try:
+            for batch in self.batches(today, today + datetime.timedelta(days=options['days']), options['batch_size']):
+                rows += sum(len(items) for items in batch.values())
+                borrowers += len(batch)
+                if connection is not None:
+                    batch_sent, batch_skipped = self.remind(batch, today, connection)
+                    sent += batch_sent
+                    skipped += batch_skipped
+        finally:
+            if connection is not None:
+                connection.close()
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            '{0} emprunts, {1} emprunteurs, {2} rappels envoyés, {3} sans adresse, '
+            'en {4:.2f}s ({5:.0f} lignes/s)'.format(rows, borrowers, sent, skipped, elapsed, rows / elapsed)))
+
+    def batches(self, today, limit, batch_size):
+        """
+        Yield the loans due before `limit` and not reminded today, grouped per
+        borrower, for `batch_size` users at a time. Users are read in primary
+        key order and the loans of each batch through the (borrower, status,
+        due_back, id) index, so that memory use does not grow with the number
+        of loans and each batch is reminded, and marked, before the next one is
+        read.
+        """
+        loans = (BookAvailability.objects
+                 .filter(status__exact='o', due_back__lte=limit)
+                 .filter(Q(reminded_on__isnull=True) | Q(reminded_on__lt=today))
+                 .order_by('borrower_id', 'due_back', 'id')
+                 .values_list('borrower_id', 'due_back', 'id', 'book__title'))
+        users = User.objects.order_by('pk').values_list('pk', flat=True)
+        last = None
+        while True:
+            pks = list((users if last is None else users.filter(pk__gt=last))[:batch_size])
+            if not pks:
+                return
+            batch = {}
+            for borrower_id, due_back, pk, title in loans.filter(borrower_id__in=pks):
+                batch.setdefault(borrower_id, []).append((pk, title, due_back))
+            if batch:
+                yield batch
+            last = pks[-1]
+
+    def remind(self, loans, today, connection):
+        users = User.objects.filter(pk__in=list(loans)).values_list('pk', 'email', 'username')
+        messages = []
+        skipped = 0
+        for pk, email, username in users:
+            if not email:
+                skipped += 1
+                continue
+            messages.append((self.message(username, email, loans[pk], today, connection),
+                             [loan_id for loan_id, _, _ in loans[pk]]))
+
+        # Sent outside any transaction, so that the database is not locked during
+        # the SMTP exchange. Only the loans of the messages actually sent are
+        # marked, even if a later one fails: the next run reminds the others.
+        reminded = []
+        try:
+            for message, loan_ids in messages:
+                if connection.send_messages([message]):
+                    reminded.extend(loan_ids)
+        finally:
+            BookAvailability.objects.filter(pk__in=reminded).update(reminded_on=today)
+        return len(messages), skipped
+
+    def message(self, username, email, loans, today, connection):
+        lines = ['Bonjour {0},'.format(username), '']
+        for _, title, due_back in sorted(loans, key=lambda loan: loan[2]):
+            state = 'en retard' if due_back < today else 'à rendre'
+            lines.append('- {0} : {1} le {2:%d/%m/%Y}'.format(title, state, due_back))
+        lines += ['', 'Merci de rapporter ces livres à la bibliothèque.']
+        return EmailMessage(
+            subject='Rappel : {0} livre(s) à rendre'.format(len(loans)),
+            body='\n'.join(lines),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email],
+            connection=connection,
+        )
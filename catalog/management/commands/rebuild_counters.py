@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import CatalogCounters
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de la page d'accueil à partir des tables du catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Affiche les écarts sans modifier les compteurs.")
+
+    def handle(self, *args, **options):
+        expected = CatalogCounters.compute()
+        current = CatalogCounters.objects.filter(pk=CatalogCounters.SINGLETON_ID).values().first() or {}
+
+        drift = {name: (current.get(name), value) for name, value in expected.items() if current.get(name) != value}
+        for name, (stored, value) in drift.items():
+            self.stdout.write('{0}: {1} -> {2}'.format(name, stored, value))
+
+        if options['check']:
+            if drift:
+                self.stdout.write(self.style.WARNING('{0} compteur(s) à corriger.'.format(len(drift))))
+            else:
+                self.stdout.write(self.style.SUCCESS('Compteurs à jour.'))
+            return
+
+        CatalogCounters.rebuild()
+        self.stdout.write(self.style.SUCCESS('Compteurs recalculés.'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.caching import touch
+from catalog.models import Author, Book
+
+
+class Command(BaseCommand):
+    help = ("Recalcule le nombre d'exemplaires et d'exemplaires disponibles des livres dont les compteurs "
+            "ne correspondent plus à leurs exemplaires.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Affiche les écarts sans modifier les compteurs.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Livres vérifiés par requête.")
+
+    def handle(self, *args, **options):
+        drifting = 0
+        last = 0
+        while True:
+            ids = list(Book.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            chunk = Book.objects.filter(pk__gt=last, pk__lte=ids[-1])
+            last = ids[-1]
+
+            drift = list(Book.copy_counter_drift(chunk).values_list(
+                'pk', 'total_copies', 'actual_total', 'available_copies', 'actual_available'))
+            for pk, total, actual_total, available, actual_available in drift:
+                self.stdout.write('{0}: {1}/{2} -> {3}/{4}'.format(pk, available, total, actual_available, actual_total))
+            drifting += len(drift)
+
+            if drift and not options['check']:
+                pks = [row[0] for row in drift]
+                with transaction.atomic():
+                    Book.recount_copies(Book.objects.filter(pk__in=pks))
+                    touch(Book, pks)
+                    touch(Author, Book.objects.filter(pk__in=pks).values_list('author_id', flat=True))
+
+        if not drifting:
+            self.stdout.write(self.style.SUCCESS("Compteurs d'exemplaires à jour."))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING('{0} livre(s) à corriger.'.format(drifting)))
+        else:
+            self.stdout.write(self.style.SUCCESS('{0} livre(s) corrigé(s).'.format(drifting)))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import CategoryFacet, YearFacet
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les compteurs des filtres de la liste des livres (catégories, années, disponibilité). "
+            "À lancer périodiquement, par exemple toutes les heures.")
+
+    def handle(self, *args, **options):
+        for model in (CategoryFacet, YearFacet):
+            model.rebuild()
+        self.stdout.write(self.style.SUCCESS('Compteurs des filtres recalculés.'))
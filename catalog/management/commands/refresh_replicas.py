@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ("Copie la base principale SQLite dans les réplicas SQLite, pour essayer localement la "
+            "répartition des lectures (DJANGO_REPLICAS). Les autres moteurs ont leur propre réplication.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*', help="Alias des réplicas, ceux de CATALOG_REPLICAS par défaut.")
+
+    def handle(self, *args, **options):
+        aliases = options['replicas'] or settings.CATALOG_REPLICAS
+        if not aliases:
+            raise CommandError('Aucun réplica: indiquez un alias ou définissez DJANGO_REPLICAS.')
+
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in connections or alias == DEFAULT_DB_ALIAS:
+                raise CommandError('Réplica inconnu: {0}'.format(alias))
+            replica = connections[alias]
+            if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError('{0} n\'est pas une base SQLite.'.format(alias))
+            primary.ensure_connection()
+            replica.ensure_connection()
+            # SQLite online backup: a consistent snapshot, even while the primary is written.
+            primary.connection.backup(replica.connection)
+            self.stdout.write(self.style.SUCCESS('{0} mis à jour'.format(alias)))
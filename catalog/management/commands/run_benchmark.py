@@ -0,0 +1,147 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import urls
+from catalog.benchmark import summarize, write_report
+from catalog.models import Author, Book, BookAvailability, CatalogCounters
+
+
+class Command(BaseCommand):
+    help = ("Mesure la latence (p50/p95/p99) et le nombre de requêtes SQL de chaque route du catalogue "
+            "sur la base courante, par exemple après seed_benchmark.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Requêtes mesurées par route.")
+        parser.add_argument('--warmup', type=int, default=3, help="Requêtes non mesurées par route.")
+        parser.add_argument('--routes', nargs='*', help="Noms des routes à mesurer, toutes par défaut.")
+        parser.add_argument('--cold-cache', action='store_true', help="Vide le cache avant chaque requête.")
+        parser.add_argument('--output', help="Fichier JSON où enregistrer les résultats.")
+        parser.add_argument('--host', default='localhost', help="Nom d'hôte des requêtes, accepté par ALLOWED_HOSTS.")
+
+    def handle(self, *args, **options):
+        book = Book.objects.order_by('pk').first()
+        author = Author.objects.filter(book__isnull=False).order_by('pk').first()
+        loan = BookAvailability.objects.filter(status__exact='o').order_by('pk').first()
+        if book is None or author is None or loan is None:
+            raise CommandError('Catalogue vide: lancez seed_benchmark auparavant.')
+
+        # Route name -> (url arguments, GET parameters, account), for the routes in catalog.urls,
+        # or None for routes deliberately left out.
+        plans = {
+            'index': ([], {}, None),
+            'books': ([], {}, None),
+            'book-detail': ([book.pk], {}, None),
+            'book-search': ([], {'q': book.title.split()[0]}, None),
+            'authors': ([], {}, None),
+            'author-detail': ([author.pk], {}, None),
+            'my-borrowed': ([], {}, 'bench_reader'),
+            'my-holds': ([], {}, 'bench_reader'),
+            'all-borrowed': ([], {}, 'bench_librarian'),
+            'renew-book-librarian': ([loan.pk], {}, 'bench_librarian'),
+            # POST only and state changing: not measured.
+            'checkout-book': None,
+            'reserve-book': None,
+            'return-book': None,
+            'all-borrowed-bulk': None,
+            'place-hold': None,
+            'cancel-hold': None,
+            'catalog-export': (['authors', 'csv'], {}, 'bench_librarian'),
+            'timing-stats': ([], {}, 'bench_librarian'),
+            'timing-stats-json': ([], {}, 'bench_librarian'),
+            'author-create': ([], {}, 'bench_librarian'),
+            'author-update': ([author.pk], {}, 'bench_librarian'),
+            'author-delete': ([author.pk], {}, 'bench_librarian'),
+            'book-create': ([], {}, 'bench_librarian'),
+            'book-update': ([book.pk], {}, 'bench_librarian'),
+            'book-delete': ([book.pk], {}, 'bench_librarian'),
+            'api-books': ([], {'fields': 'id,title,isbn'}, None),
+            'api-book-detail': ([book.pk], {}, None),
+            'api-books-isbn': ([], {'isbn': book.isbn}, None),
+            'api-authors': ([], {}, None),
+            'api-author-detail': ([author.pk], {}, None),
+            'api-categories': ([], {}, None),
+            'api-copies': ([], {'book': book.pk}, None),
+            'api-suggest': ([], {'q': book.title[:3]}, None),
+        }
+
+        names = [pattern.name for pattern in urls.urlpatterns if pattern.name]
+        if options['routes']:
+            unknown = set(options['routes']) - set(names)
+            if unknown:
+                raise CommandError('Routes inconnues: {0}'.format(', '.join(sorted(unknown))))
+            names = [name for name in names if name in options['routes']]
+
+        report = {
+            'iterations': options['iterations'],
+            'cold_cache': options['cold_cache'],
+            'dataset': {name: getattr(CatalogCounters.load(), name)
+                        for name in ('num_books', 'num_availabilities', 'num_availabilities_open', 'num_authors')},
+            'routes': {},
+            'skipped': [],
+            'excluded': [],
+        }
+        clients = {}
+        for name in names:
+            if name not in plans:
+                report['skipped'].append(name)
+                continue
+            if plans[name] is None:
+                report['excluded'].append(name)
+                continue
+            args, params, username = plans[name]
+            if username not in clients:
+                clients[username] = self.client_for(username, options['host'])
+            result = self.measure(clients[username], name, args, params, options)
+            report['routes'][name] = result
+            self.stdout.write('{0:<22} {1} p50={p50_ms:.2f}ms p95={p95_ms:.2f}ms p99={p99_ms:.2f}ms '
+                              'queries={queries}'.format(name, result['status'], **result))
+
+        if report['skipped']:
+            self.stdout.write(self.style.WARNING('Routes sans scénario: {0}'.format(', '.join(report['skipped']))))
+        if options['output']:
+            write_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS('Résultats enregistrés dans {0}'.format(options['output'])))
+
+    def client_for(self, username, host):
+        client = Client(SERVER_NAME=host)
+        if username is not None:
+            try:
+                client.force_login(User.objects.get(username=username))
+            except User.DoesNotExist:
+                raise CommandError("Compte {0} introuvable: lancez seed_benchmark.".format(username))
+        return client
+
+    def measure(self, client, name, args, params, options):
+        url = reverse(name, args=args)
+        for _ in range(options['warmup']):
+            self.get(client, url, params)
+
+        durations = []
+        queries = []
+        status = None
+        for _ in range(options['iterations']):
+            if options['cold_cache']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                status = self.get(client, url, params)
+                durations.append(time.perf_counter() - started)
+            queries.append(len(context.captured_queries))
+
+        result = summarize(durations)
+        result.update(url=url, status=status, queries=max(queries))
+        return result
+
+    def get(self, client, url, params):
+        response = client.get(url, params)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
@@ -0,0 +1,135 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.models import Author, Book, BookAvailability, Category, CatalogCounters, CategoryFacet, YearFacet
+
+WORDS = ('ombre', 'sorceleur', 'anneau', 'royaume', 'mer', 'dragon', 'étoile', 'nuit', 'jardin', 'voyage',
+         'guerre', 'paix', 'silence', 'feu', 'glace', 'ville', 'forêt', 'mémoire', 'empire', 'rivière',
+         'lumière', 'secret', 'hiver', 'été', 'chemin', 'miroir', 'tempête', 'cendre', 'loup', 'couronne')
+FIRST_NAMES = ('Andrzej', 'Marguerite', 'Victor', 'Ursula', 'Jules', 'Agatha', 'Albert', 'Simone',
+               'Terry', 'Annie', 'Émile', 'George', 'Isaac', 'Octavia', 'Honoré', 'Colette')
+LAST_NAMES = ('Sapkowski', 'Duras', 'Hugo', 'Le Guin', 'Verne', 'Christie', 'Camus', 'de Beauvoir',
+              'Pratchett', 'Ernaux', 'Zola', 'Sand', 'Asimov', 'Butler', 'Balzac', 'Proust')
+CATEGORIES = ('Fantastique', 'Science-fiction', 'Policier', 'Roman', 'Poésie', 'Théâtre', 'Histoire',
+              'Biographie', 'Jeunesse', 'Bande dessinée', 'Essai', 'Voyage', 'Cuisine', 'Sciences')
+IMPRINTS = ('Gallimard', 'Flammarion', 'Le Livre de Poche', 'Pocket', 'Folio', 'Bragelonne', 'Actes Sud')
+
+# Password of the bench_librarian and bench_reader accounts used by run_benchmark.
+BENCH_PASSWORD = 'bench'
+
+
+class Command(BaseCommand):
+    help = ("Génère un catalogue synthétique (auteurs, livres, catégories, exemplaires, utilisateurs, "
+            "emprunts) pour les mesures de performance.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--authors', type=int, help="Par défaut un auteur pour dix livres.")
+        parser.add_argument('--users', type=int, help="Par défaut un utilisateur pour vingt livres.")
+        parser.add_argument('--max-copies', type=int, default=5, help="Nombre maximum d'exemplaires par livre.")
+        parser.add_argument('--loan-ratio', type=float, default=0.3, help="Part des exemplaires empruntés.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help="Graine aléatoire, pour des jeux reproductibles.")
+
+    def handle(self, *args, **options):
+        if Book.objects.filter(isbn__startswith='BENCH').exists():
+            raise CommandError('Un jeu de données de benchmark est déjà présent.')
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        num_books = options['books']
+        num_authors = max(1, options['authors'] or num_books // 10)
+        num_users = max(2, options['users'] or num_books // 20)
+        started = time.monotonic()
+
+        with transaction.atomic():
+            categories = Category.objects.bulk_create(Category(name=name) for name in CATEGORIES)
+            author_ids = self.create_authors(num_authors)
+            user_ids = self.create_users(num_users)
+            self.create_books(num_books, author_ids, categories, user_ids,
+                              options['max_copies'], options['loan_ratio'])
+            # bulk_create sends no signals: counters are computed once at the end.
+            Book.recount_copies()
+            CatalogCounters.rebuild()
+            CategoryFacet.rebuild()
+            YearFacet.rebuild()
+
+        self.stdout.write(self.style.SUCCESS('{0} livres, {1} auteurs, {2} utilisateurs créés en {3:.1f}s'.format(
+            num_books, num_authors, num_users, time.monotonic() - started)))
+
+    def bulk_create(self, model, objects):
+        created = []
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                created.extend(model.objects.bulk_create(batch))
+                batch = []
+        created.extend(model.objects.bulk_create(batch))
+        return created
+
+    def create_authors(self, count):
+        authors = self.bulk_create(Author, (
+            Author(first_name=self.random.choice(FIRST_NAMES),
+                   last_name='{0} {1}'.format(self.random.choice(LAST_NAMES), author_id),
+                   biography=self.sentence(20))
+            for author_id in range(count)))
+        return [author.id for author in authors]
+
+    def create_users(self, count):
+        password = make_password(BENCH_PASSWORD)
+        librarian = User.objects.create(username='bench_librarian', password=password, is_staff=True)
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        reader = User.objects.create(username='bench_reader', password=password)
+        # Other users can't log in; they only borrow books.
+        users = self.bulk_create(User, (
+            User(username='bench_user_{0}'.format(user_id), password='!')
+            for user_id in range(count - 2)))
+        return [librarian.id, reader.id] + [user.id for user in users]
+
+    def sentence(self, length):
+        return ' '.join(self.random.choice(WORDS) for _ in range(length)).capitalize()
+
+    def create_books(self, count, author_ids, categories, user_ids, max_copies, loan_ratio):
+        BookCategory = Book.category.through
+        today = datetime.date.today()
+        # Few authors write most books, and a few categories hold most books.
+        author_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(author_ids))))
+        category_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(categories))))
+
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            authors = self.random.choices(author_ids, cum_weights=author_weights, k=size)
+            books = Book.objects.bulk_create(
+                Book(title=self.sentence(self.random.randint(1, 5)),
+                     author_id=author_id,
+                     year=self.random.randint(1850, today.year),
+                     content=self.sentence(40),
+                     isbn='BENCH{0:08d}'.format(start + offset))
+                for offset, author_id in enumerate(authors))
+
+            links = []
+            copies = []
+            for book in books:
+                picked = set(self.random.choices(categories, cum_weights=category_weights, k=self.random.randint(1, 3)))
+                links.extend(BookCategory(book_id=book.id, category_id=category.id) for category in picked)
+                for _ in range(min(max_copies, int(self.random.expovariate(0.7)) + 1)):
+                    copy = BookAvailability(book_id=book.id, imprint=self.random.choice(IMPRINTS), status='a')
+                    draw = self.random.random()
+                    if draw < loan_ratio:
+                        copy.status = 'o'
+                        copy.borrower_id = self.random.choice(user_ids)
+                        # Some loans are already overdue.
+                        copy.due_back = today + datetime.timedelta(days=self.random.randint(-10, 28))
+                    elif draw < loan_ratio + 0.05:
+                        copy.status = self.random.choice('dr')
+                    copies.append(copy)
+            BookCategory.objects.bulk_create(links)
+            BookAvailability.objects.bulk_create(copies)
@@ -0,0 +1,106 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from catalog import timing, urls
+from catalog.routers import pin_primary, use_primary
+
+PIN_COOKIE = 'catalog_primary'
+
+
+class PrimaryPinningMiddleware:
+    """
+    Keep a client on the primary database while the replicas may lag behind
+    its own writes: during unsafe requests, for CATALOG_PRIMARY_PIN_SECONDS
+    after them (the redirect following a checkout, an admin save...), and on
+    views flagged with `reads_primary` and the admin, which show what was
+    just written.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Django would run a sync process_view in a thread for async requests.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with use_primary(self.pins(request)):
+            response = self.get_response(request)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        with use_primary(self.pins(request)):
+            response = await self.get_response(request)
+        return self.finish(request, response)
+
+    def pins(self, request):
+        return self.unsafe(request) or PIN_COOKIE in request.COOKIES
+
+    def unsafe(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def finish(self, request, response):
+        if self.unsafe(request) and settings.CATALOG_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.CATALOG_PRIMARY_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if getattr(view, 'reads_primary', False) or request.resolver_match.app_name == 'admin':
+            pin_primary()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        PrimaryPinningMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+
+class TimingMiddleware:
+    """
+    Measure the SQL queries, template rendering and total time of each
+    request, send them in a Server-Timing header when CATALOG_SERVER_TIMING is
+    set, and add them to the statistics of the route (catalog.timing.stats)
+    for the routes of catalog.urls. First in MIDDLEWARE, so that the total
+    covers the other middlewares; the body of streaming responses is not
+    included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.routes = {pattern.name for pattern in urls.urlpatterns if pattern.name}
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        measures, token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, measures)
+
+    async def __acall__(self, request):
+        measures, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, response, measures)
+
+    def finish(self, request, response, measures):
+        total = measures.elapsed()
+        match = request.resolver_match
+        if match is not None and not match.namespaces and match.url_name in self.routes:
+            timing.stats.add(match.url_name, measures, total)
+        if settings.CATALOG_SERVER_TIMING:
+            response['Server-Timing'] = measures.header(total)
+        return response
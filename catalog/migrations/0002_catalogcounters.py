@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def build_counters(apps, schema_editor):
+    CatalogCounters = apps.get_model('catalog', 'CatalogCounters')
+    Book = apps.get_model('catalog', 'Book')
+    BookAvailability = apps.get_model('catalog', 'BookAvailability')
+    Author = apps.get_model('catalog', 'Author')
+    CatalogCounters.objects.update_or_create(pk=1, defaults={
+        'num_books': Book.objects.count(),
+        'num_availabilities': BookAvailability.objects.count(),
+        'num_availabilities_open': BookAvailability.objects.filter(status__exact='a').count(),
+        'num_authors': Author.objects.count(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_books', models.BigIntegerField(default=0)),
+                ('num_availabilities', models.BigIntegerField(default=0)),
+                ('num_availabilities_open', models.BigIntegerField(default=0)),
+                ('num_authors', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
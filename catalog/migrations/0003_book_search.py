@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# FTS5 index over books and their author, kept in sync by triggers so bulk
+# inserts and queryset updates are indexed too. SQLite only.
+
+AUTHOR_NAME = "(SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id)"
+
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE catalog_book_fts USING fts5(
+        title, content, isbn, author, tokenize = 'unicode61 remove_diacritics 2')""",
+    """INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        SELECT b.id, b.title, b.content, b.isbn, a.first_name || ' ' || a.last_name
+        FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id""",
+    """CREATE TRIGGER catalog_book_fts_insert AFTER INSERT ON catalog_book BEGIN
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    """CREATE TRIGGER catalog_book_fts_update AFTER UPDATE OF title, content, isbn, author_id ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    """CREATE TRIGGER catalog_book_fts_delete AFTER DELETE ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER catalog_author_fts_update AFTER UPDATE OF first_name, last_name ON catalog_author BEGIN
+        UPDATE catalog_book_fts SET author = new.first_name || ' ' || new.last_name
+        WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = new.id);
+    END""",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS catalog_author_fts_update",
+    "DROP TRIGGER IF EXISTS catalog_book_fts_delete",
+    "DROP TRIGGER IF EXISTS catalog_book_fts_update",
+    "DROP TRIGGER IF EXISTS catalog_book_fts_insert",
+    "DROP TABLE IF EXISTS catalog_book_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_catalogcounters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
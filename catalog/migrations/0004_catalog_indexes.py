@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_book_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='book_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookavailability',
+            index=models.Index(fields=['status', 'due_back', 'id'], name='availability_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookavailability',
+            index=models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='availability_borrower_due_idx'),
+        ),
+    ]
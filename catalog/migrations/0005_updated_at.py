@@ -0,0 +1,67 @@
+from django.db import migrations, models
+
+
+# The full-text search triggers of migration 0003, copied as they were. SQLite
+# rebuilds a table to alter it, which fails while these triggers reference it,
+# so they are dropped before and created again after.
+AUTHOR_NAME = "(SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id)"
+
+TRIGGERS = {
+    'catalog_book_fts_insert': """CREATE TRIGGER catalog_book_fts_insert AFTER INSERT ON catalog_book BEGIN
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    'catalog_book_fts_update': """CREATE TRIGGER catalog_book_fts_update AFTER UPDATE OF title, content, isbn, author_id ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    'catalog_book_fts_delete': """CREATE TRIGGER catalog_book_fts_delete AFTER DELETE ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+    END""",
+    'catalog_author_fts_update': """CREATE TRIGGER catalog_author_fts_update AFTER UPDATE OF first_name, last_name ON catalog_author BEGIN
+        UPDATE catalog_book_fts SET author = new.first_name || ' ' || new.last_name
+        WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = new.id);
+    END""",
+}
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS {0}'.format(name))
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in TRIGGERS.values():
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='author',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookavailability',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
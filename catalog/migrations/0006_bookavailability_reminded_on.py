@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookavailability',
+            name='reminded_on',
+            field=models.DateField(blank=True, editable=False, help_text="Date du dernier rappel envoyé à l'emprunteur", null=True),
+        ),
+    ]
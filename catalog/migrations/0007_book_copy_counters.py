@@ -0,0 +1,75 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# The full-text search triggers of migration 0003, copied as they were. SQLite
+# rebuilds a table to alter it, which fails while these triggers reference it,
+# so they are dropped before and created again after.
+AUTHOR_NAME = "(SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id)"
+
+TRIGGERS = {
+    'catalog_book_fts_insert': """CREATE TRIGGER catalog_book_fts_insert AFTER INSERT ON catalog_book BEGIN
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    'catalog_book_fts_update': """CREATE TRIGGER catalog_book_fts_update AFTER UPDATE OF title, content, isbn, author_id ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    'catalog_book_fts_delete': """CREATE TRIGGER catalog_book_fts_delete AFTER DELETE ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+    END""",
+    'catalog_author_fts_update': """CREATE TRIGGER catalog_author_fts_update AFTER UPDATE OF first_name, last_name ON catalog_author BEGIN
+        UPDATE catalog_book_fts SET author = new.first_name || ' ' || new.last_name
+        WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = new.id);
+    END""",
+}
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS {0}'.format(name))
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in TRIGGERS.values():
+        schema_editor.execute(statement)
+
+
+def count_copies(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    BookAvailability = apps.get_model('catalog', 'BookAvailability')
+    copies = BookAvailability.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.using(schema_editor.connection.alias).update(
+        total_copies=Coalesce(Subquery(copies.annotate(count=Count('pk')).values('count')), 0),
+        available_copies=Coalesce(Subquery(copies.filter(status='a').annotate(count=Count('pk')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_bookavailability_reminded_on'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='book',
+            name='available_copies',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_copies',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+        migrations.RunPython(count_copies, migrations.RunPython.noop),
+    ]
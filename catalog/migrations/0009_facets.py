@@ -0,0 +1,34 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='YearFacet',
+            fields=[
+                ('num_books', models.PositiveIntegerField(default=0)),
+                ('num_available', models.PositiveIntegerField(default=0)),
+                ('year', models.IntegerField(primary_key=True, serialize=False)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('num_books', models.PositiveIntegerField(default=0)),
+                ('num_available', models.PositiveIntegerField(default=0)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='catalog.category')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
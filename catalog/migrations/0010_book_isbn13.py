@@ -0,0 +1,76 @@
+from django.db import migrations
+
+import catalog.isbn
+
+
+# The full-text search triggers of migration 0003, copied as they were. SQLite
+# rebuilds a table to alter it, which fails while these triggers reference it,
+# so they are dropped before and created again after.
+AUTHOR_NAME = "(SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id)"
+
+TRIGGERS = {
+    'catalog_book_fts_insert': """CREATE TRIGGER catalog_book_fts_insert AFTER INSERT ON catalog_book BEGIN
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    'catalog_book_fts_update': """CREATE TRIGGER catalog_book_fts_update AFTER UPDATE OF title, content, isbn, author_id ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+        INSERT INTO catalog_book_fts(rowid, title, content, isbn, author)
+        VALUES (new.id, new.title, new.content, new.isbn, {0});
+    END""".format(AUTHOR_NAME),
+    'catalog_book_fts_delete': """CREATE TRIGGER catalog_book_fts_delete AFTER DELETE ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+    END""",
+    'catalog_author_fts_update': """CREATE TRIGGER catalog_author_fts_update AFTER UPDATE OF first_name, last_name ON catalog_author BEGIN
+        UPDATE catalog_book_fts SET author = new.first_name || ' ' || new.last_name
+        WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = new.id);
+    END""",
+}
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS {0}'.format(name))
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in TRIGGERS.values():
+        schema_editor.execute(statement)
+
+
+def normalize_isbns(apps, schema_editor):
+    """Convert the valid ISBNs to ISBN-13; invalid ones, and those a book already has in the other form, are kept."""
+    Book = apps.get_model('catalog', 'Book')
+    books = Book.objects.using(schema_editor.connection.alias)
+    taken = set(books.values_list('isbn', flat=True))
+    changed = []
+    for book in books.only('pk', 'isbn').order_by('pk').iterator():
+        isbn = catalog.isbn.canonical(book.isbn)
+        if isbn != book.isbn and isbn not in taken:
+            taken.add(isbn)
+            book.isbn = isbn
+            changed.append(book)
+    books.bulk_update(changed, ['isbn'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_facets'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=catalog.isbn.ISBNField(help_text='ISBN-10 ou ISBN-13, avec ou sans tirets', max_length=13,
+                                         unique=True, verbose_name='ISBN'),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+    ]
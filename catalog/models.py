@@ -1,9 +1,14 @@
 import uuid 
 import datetime
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.contrib.auth.models import User
 
+from .isbn import ISBNField
+
 def current_year():
     return datetime.date.today().year
 
@@ -18,8 +23,20 @@ class Book(models.Model):
     author = models.ForeignKey('Author', on_delete=models.SET_NULL, null=True)
     year = models.IntegerField('Year', default=current_year, help_text='Année de publication')
     content = models.TextField(max_length=1000, help_text='Décrivez le livre')
-    isbn = models.CharField('ISBN', max_length=13, unique=True, help_text='Maximum 13 caractères')
+    isbn = ISBNField('ISBN', unique=True, help_text='ISBN-10 ou ISBN-13, avec ou sans tirets')
     category = models.ManyToManyField(Category, help_text='Choisissez une catégorie')
+    updated_at = models.DateTimeField(auto_now=True)
+    # Number of copies, and of available ones, maintained by catalog.signals and
+    # catalog.circulation; see the reconcile_copies command.
+    total_copies = models.PositiveIntegerField(default=0, editable=False)
+    available_copies = models.PositiveIntegerField(default=0, editable=False)
+
+    COPY_COUNTERS = ('total_copies', 'available_copies')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -28,16 +45,67 @@ class Book(models.Model):
         return reverse('book-detail', args=[str(self.id)])
 
     def display_category(self):
-        return ', '.join([category.name for category in self.category.all()[:3]])
+        # Slice in Python so prefetched categories are used.
+        return ', '.join([category.name for category in self.category.all()][:3])
 
     display_category.short_description = 'Category'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Author as stored, so the previous author's page can be invalidated when it changes.
+        instance._loaded_author_id = instance.__dict__.get('author_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # The copy counters of a loaded book may be outdated: only increment_copies writes them.
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COPY_COUNTERS]
+        # Keep the row and the counters updated by post_save in one transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def increment_copies(cls, pk, total=0, available=0, **changes):
+        """Adjust the copy counters of book `pk`, with a single UPDATE also applying `changes`."""
+        if total or available or changes:
+            cls.objects.filter(pk=pk).update(total_copies=F('total_copies') + total,
+                                             available_copies=F('available_copies') + available, **changes)
+
+    @classmethod
+    def recount_copies(cls, queryset=None, **changes):
+        """
+        Recompute the copy counters of the books of `queryset` (all by default),
+        with a single UPDATE also applying `changes`. Return the number updated.
+        """
+        copies = BookAvailability.objects.filter(book=OuterRef('pk')).order_by().values('book')
+        count = copies.annotate(count=Count('pk')).values('count')
+        available = copies.filter(status__exact='a').annotate(count=Count('pk')).values('count')
+        return (cls.objects.all() if queryset is None else queryset).update(
+            total_copies=Coalesce(Subquery(count), 0),
+            available_copies=Coalesce(Subquery(available), 0),
+            **changes
+        )
+
+    @classmethod
+    def copy_counter_drift(cls, queryset=None):
+        """Books of `queryset` whose copy counters don't match their copies."""
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.annotate(
+            actual_total=Count('bookavailability'),
+            actual_available=Count('bookavailability', filter=Q(bookavailability__status__exact='a')),
+        ).exclude(total_copies=F('actual_total'), available_copies=F('actual_available'))
+
 class BookAvailability(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text="Identifiant unique à la librairie")
     book = models.ForeignKey('Book', on_delete=models.RESTRICT, null=True)
     imprint = models.CharField(max_length=200)
     due_back = models.DateField(null=True, blank=True)
     borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    reminded_on = models.DateField(null=True, blank=True, editable=False,
+                                   help_text='Date du dernier rappel envoyé à l\'emprunteur')
 
     @property
     def is_overdue(self):
@@ -60,21 +128,178 @@ class BookAvailability(models.Model):
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Peut indiquer le livre comme rendu"),)
+        indexes = [
+            # All loans by due date, and copy counts by status.
+            models.Index(fields=['status', 'due_back', 'id'], name='availability_status_due_idx'),
+            # A borrower's loans by due date.
+            models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='availability_borrower_due_idx'),
+        ]
 
     def __str__(self):
         return '{0} ({1})'.format(self.id, self.book.title)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Status and book as stored, so signal handlers can detect changes without a query.
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_book_id = instance.__dict__.get('book_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class Hold(models.Model):
+    """
+    A patron waiting for a copy of a book. Holds are served in the order the
+    database recorded them (id), see catalog.circulation.
+    """
+    # Covered by the indexes below.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
+    patron = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    requested_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'patron'], name='hold_unique_patron'),
+        ]
+        indexes = [
+            # The queue of a book, head first.
+            models.Index(fields=['book', 'id'], name='hold_queue_idx'),
+            # A patron's holds.
+            models.Index(fields=['patron', 'id'], name='hold_patron_idx'),
+        ]
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.book, self.patron)
+
+    @classmethod
+    def with_position(cls, queryset=None):
+        """Annotate the holds of `queryset` with their 1-based position in the queue of their book."""
+        ahead = (cls.objects.filter(book=OuterRef('book'), id__lt=OuterRef('id')).order_by()
+                 .values('book').annotate(count=Count('pk')).values('count'))
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.annotate(position=Coalesce(Subquery(ahead), 0) + 1)
+
+    def position_in_queue(self):
+        return Hold.objects.filter(book_id=self.book_id, id__lt=self.pk).count() + 1
+
 
 class Author(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     biography = models.TextField(max_length=1000, help_text='Décrivez une petit biographie')
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('author-detail', args=[str(self.id)])
 
     def __str__(self):
-        return '{0}, {1}'.format(self.last_name, self.first_name)
\ No newline at end of file
+        return '{0}, {1}'.format(self.last_name, self.first_name)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class CatalogCounters(models.Model):
+    """
+    Single row of denormalized counts shown on the index page, maintained by
+    catalog.signals and rebuilt by the rebuild_counters command.
+    """
+    SINGLETON_ID = 1
+
+    num_books = models.BigIntegerField(default=0)
+    num_availabilities = models.BigIntegerField(default=0)
+    num_availabilities_open = models.BigIntegerField(default=0)
+    num_authors = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return 'Compteurs du catalogue'
+
+    @classmethod
+    def compute(cls):
+        return {
+            'num_books': Book.objects.count(),
+            'num_availabilities': BookAvailability.objects.count(),
+            'num_availabilities_open': BookAvailability.objects.filter(status__exact='a').count(),
+            'num_authors': Author.objects.count(),
+        }
+
+    @classmethod
+    def rebuild(cls):
+        with transaction.atomic():
+            counters, _ = cls.objects.select_for_update().update_or_create(
+                pk=cls.SINGLETON_ID, defaults=cls.compute())
+        return counters
+
+    @classmethod
+    def load(cls):
+        try:
+            return cls.objects.get(pk=cls.SINGLETON_ID)
+        except cls.DoesNotExist:
+            return cls.rebuild()
+
+    @classmethod
+    async def aload(cls):
+        try:
+            return await cls.objects.aget(pk=cls.SINGLETON_ID)
+        except cls.DoesNotExist:
+            return await sync_to_async(cls.rebuild)()
+
+    @classmethod
+    def increment(cls, **deltas):
+        deltas = {name: models.F(name) + delta for name, delta in deltas.items() if delta}
+        if deltas:
+            cls.objects.filter(pk=cls.SINGLETON_ID).update(**deltas)
+
+class FacetCounts(models.Model):
+    """
+    Number of books, and of books with an available copy, per value of a book
+    list filter. Rebuilt as a whole by the refresh_facets command, to be run
+    periodically: reading them costs a scan of a small table instead of a
+    GROUP BY over the books.
+    """
+    num_books = models.PositiveIntegerField(default=0)
+    num_available = models.PositiveIntegerField(default=0)
+
+    # Book field the counts are grouped by, also the primary key of the table.
+    group_field = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def rebuild(cls):
+        rows = Book.objects.filter(**{cls.group_field + '__isnull': False}).order_by().values(
+            value=F(cls.group_field),
+        ).annotate(
+            num_books=Count('pk'),
+            num_available=Count('pk', filter=Q(available_copies__gt=0)),
+        )
+        attname = cls._meta.get_field(cls.group_field).attname
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(cls(num_books=row['num_books'], num_available=row['num_available'],
+                                        **{attname: row['value']}) for row in rows)
+
+
+class CategoryFacet(FacetCounts):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True)
+
+    group_field = 'category'
+
+
+class YearFacet(FacetCounts):
+    year = models.IntegerField(primary_key=True)
+
+    group_field = 'year'
@@ -0,0 +1,158 @@
+import base64
+import binascii
+import collections.abc
+import json
+
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.translation import gettext_lazy as _
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise Http404(_('Curseur de pagination invalide'))
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        raise Http404(_('Curseur de pagination invalide'))
+    return direction, values
+
+
+class CursorPage(collections.abc.Sequence):
+    """
+    A page of results located by its boundary rows rather than by an offset.
+    Exposes the subset of django.core.paginator.Page used by the templates.
+    """
+    cursor_paginated = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage of {0} objects>'.format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class Keyset:
+    """
+    Keyset pagination over `ordering`, whose last field must be unique.
+
+    Each page is fetched with a `WHERE (ordering) > (boundary) LIMIT n+1` query,
+    so deep pages cost the same as the first one and no COUNT(*) is issued.
+    Fetching is left to the caller (`slice` then `page`), so the same code
+    serves sync and async views.
+    """
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    def slice(self, queryset, token, page_size):
+        """Return the queryset of the page designated by `token`, and the state `page` needs."""
+        fields = [queryset.model._meta.get_field(name) for name in self.ordering]
+        direction, values = decode_cursor(token) if token else ('n', None)
+        if values is not None:
+            if len(values) != len(fields):
+                raise Http404(_('Curseur de pagination invalide'))
+            try:
+                values = [None if value is None else field.to_python(value) for field, value in zip(fields, values)]
+            except Exception:
+                raise Http404(_('Curseur de pagination invalide'))
+
+        if direction == 'n':
+            if values is not None:
+                queryset = queryset.filter(self._after(values))
+            queryset = queryset.order_by(*[F(name).asc(nulls_first=True) for name in self.ordering])
+        else:
+            queryset = queryset.filter(self._before(values))
+            queryset = queryset.order_by(*[F(name).desc(nulls_last=True) for name in self.ordering])
+        return queryset[:page_size + 1], (direction, values is not None, fields)
+
+    def page(self, rows, state, page_size):
+        """Build the CursorPage from the rows fetched from `slice`."""
+        direction, has_cursor, fields = state
+        rows = list(rows)
+        if direction == 'n':
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_previous = has_cursor
+        else:
+            has_previous = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_next = True
+
+        return CursorPage(
+            rows, has_next, has_previous,
+            next_cursor=self._cursor_for('n', rows[-1], fields) if has_next and rows else None,
+            previous_cursor=self._cursor_for('p', rows[0], fields) if has_previous and rows else None,
+        )
+
+    def _cursor_for(self, direction, obj, fields):
+        values = [getattr(obj, field.attname) for field in fields]
+        return encode_cursor(direction, [None if value is None else str(value) for value in values])
+
+    def _after(self, values, index=0):
+        name, value = self.ordering[index], values[index]
+        if index == len(self.ordering) - 1:
+            return Q(**{name + '__gt': value})
+        rest = self._after(values, index + 1)
+        if value is None:
+            return (Q(**{name + '__isnull': True}) & rest) | Q(**{name + '__isnull': False})
+        condition = Q(**{name + '__gt': value}) | (Q(**{name: value}) & rest)
+        if index == 0:
+            # Redundant bound on the leading column so the database can range-scan its index.
+            condition = Q(**{name + '__gte': value}) & condition
+        return condition
+
+    def _before(self, values, index=0):
+        name, value = self.ordering[index], values[index]
+        if index == len(self.ordering) - 1:
+            return Q(**{name + '__lt': value})
+        rest = self._before(values, index + 1)
+        if value is None:
+            return Q(**{name + '__isnull': True}) & rest
+        condition = Q(**{name + '__isnull': True}) | Q(**{name + '__lt': value}) | (Q(**{name: value}) & rest)
+        if index == 0:
+            condition = (Q(**{name + '__lte': value}) | Q(**{name + '__isnull': True})) & condition
+        return condition
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor based pagination for ListView, see Keyset. Requests with a `page`
+    parameter keep the default offset paginator.
+    """
+    keyset_ordering = ('id',)
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.page_kwarg in self.request.GET or self.page_kwarg in self.kwargs:
+            return super().paginate_queryset(queryset, page_size)
+
+        keyset = Keyset(self.keyset_ordering)
+        rows, state = keyset.slice(queryset, self.request.GET.get(self.cursor_kwarg), page_size)
+        page = keyset.page(rows, state, page_size)
+        return (None, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,58 @@
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_use_primary = contextvars.ContextVar('catalog_use_primary', default=False)
+
+
+@contextlib.contextmanager
+def use_primary(enabled=True):
+    """Read catalog models from the primary within the block, see PrimaryReplicaRouter."""
+    token = _use_primary.set(_use_primary.get() or enabled)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def pin_primary():
+    """Read from the primary until the end of the enclosing use_primary() block."""
+    _use_primary.set(True)
+
+
+def reads_primary(view):
+    """Flag a view function showing what the client just wrote, see PrimaryPinningMiddleware."""
+    view.reads_primary = True
+    return view
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads of catalog models to one of the CATALOG_REPLICAS databases and
+    everything else to the primary (default). Reads stay on the primary
+    within use_primary() and inside a transaction on the primary, whose own
+    writes the replicas may not have yet.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.CATALOG_REPLICAS
+        if (not replicas or model._meta.app_label != 'catalog' or _use_primary.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db not in settings.CATALOG_REPLICAS:
+            # Keep the database the instance was read from or explicitly saved to.
+            return None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.CATALOG_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
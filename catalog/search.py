@@ -0,0 +1,58 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Book
+
+# bm25 weights for the title, content, isbn and author columns.
+RANK_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# catalog_book_fts is kept in sync with the books and their author by triggers
+# created by migration 0003. SQLite rebuilds a table to alter it, which fails
+# while these triggers reference it: migrations altering catalog_book or
+# catalog_author drop them first and create them again afterwards (see 0005).
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix,
+    and FTS5 operators typed by the user are treated as plain words.
+    """
+    tokens = TOKEN_RE.findall(query)
+    return ' '.join('"{0}"*'.format(token) for token in tokens)
+
+
+def search_books(query, limit, offset=0):
+    """
+    Return up to `limit` books matching `query`, best match first, with their
+    author loaded.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return []
+
+    # Ids and books are read from the same database, which may be a replica.
+    using = router.db_for_read(Book)
+    if connections[using].vendor != 'sqlite':
+        return _search_books_fallback(query, limit, offset)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM catalog_book_fts WHERE catalog_book_fts MATCH %s '
+            'ORDER BY bm25(catalog_book_fts, {0}) LIMIT %s OFFSET %s'.format(', '.join(map(str, RANK_WEIGHTS))),
+            [expression, limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    books = Book.objects.using(using).select_related('author').in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def _search_books_fallback(query, limit, offset):
+    condition = Q()
+    for token in TOKEN_RE.findall(query):
+        condition &= (Q(title__icontains=token) | Q(content__icontains=token) | Q(isbn__icontains=token)
+                      | Q(author__first_name__icontains=token) | Q(author__last_name__icontains=token))
+    return list(Book.objects.select_related('author').filter(condition).order_by('title', 'id')[offset:offset + limit])
@@ -0,0 +1,200 @@
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .auth import forget_users
+from .caching import invalidate, touch
+from .circulation import serve_holds
+from .models import Book, Author, BookAvailability, Category, CatalogCounters
+from .sqlite import apply_pragmas
+from .timing import record_sql
+from .typeahead import record_change
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        # On the raw connection: not logged, and not slowed by execute wrappers.
+        apply_pragmas(connection.connection, settings.CATALOG_SQLITE_PRAGMAS)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, **kwargs):
+    if created:
+        CatalogCounters.increment(num_books=1)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    CatalogCounters.increment(num_books=-1)
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, **kwargs):
+    if created:
+        CatalogCounters.increment(num_authors=1)
+
+
+@receiver(post_delete, sender=Author)
+def author_deleted(sender, instance, **kwargs):
+    CatalogCounters.increment(num_authors=-1)
+
+
+# Page versions: a book page shows its author, categories and copies, an author
+# page shows the author's books and their copy counts. Copies are handled with
+# the copy counters below.
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    invalidate(Book, [instance.pk])
+    touch(Author, [instance.author_id, getattr(instance, '_loaded_author_id', None)])
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(m2m_changed, sender=Book.category.through)
+def book_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        touch(Book, pk_set or [])
+    else:
+        touch(Book, [instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def author_changed(sender, instance, **kwargs):
+    invalidate(Author, [instance.pk])
+    touch(Book, Book.objects.filter(author=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+def author_deleting(sender, instance, **kwargs):
+    # Before the books lose their author_id.
+    touch(Book, Book.objects.filter(author=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def author_deleted_invalidate(sender, instance, **kwargs):
+    invalidate(Author, [instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch(Book, Book.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    touch(Book, Book.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+def _copies_changed(book_id, total=0, available=0):
+    """Adjust the copy counters of a book and bump its page version and its author's."""
+    if book_id is None:
+        return
+    Book.increment_copies(book_id, total, available, updated_at=timezone.now())
+    invalidate(Book, [book_id])
+    touch(Author, Author.objects.filter(book__pk=book_id).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=BookAvailability)
+def book_availability_saved(sender, instance, created, **kwargs):
+    is_open = int(instance.status == 'a')
+    if is_open and instance.book_id is not None and (
+            created or getattr(instance, '_loaded_status', None) != 'a'
+            or getattr(instance, '_loaded_book_id', None) != instance.book_id):
+        # A copy put on the shelf goes to the holds on its book, once committed so that the
+        # instance being saved is not overwritten.
+        book_id = instance.book_id
+        transaction.on_commit(lambda: serve_holds(book_id))
+    if created:
+        CatalogCounters.increment(num_availabilities=1, num_availabilities_open=is_open)
+        _copies_changed(instance.book_id, total=1, available=is_open)
+    elif hasattr(instance, '_loaded_status'):
+        was_open = int(instance._loaded_status == 'a')
+        CatalogCounters.increment(num_availabilities_open=is_open - was_open)
+        if instance._loaded_book_id != instance.book_id:
+            _copies_changed(instance._loaded_book_id, total=-1, available=-was_open)
+            _copies_changed(instance.book_id, total=1, available=is_open)
+        else:
+            _copies_changed(instance.book_id, available=is_open - was_open)
+    else:
+        _copies_changed(instance.book_id)
+    instance._loaded_status = instance.status
+    instance._loaded_book_id = instance.book_id
+
+
+@receiver(post_delete, sender=BookAvailability)
+def book_availability_deleted(sender, instance, **kwargs):
+    was_open = int(getattr(instance, '_loaded_status', instance.status) == 'a')
+    CatalogCounters.increment(num_availabilities=-1, num_availabilities_open=-was_open)
+    _copies_changed(getattr(instance, '_loaded_book_id', instance.book_id), total=-1, available=-was_open)
+
+
+# Users and permissions cached by catalog.auth.CachedModelBackend. Clearing a
+# relation from the reverse side only gives the affected rows before it happens.
+
+def _group_members(groups):
+    return User.objects.filter(groups__in=groups).values_list('pk', flat=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            forget_users([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        forget_users(pk_set)
+    elif action == 'pre_clear':
+        forget_users(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            forget_users(_group_members([instance.pk]))
+    elif action in ('post_add', 'post_remove'):
+        forget_users(_group_members(pk_set))
+    elif action == 'pre_clear':
+        forget_users(_group_members(instance.group_set.all()))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    forget_users(_group_members([instance.pk]))
+
+
+@receiver(pre_delete, sender=Permission)
+def permission_deleting(sender, instance, **kwargs):
+    forget_users(instance.user_set.values_list('pk', flat=True))
+    forget_users(_group_members(instance.group_set.all()))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def typeahead_changed(sender, instance, **kwargs):
+    # Once committed, so that no process reloads the object before the change is visible.
+    pk = instance.pk
+    transaction.on_commit(lambda: record_change(sender, pk))
@@ -0,0 +1,4 @@
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run `PRAGMA name = value` for each item of `pragmas` on a sqlite3 connection."""
+    for name, value in pragmas.items():
+        dbapi_connection.execute('PRAGMA {0} = {1}'.format(name, value))
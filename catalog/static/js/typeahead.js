@@ -0,0 +1,25 @@
+// Suggestions of the search inputs with a data-suggest attribute, from the api-suggest endpoint.
+document.querySelectorAll('input[data-suggest]').forEach(function (input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var pending = null;
+
+  input.addEventListener('input', function () {
+    if (pending) {
+      pending.abort();
+    }
+    if (!input.value.trim()) {
+      return;
+    }
+    pending = new AbortController();
+    fetch(input.dataset.suggest + '?q=' + encodeURIComponent(input.value), {signal: pending.signal})
+      .then(function (response) { return response.json(); })
+      .then(function (data) {
+        list.replaceChildren.apply(list, data.results.map(function (result) {
+          var option = document.createElement('option');
+          option.value = result.label;
+          return option;
+        }));
+      })
+      .catch(function () {});
+  });
+});
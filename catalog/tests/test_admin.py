@@ -0,0 +1,90 @@
+from django.test import TestCase
+
+# Create your tests here.
+
+import warnings
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import BookAvailability, Book, Category, Author
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+
+class AdminScalingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='admin', email='admin@example.com')
+        for user_id in range(30):
+            User.objects.create_user(username='reader{0}'.format(user_id), password='reader')
+        categories = [Category.objects.create(name='Category {0}'.format(i)) for i in range(4)]
+        author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        cls.book = None
+        for book_id in range(15):
+            book = Book.objects.create(title='Book {0}'.format(book_id), year='1990', content='-',
+                                       isbn='ISBN{0}'.format(book_id), author=author)
+            book.category.set(categories)
+            cls.book = cls.book or book
+        for copy_id in range(40):
+            BookAvailability.objects.create(book=cls.book, imprint='Plon', status='a')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        # Cache the user and its permissions, see catalog.auth.
+        self.client.get(reverse('admin:index'))
+
+    def changelist_queries(self, model_name):
+        url = reverse('admin:catalog_{0}_changelist'.format(model_name))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_book_changelist_query_count_does_not_grow_with_rows(self):
+        before = self.changelist_queries('book')
+        Book.objects.create(title='Extra', year='1990', content='-', isbn='EXTRA',
+                            author=Author.objects.create(first_name='Terry', last_name='Pratchett'))
+        self.assertEqual(self.changelist_queries('book'), before)
+
+    def test_bookavailability_changelist_query_count_does_not_grow_with_rows(self):
+        before = self.changelist_queries('bookavailability')
+        other = Book.objects.create(title='Extra', year='1990', content='-', isbn='EXTRA')
+        BookAvailability.objects.create(book=other, imprint='Plon', status='o', borrower=self.admin)
+        self.assertEqual(self.changelist_queries('bookavailability'), before)
+
+    def test_changelist_total_comes_from_counters(self):
+        response = self.client.get(reverse('admin:catalog_bookavailability_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 40)
+        self.assertIsNone(response.context['cl'].full_result_count)
+
+    def test_book_form_does_not_list_every_user_or_copy(self):
+        response = self.client.get(reverse('admin:catalog_book_change', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'reader29')
+        self.assertEqual(len(response.context['inline_admin_formsets'][0].formset.forms), 20)
+
+    def test_book_autocomplete(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': '"Book 1"', 'app_label': 'catalog', 'model_name': 'bookavailability', 'field_name': 'book'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 6)
+        # Served by the typeahead index, which also knows the ISBNs.
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'isbn12', 'app_label': 'catalog', 'model_name': 'bookavailability', 'field_name': 'book'})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Book 12'])
+
+    def test_book_autocomplete_keeps_the_index_ranking(self):
+        for copy_id in range(3):
+            BookAvailability.objects.create(book=Book.objects.get(title='Book 13'), imprint='Plon', status='a')
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            response = self.client.get(reverse('admin:autocomplete'), {
+                'term': 'book', 'app_label': 'catalog', 'model_name': 'bookavailability', 'field_name': 'book'})
+        titles = [result['text'] for result in response.json()['results']]
+        # Ranked by number of copies.
+        self.assertEqual(titles[:2], ['Book 0', 'Book 13'])
+        self.assertEqual(len(titles), 15)
@@ -0,0 +1,114 @@
+from django.test import TestCase
+
+# Create your tests here.
+
+import datetime
+import json
+
+from catalog.models import BookAvailability, Book, Category, Author
+from django.urls import reverse
+
+
+class ApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        cls.category = Category.objects.create(name='Fantastique')
+        cls.books = []
+        for book_id in range(5):
+            book = Book.objects.create(title='The Witcher {0}'.format(book_id), year='1989', content='Geralt',
+                                       isbn='ISBN{0}'.format(book_id), author=cls.author)
+            cls.books.append(book)
+        cls.copy = BookAvailability.objects.create(book=cls.books[0], imprint='Plon', status='o',
+                                                   due_back=datetime.date(2030, 1, 1))
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_book_list_default_fields(self):
+        response = self.get('api-books')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(set(data['results'][0]), {'id', 'title', 'isbn', 'author_id'})
+        self.assertIsNone(data['next'])
+
+    def test_projection_selects_only_requested_columns(self):
+        with self.assertNumQueries(1) as context:
+            response = self.get('api-books', fields='title,author_last_name')
+        sql = context.captured_queries[0]['sql']
+        self.assertNotIn('"content"', sql)
+        self.assertEqual(response.json()['results'][0],
+                         {'id': self.books[0].pk, 'title': 'The Witcher 0', 'author_last_name': 'Sapkowski'})
+
+    def test_unknown_field_is_400(self):
+        self.assertEqual(self.get('api-books', fields='title,password').status_code, 400)
+
+    def test_bulk_fetch_by_ids_and_isbn(self):
+        ids = '{0},{1}'.format(self.books[1].pk, self.books[3].pk)
+        self.assertEqual([row['id'] for row in self.get('api-books', ids=ids).json()['results']],
+                         [self.books[1].pk, self.books[3].pk])
+        self.assertEqual([row['isbn'] for row in self.get('api-books', isbn='ISBN4,ISBN0,NOPE').json()['results']],
+                         ['ISBN0', 'ISBN4'])
+        self.assertEqual(self.get('api-books', ids='a,b').status_code, 400)
+
+    def test_keyset_paging(self):
+        first = self.get('api-books', limit=2).json()
+        self.assertEqual(len(first['results']), 2)
+        second = self.get('api-books', limit=2, after=first['next']).json()
+        self.assertEqual(second['results'][0]['id'], self.books[2].pk)
+
+    def test_limit_is_at_least_one(self):
+        for limit in (0, -5):
+            data = self.get('api-books', limit=limit).json()
+            self.assertEqual(len(data['results']), 1)
+            self.assertEqual(data['next'], self.books[0].pk)
+
+    def test_ids_too_large_are_invalid(self):
+        for params in ({'after': '99999999999999999999999'}, {'ids': '1,99999999999999999999999'}):
+            response = self.get('api-books', **params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Paramètre invalide'})
+
+    def test_book_detail(self):
+        self.assertEqual(self.get('api-book-detail', self.books[0].pk, fields='year').json(),
+                         {'id': self.books[0].pk, 'year': 1989})
+        self.assertEqual(self.get('api-book-detail', 999999).status_code, 404)
+
+    def test_authors_and_categories(self):
+        self.assertEqual(self.get('api-author-detail', self.author.pk).json()['last_name'], 'Sapkowski')
+        self.assertEqual(self.get('api-authors').json()['results'][0]['first_name'], 'Andrzej')
+        self.assertEqual(self.get('api-categories').json()['results'], [{'id': self.category.pk, 'name': 'Fantastique'}])
+
+    def test_copy_availability(self):
+        data = self.get('api-copies', book=self.books[0].pk).json()
+        self.assertEqual(data['results'], [{'id': str(self.copy.pk), 'book_id': self.books[0].pk, 'status': 'o',
+                                            'due_back': '2030-01-01'}])
+        self.assertEqual(self.get('api-copies', ids='not-a-uuid').status_code, 400)
+
+    def test_books_by_isbn(self):
+        book = Book.objects.create(title='La Peste', year=1947, content='Oran', isbn='9782070360420',
+                                   author=self.author)
+        with self.assertNumQueries(1):
+            data = self.get('api-books-isbn', isbn='978-2-07-036042-0,ISBN1,2070360423,9782070368228').json()
+        self.assertEqual(data['results'], [
+            {'query': '978-2-07-036042-0', 'isbn': '9782070360420', 'book': {
+                'id': book.pk, 'title': 'La Peste', 'author_id': self.author.pk, 'total_copies': 0,
+                'available_copies': 0, 'url': book.get_absolute_url()}},
+            {'query': 'ISBN1', 'isbn': None, 'book': {
+                'id': self.books[1].pk, 'title': 'The Witcher 1', 'author_id': self.author.pk, 'total_copies': 0,
+                'available_copies': 0, 'url': self.books[1].get_absolute_url()}},
+            {'query': '2070360423', 'isbn': '9782070360420', 'book': data['results'][0]['book']},
+            {'query': '9782070368228', 'isbn': '9782070368228', 'book': None},
+        ])
+
+    def test_books_by_isbn_post(self):
+        url = reverse('api-books-isbn')
+        isbns = ['ISBN{0}'.format(book_id) for book_id in range(5)] + ['ISBN0']
+        response = self.client.post(url, json.dumps({'isbn': isbns}), content_type='application/json')
+        self.assertEqual([result['book']['available_copies'] for result in response.json()['results']],
+                         [0, 0, 0, 0, 0])
+        self.assertEqual(self.client.post(url, '{"isbn": "ISBN1"}', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, 'isbn', content_type='application/json').status_code, 400)
+        self.assertEqual(self.get('api-books-isbn', isbn=','.join(str(n) for n in range(501))).status_code, 400)
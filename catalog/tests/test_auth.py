@@ -0,0 +1,76 @@
+from django.test import TestCase
+
+# Create your tests here.
+
+import time
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.urls import reverse
+
+from catalog.auth import CACHE_TIMEOUT, permissions_key, user_key
+
+
+class CachedModelBackendTest(TestCase):
+    """Users and permissions are cached across requests, and forgotten when they change."""
+
+    def setUp(self):
+        cache.clear()
+        self.permission = Permission.objects.get(codename='can_mark_returned')
+        self.user = User.objects.create_user(username='librarian', password='librarian')
+        self.client.force_login(self.user)
+        self.url = reverse('all-borrowed')
+
+    def assertAllowed(self, allowed):
+        self.assertEqual(self.client.get(self.url).status_code, 200 if allowed else 403)
+
+    def test_user_and_permissions_are_cached(self):
+        self.assertAllowed(False)
+        self.assertIsNotNone(cache.get(user_key(self.user.pk)))
+        self.assertEqual(cache.get(permissions_key(self.user.pk)), set())
+        with self.assertNumQueries(0):
+            self.assertAllowed(False)
+
+    def test_user_permissions_change(self):
+        self.assertAllowed(False)
+        self.user.user_permissions.add(self.permission)
+        self.assertAllowed(True)
+        self.permission.user_set.remove(self.user)
+        self.assertAllowed(False)
+        self.user.user_permissions.add(self.permission)
+        self.assertAllowed(True)
+        self.permission.user_set.clear()
+        self.assertAllowed(False)
+
+    def test_group_permissions_change(self):
+        group = Group.objects.create(name='Bibliothécaires')
+        self.user.groups.add(group)
+        self.assertAllowed(False)
+        group.permissions.add(self.permission)
+        self.assertAllowed(True)
+        self.permission.group_set.clear()
+        self.assertAllowed(False)
+        self.permission.group_set.add(group)
+        self.assertAllowed(True)
+        self.user.groups.remove(group)
+        self.assertAllowed(False)
+        self.user.groups.add(group)
+        self.assertAllowed(True)
+        group.delete()
+        self.assertAllowed(False)
+
+    def test_user_change(self):
+        self.user.user_permissions.add(self.permission)
+        self.assertAllowed(True)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_deactivation_by_another_process(self):
+        self.assertAllowed(False)
+        # Saved by a process with its own cache: the signals don't reach this one.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertAllowed(False)
+        with mock.patch('time.time', return_value=time.time() + CACHE_TIMEOUT + 1):
+            self.assertEqual(self.client.get(self.url).status_code, 302)
@@ -0,0 +1,403 @@
+from django.test import TestCase, TransactionTestCase
+
+# Create your tests here.
+
+import datetime
+import threading
+import time
+
+from django.contrib.admin import helpers
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from catalog import circulation
+from catalog.models import Author, BookAvailability, Book, CatalogCounters, Hold
+from django.contrib.auth.models import User
+from django.contrib.auth.models import Permission
+from django.urls import reverse
+
+
+class CirculationServiceTest(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='user1')
+        self.user2 = User.objects.create_user(username='user2', password='user2')
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890')
+        self.copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+
+    def test_checkout_then_return(self):
+        circulation.checkout(self.copy.pk, self.user1)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('o', self.user1))
+        self.assertEqual(self.copy.due_back, datetime.date.today() + circulation.LOAN_PERIOD)
+        self.assertEqual(CatalogCounters.load().num_availabilities_open, 0)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.total_copies, self.book.available_copies), (1, 0))
+
+        circulation.return_copy(self.copy.pk)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('a', None, None))
+        self.assertEqual(CatalogCounters.load().num_availabilities_open, 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.total_copies, self.book.available_copies), (1, 1))
+
+    def test_checkout_of_lent_copy_fails(self):
+        circulation.checkout(self.copy.pk, self.user1)
+        with self.assertRaises(circulation.CirculationError):
+            circulation.checkout(self.copy.pk, self.user2)
+
+    def test_reserved_copy_only_lent_to_its_holder(self):
+        circulation.reserve(self.copy.pk, self.user1)
+        with self.assertRaises(circulation.CirculationError):
+            circulation.checkout(self.copy.pk, self.user2)
+        circulation.checkout(self.copy.pk, self.user1)
+        self.assertEqual(BookAvailability.objects.get().status, 'o')
+
+    def test_renew_and_return_need_a_loan(self):
+        with self.assertRaises(circulation.CirculationError):
+            circulation.renew(self.copy.pk, datetime.date.today())
+        with self.assertRaises(circulation.CirculationError):
+            circulation.return_copy(self.copy.pk)
+
+
+class CirculationViewsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.librarian = User.objects.create_user(username='librarian', password='librarian')
+        self.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890')
+        self.copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+
+    def test_checkout_requires_post_and_login(self):
+        url = reverse('checkout-book', args=[self.copy.pk])
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(BookAvailability.objects.get().status, 'a')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+    def test_checkout_and_return(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('checkout-book', args=[self.copy.pk]))
+        self.assertRedirects(response, reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(BookAvailability.objects.get().borrower, self.user)
+
+        self.assertEqual(self.client.post(reverse('return-book', args=[self.copy.pk])).status_code, 403)
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('return-book', args=[self.copy.pk]))
+        self.assertRedirects(response, reverse('all-borrowed'))
+        self.assertEqual(BookAvailability.objects.get().status, 'a')
+
+    def test_unavailable_copy_shows_message(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('reserve-book', args=[self.copy.pk]))
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('checkout-book', args=[self.copy.pk]), follow=True)
+        self.assertContains(response, "Cet exemplaire n&#x27;est pas disponible.")
+        self.assertEqual(BookAvailability.objects.get().borrower, self.user)
+
+
+class HoldQueueTest(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username='user{0}'.format(i)) for i in range(3)]
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890')
+        self.copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+
+    def test_available_copy_is_reserved_at_once(self):
+        self.assertIsNone(circulation.place_hold(self.book.pk, self.users[0]))
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('r', self.users[0]))
+        self.assertFalse(Hold.objects.exists())
+
+    def test_returned_copy_goes_to_the_first_hold(self):
+        circulation.checkout(self.copy.pk, self.users[0])
+        holds = [circulation.place_hold(self.book.pk, user) for user in self.users[1:]]
+        self.assertEqual([hold.position_in_queue() for hold in holds], [1, 2])
+        with self.assertRaises(circulation.CirculationError):
+            circulation.place_hold(self.book.pk, self.users[1])
+
+        circulation.return_copy(self.copy.pk)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('r', self.users[1]))
+        self.assertEqual([(hold.patron, hold.position) for hold in Hold.with_position()], [(self.users[2], 1)])
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.total_copies, self.book.available_copies), (1, 0))
+        self.assertEqual(CatalogCounters.load().num_availabilities_open, 0)
+
+        circulation.checkout(self.copy.pk, self.users[1])
+        circulation.cancel_hold(holds[1].pk, self.users[2])
+        circulation.return_copy(self.copy.pk)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+
+    def queue(self):
+        return [(hold.patron, hold.position) for hold in Hold.with_position()]
+
+    def test_copy_put_on_the_shelf_goes_to_the_head_of_the_queue(self):
+        circulation.checkout(self.copy.pk, self.users[0])
+        for user in self.users[1:]:
+            circulation.place_hold(self.book.pk, user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower), ('r', self.users[1]))
+        self.assertEqual(self.queue(), [(self.users[2], 1)])
+
+        # Back from repair, through the admin.
+        repaired = BookAvailability.objects.create(book=self.book, imprint='Plon', status='d')
+        self.client.force_login(User.objects.create_superuser(username='admin', password='admin'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:catalog_bookavailability_change', args=[repaired.pk]), {
+                'book': self.book.pk, 'imprint': 'Plon', 'id': repaired.pk, 'status': 'a', 'due_back': '',
+                'borrower': ''})
+        self.assertEqual(response.status_code, 302)
+        repaired.refresh_from_db()
+        self.assertEqual((repaired.status, repaired.borrower), ('r', self.users[2]))
+        self.assertEqual(self.queue(), [])
+
+    def test_holds_are_served_in_turn_until_the_commit(self):
+        circulation.checkout(self.copy.pk, self.users[0])
+        for user in self.users[1:]:
+            circulation.place_hold(self.book.pk, user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+
+        for operation, user in ((circulation.checkout, self.users[2]), (circulation.reserve, self.users[2]),
+                                (circulation.checkout, self.users[0])):
+            with self.assertRaisesMessage(circulation.CirculationError, "D'autres lecteurs attendent ce livre."):
+                operation(copy.pk, user)
+        copy.refresh_from_db()
+        self.assertEqual(copy.status, 'a')
+        self.assertEqual(Hold.objects.count(), 2)
+
+        circulation.checkout(copy.pk, self.users[1])
+        self.assertEqual(self.queue(), [(self.users[2], 1)])
+        for callback in callbacks:
+            callback()
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower), ('o', self.users[1]))
+        self.assertEqual(self.queue(), [(self.users[2], 1)])
+
+    def test_hold_views(self):
+        circulation.checkout(self.copy.pk, self.users[0])
+        self.client.force_login(self.users[1])
+        self.assertContains(self.client.get(reverse('book-detail', args=[self.book.pk])), "Rejoindre la file d'attente")
+        response = self.client.post(reverse('place-hold', args=[self.book.pk]), follow=True)
+        self.assertContains(response, 'Vous êtes en position 1 dans la file d&#x27;attente.')
+        self.assertContains(response, 'The Witcher</a> - position 1')
+
+        circulation.return_copy(self.copy.pk)
+        response = self.client.get(reverse('my-holds'))
+        self.assertContains(response, 'Exemplaires à retirer')
+        self.assertContains(response, 'Aucune réservation en attente.')
+
+        hold = Hold.objects.create(book=self.book, patron=self.users[1])
+        self.client.force_login(self.users[2])
+        self.client.post(reverse('cancel-hold', args=[hold.pk]))
+        self.assertTrue(Hold.objects.filter(pk=hold.pk).exists())
+
+
+class BulkCirculationTest(TestCase):
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader', password='reader')
+        self.librarian = User.objects.create_user(username='librarian', password='librarian', is_staff=True)
+        self.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'),
+                                            *Permission.objects.filter(codename__in=['view_bookavailability',
+                                                                                      'change_bookavailability']))
+        author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.books = [Book.objects.create(title='Book {0}'.format(book_id), content='-', isbn=str(book_id),
+                                          author=author) for book_id in range(3)]
+        self.due_back = datetime.date.today() + datetime.timedelta(days=2)
+        self.loans = [BookAvailability.objects.create(book=book, imprint='Plon', status='o', borrower=self.reader,
+                                                      due_back=self.due_back)
+                      for book in self.books for _ in range(2)]
+        self.available = BookAvailability.objects.create(book=self.books[0], imprint='Plon', status='a')
+
+    def pks(self, copies):
+        return [copy.pk for copy in copies]
+
+    def assertCounters(self, available):
+        self.assertEqual(CatalogCounters.load().num_availabilities_open, sum(available))
+        self.assertEqual([book.available_copies for book in Book.objects.order_by('pk')], available)
+        self.assertFalse(Book.copy_counter_drift().exists())
+
+    def test_bulk_renew(self):
+        date = datetime.date.today() + datetime.timedelta(weeks=2)
+        self.assertEqual(circulation.bulk_renew(self.pks(self.loans[:3] + [self.available]), date), 3)
+        self.assertEqual([copy.due_back for copy in BookAvailability.objects.filter(status='o').order_by('due_back')],
+                         [self.due_back] * 3 + [date] * 3)
+        self.assertCounters([1, 0, 0])
+
+    def test_bulk_return_serves_holds(self):
+        hold = Hold.objects.create(book=self.books[1], patron=self.librarian)
+        self.assertEqual(circulation.bulk_return(self.pks(self.loans[:4] + [self.available])), 4)
+        self.assertFalse(Hold.objects.filter(pk=hold.pk).exists())
+        self.assertEqual(BookAvailability.objects.filter(status='r', borrower=self.librarian).count(), 1)
+        self.assertCounters([3, 1, 0])
+        self.assertEqual(circulation.bulk_return(self.pks(self.loans[:4])), 0)
+
+    def test_bulk_mark_available(self):
+        BookAvailability.objects.filter(pk=self.loans[0].pk).update(status='d', borrower=None)
+        Book.recount_copies()
+        self.assertEqual(circulation.bulk_mark_available(self.pks(self.loans[:2])), 1)
+        self.assertCounters([2, 0, 0])
+
+    def test_query_count_does_not_grow_with_copies(self):
+        def queries(copies):
+            with CaptureQueriesContext(connection) as context:
+                circulation.bulk_return(self.pks(copies))
+            return len(context.captured_queries)
+
+        self.assertEqual(queries(self.loans[:1]), queries(self.loans[1:]))
+
+    def test_bulk_view(self):
+        url = reverse('all-borrowed-bulk')
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.post(url, {'action': 'return', 'copies': self.pks(self.loans)}).status_code, 403)
+
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertContains(response, 'name="copies"', count=6)
+        too_late = datetime.date.today() + datetime.timedelta(weeks=5)
+        response = self.client.post(url, {'action': 'renew', 'copies': self.pks(self.loans),
+                                          'renewal_date': too_late}, follow=True)
+        self.assertContains(response, 'Vous ne pouvez pas aller au-delà du mois prochain')
+        self.assertContains(self.client.post(url, {'action': 'return'}, follow=True), 'Aucun exemplaire sélectionné')
+
+        response = self.client.post(url, {'action': 'renew', 'copies': self.pks(self.loans[:2]),
+                                          'renewal_date': datetime.date.today()}, follow=True)
+        self.assertRedirects(response, reverse('all-borrowed'))
+        self.assertContains(response, '2 exemplaire(s) traité(s) sur 2.')
+        self.client.post(url, {'action': 'return', 'copies': self.pks(self.loans)})
+        self.assertCounters([3, 2, 2])
+
+    def test_admin_actions(self):
+        self.client.force_login(self.librarian)
+        url = reverse('admin:catalog_bookavailability_changelist')
+        selection = {helpers.ACTION_CHECKBOX_NAME: self.pks(self.loans[:2] + [self.available])}
+
+        response = self.client.post(url, {'action': 'renew_selected', **selection})
+        self.assertContains(response, '3 exemplaire(s) sélectionné(s)')
+        date = datetime.date.today() + datetime.timedelta(weeks=4)
+        response = self.client.post(url, {'action': 'renew_selected', 'apply': '1', 'renewal_date': date,
+                                          **selection}, follow=True)
+        self.assertContains(response, '2 exemplaire(s) prolongé(s) sur 3 sélectionné(s).')
+        self.assertEqual(BookAvailability.objects.filter(due_back=date).count(), 2)
+
+        self.client.post(url, {'action': 'return_selected', **selection})
+        self.assertCounters([3, 0, 0])
+        BookAvailability.objects.filter(pk=self.loans[0].pk).update(status='d')
+        self.client.post(url, {'action': 'mark_available_selected', **selection})
+        self.assertEqual(BookAvailability.objects.get(pk=self.loans[0].pk).status, 'a')
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """
+    Many threads race for the same few copies: every copy must be lent
+    exactly once, and losers must be refused rather than overwrite the loan.
+    """
+
+    def test_no_copy_is_lent_twice(self):
+        book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890')
+        copies = [BookAvailability.objects.create(book=book, imprint='Plon', status='a').pk for _ in range(10)]
+        users = [User.objects.create_user(username='user{0}'.format(i)) for i in range(16)]
+
+        wins = []
+        errors = []
+        barrier = threading.Barrier(len(users))
+
+        def patron(user):
+            try:
+                barrier.wait()
+                for pk in copies:
+                    try:
+                        circulation.checkout(pk, user)
+                        wins.append((pk, user.pk))
+                    except circulation.CirculationError:
+                        pass
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=patron, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(pk for pk, _ in wins), sorted(copies))
+        for pk, user_id in wins:
+            self.assertEqual(BookAvailability.objects.get(pk=pk).borrower_id, user_id)
+        self.assertEqual(CatalogCounters.load().num_availabilities_open, 0)
+        attempts = len(users) * len(copies)
+        self.assertLess(elapsed, 10, '{0} attempts in {1:.2f}s'.format(attempts, elapsed))
+
+
+class ConcurrentHoldsTest(TransactionTestCase):
+    """
+    Thousands of patrons queue for one title while its copies come back:
+    each returned copy goes to the oldest hold at that time, so the patrons
+    served are exactly the first ones in the queue.
+    """
+
+    def test_holds_are_served_in_order(self):
+        book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890')
+        User.objects.bulk_create([User(username='user{0}'.format(i)) for i in range(2000)])
+        users = list(User.objects.order_by('pk'))
+        copies = [BookAvailability.objects.create(book=book, imprint='Plon', status='o', borrower=users[0]).pk
+                  for _ in range(5)]
+
+        holds = {}
+        errors = []
+        workers = 16
+        barrier = threading.Barrier(workers + 1)
+
+        def patron(users):
+            try:
+                barrier.wait()
+                for user in users:
+                    hold = circulation.place_hold(book.pk, user)
+                    if hold is not None:
+                        holds[user.pk] = hold.pk
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        def librarian():
+            try:
+                barrier.wait()
+                for pk in copies:
+                    time.sleep(0.05)
+                    circulation.return_copy(pk)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=patron, args=(users[1 + i::workers],)) for i in range(workers)]
+        threads.append(threading.Thread(target=librarian))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(errors, [])
+        served = set(BookAvailability.objects.filter(status__exact='r').values_list('borrower_id', flat=True))
+        self.assertEqual(len(served), len(copies))
+        queue = list(Hold.with_position(Hold.objects.filter(book=book)).values_list('patron_id', 'position'))
+        self.assertEqual(len(queue) + len(served), len(users) - 1)
+        self.assertEqual([position for _, position in queue], list(range(1, len(queue) + 1)))
+        # Patrons served from the queue held before every patron still waiting.
+        waiting = min(holds[patron_id] for patron_id, _ in queue)
+        self.assertTrue(all(holds[patron_id] < waiting for patron_id in served if patron_id in holds))
+        self.assertLess(elapsed, 60, '{0} holds in {1:.2f}s'.format(len(users) - 1, elapsed))
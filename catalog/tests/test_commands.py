@@ -0,0 +1,278 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+
+# Create your tests here.
+
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import CommandError, call_command
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from catalog.management.commands.compare_handlers import Command as CompareHandlersCommand
+from catalog.models import Author, Book, BookAvailability, Category, CatalogCounters
+
+
+class ImportCatalogCommandTest(TestCase):
+
+    def setUp(self):
+        self.existing_author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890',
+                            author=self.existing_author)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self.write('books.csv', (
+            'isbn,title,year,content,author_first_name,author_last_name,categories,imprint,copies\n'
+            '111,Le Sang des Elfes,1994,Ciri,Andrzej,Sapkowski,Fantastique|Aventure,Bragelonne,2\n'
+            '222,Le Hobbit,1937,Bilbo,John,Tolkien,Fantastique,Bourgois,1\n'
+            '111,Doublon,1994,,Andrzej,Sapkowski,,,5\n'
+            '2134567890,Déjà présent,1989,,,,,,1\n'
+        ))
+        out = StringIO()
+        call_command('import_catalog', path, '--batch-size', '2', stdout=out)
+
+        self.assertIn('4 lignes lues, 2 livres créés, 2 ignorés', out.getvalue())
+        book = Book.objects.get(isbn='111')
+        self.assertEqual(book.title, 'Le Sang des Elfes')
+        self.assertEqual(book.author, self.existing_author)
+        self.assertEqual(sorted(category.name for category in book.category.all()), ['Aventure', 'Fantastique'])
+        self.assertEqual(BookAvailability.objects.filter(book=book, status='a').count(), 2)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Category.objects.count(), 2)
+
+        counters = CatalogCounters.load()
+        self.assertEqual((counters.num_books, counters.num_authors, counters.num_availabilities,
+                          counters.num_availabilities_open), (3, 2, 3, 3))
+
+    def test_import_jsonl_is_idempotent(self):
+        lines = [
+            {'isbn': '333', 'title': 'Dune', 'year': 1965, 'content': 'Arrakis', 'author_first_name': 'Frank',
+             'author_last_name': 'Herbert', 'categories': ['Science-fiction'], 'imprint': 'Pocket', 'copies': 3},
+            {'isbn': '444', 'title': 'Sans auteur', 'content': '-'},
+        ]
+        path = self.write('books.jsonl', '\n'.join(json.dumps(line) for line in lines) + '\n')
+
+        call_command('import_catalog', path, stdout=StringIO())
+        call_command('import_catalog', path, stdout=StringIO())
+
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(Book.objects.get(isbn='333').author.last_name, 'Herbert')
+        self.assertIsNone(Book.objects.get(isbn='444').author)
+        self.assertEqual(BookAvailability.objects.count(), 3)
+        self.assertEqual(CatalogCounters.load().num_books, 3)
+
+
+    def test_malformed_records_are_reported_and_skipped(self):
+        path = self.write('books.csv', (
+            'isbn,title,year,content,author_first_name,author_last_name,categories,imprint,copies\n'
+            '111,Le Sang des Elfes,1994,Ciri,Andrzej,Sapkowski,,Bragelonne,2\n'
+            '222,Le Hobbit,vers 1937,Bilbo,John,Tolkien,,Bourgois,1\n'
+            '333,Dune,1965,Arrakis,Frank,Herbert,,Pocket,-1\n'
+        ))
+        out = StringIO()
+        err = StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err)
+
+        self.assertIn('3 lignes lues, 1 livres créés, 0 ignorés, 2 invalides', out.getvalue())
+        self.assertEqual(err.getvalue().splitlines(), ["Ligne 3 ignorée: year invalide: 'vers 1937'",
+                                                       "Ligne 4 ignorée: copies invalide: '-1'"])
+        self.assertEqual(list(Book.objects.order_by('isbn').values_list('isbn', flat=True)), ['111', '2134567890'])
+
+        path = self.write('books.jsonl', '{"isbn": "444", "copies": "deux"}\n["555"]\n')
+        err = StringIO()
+        call_command('import_catalog', path, stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue().splitlines(), ["Ligne 1 ignorée: copies invalide: 'deux'",
+                                                       "Ligne 2 ignorée: objet attendu: ['555']"])
+        self.assertEqual(Book.objects.count(), 2)
+
+
+class ExportCatalogCommandTest(TestCase):
+
+    def test_export_authors(self):
+        Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        out = StringIO()
+        call_command('export_catalog', 'authors', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['id,last_name,first_name',
+                                                       '{0},Sapkowski,Andrzej'.format(Author.objects.get().pk)])
+
+
+class BenchmarkCommandsTest(TestCase):
+
+    def test_seed_then_benchmark_every_route(self):
+        call_command('seed_benchmark', '--books', '60', '--seed', '1', stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 60)
+        self.assertEqual(CatalogCounters.load().num_books, 60)
+        self.assertTrue(BookAvailability.objects.filter(status='o').exists())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('run_benchmark', '--iterations', '2', '--warmup', '0', '--output', path,
+                         '--host', 'testserver', stdout=StringIO())
+            with open(path, encoding='utf-8') as stream:
+                report = json.load(stream)
+
+        self.assertEqual(report['skipped'], [])
+        self.assertEqual(report['dataset']['num_books'], 60)
+        for name, result in report['routes'].items():
+            self.assertEqual(result['status'], 200, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class CompareHandlersCommandTest(TransactionTestCase):
+    """Both servers use their own threads, so the catalog must be committed."""
+
+    def test_every_async_route_on_both_servers(self):
+        call_command('seed_benchmark', '--books', '30', '--seed', '1', stdout=StringIO())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'handlers.json')
+            call_command('compare_handlers', '--requests', '6', '--latency', '1', '--workers', '2',
+                         '--concurrency', '3', '--output', path, '--host', 'testserver', stdout=StringIO())
+            with open(path, encoding='utf-8') as stream:
+                report = json.load(stream)
+
+        self.assertEqual(set(report['routes']), {'index', 'books', 'book-detail', 'authors', 'author-detail'})
+        for name, result in report['routes'].items():
+            for server in ('wsgi', 'asgi'):
+                self.assertEqual(result[server]['status'], 200, (name, server))
+                self.assertEqual(result[server]['count'], 6)
+                self.assertGreater(result[server]['throughput_rps'], 0)
+
+    def test_wsgi_workers_close_their_connections(self):
+        call_command('seed_benchmark', '--books', '5', '--seed', '1', stdout=StringIO())
+        opened = []
+
+        def created(sender, connection, **kwargs):
+            opened.append(connection)
+
+        connection_created.connect(created)
+        self.addCleanup(connection_created.disconnect, created)
+        result = CompareHandlersCommand().run_wsgi(reverse('books'), {'host': 'testserver', 'workers': 2, 'requests': 5})
+        self.assertEqual((result['status'], result['count']), (200, 5))
+        self.assertTrue(opened)
+        self.assertEqual([connection for connection in opened if connection.connection is not None], [])
+
+
+class BenchSqliteCommandTest(TransactionTestCase):
+
+    def test_both_profiles(self):
+        call_command('seed_benchmark', '--books', '30', '--seed', '1', stdout=StringIO())
+        loans = list(BookAvailability.objects.filter(status='o').order_by('pk').values_list('pk', flat=True))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sqlite.json')
+            call_command('bench_sqlite', '--readers', '2', '--writers', '1', '--duration', '0.3',
+                         '--output', path, stdout=StringIO())
+            with open(path, encoding='utf-8') as stream:
+                report = json.load(stream)
+
+        self.assertEqual(set(report['profiles']), {'default', 'tuned'})
+        for result in report['profiles'].values():
+            self.assertGreater(result['reads']['count'], 0)
+            self.assertGreater(result['writes']['count'], 0)
+        self.assertIn('reads', report['gain'])
+        # Copies of the database were benchmarked, not the database itself.
+        self.assertEqual(list(BookAvailability.objects.filter(status='o').order_by('pk').values_list('pk', flat=True)),
+                         loans)
+
+
+class FailingEmailBackend(EmailBackend):
+    """Fails on the messages to bob, as an SMTP server rejecting a recipient."""
+
+    def send_messages(self, messages):
+        if any('bob@example.com' in message.to for message in messages):
+            raise OSError('Connexion refusée')
+        return super().send_messages(messages)
+
+
+class LoanAddingEmailBackend(EmailBackend):
+    """Lends bob another copy, due tomorrow, while the reminder of alice is sent."""
+
+    def send_messages(self, messages):
+        if any('alice@example.com' in message.to for message in messages):
+            BookAvailability.objects.create(book=Book.objects.get(), imprint='Plon', status='o',
+                                            borrower=User.objects.get(username='bob'),
+                                            due_back=datetime.date.today() + datetime.timedelta(days=1))
+        return super().send_messages(messages)
+
+
+class ProcessOverdueCommandTest(TestCase):
+
+    def setUp(self):
+        today = datetime.date.today()
+        self.alice = User.objects.create_user(username='alice', password='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', password='bob', email='bob@example.com')
+        self.nomail = User.objects.create_user(username='nomail', password='nomail')
+        book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890')
+
+        def loan(user, days, status='o'):
+            return BookAvailability.objects.create(book=book, imprint='Plon', status=status, borrower=user,
+                                                   due_back=today + datetime.timedelta(days=days))
+
+        self.alice_overdue = loan(self.alice, -5)
+        self.alice_soon = loan(self.alice, 2)
+        loan(self.alice, 10)
+        loan(self.bob, -1)
+        loan(self.bob, -3, status='a')
+        loan(self.nomail, -2)
+
+    def test_one_grouped_reminder_per_borrower(self):
+        out = StringIO()
+        call_command('process_overdue', '--batch-size', '2', stdout=out)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['alice@example.com', 'bob@example.com'])
+        alice = next(message for message in mail.outbox if message.to == ['alice@example.com'])
+        self.assertIn('2 livre(s)', alice.subject)
+        self.assertIn('en retard', alice.body)
+        self.assertIn('à rendre', alice.body)
+        self.assertIn('4 emprunts, 3 emprunteurs, 2 rappels envoyés, 1 sans adresse', out.getvalue())
+
+        self.alice_overdue.refresh_from_db()
+        self.assertEqual(self.alice_overdue.reminded_on, datetime.date.today())
+
+    @override_settings(EMAIL_BACKEND='catalog.tests.test_commands.FailingEmailBackend')
+    def test_failed_send_keeps_the_messages_already_sent(self):
+        with self.assertRaises(OSError):
+            call_command('process_overdue', stdout=StringIO())
+        self.assertEqual([message.to for message in mail.outbox], [['alice@example.com']])
+        self.assertEqual(set(BookAvailability.objects.filter(reminded_on__isnull=False).values_list('pk', flat=True)),
+                         {self.alice_overdue.pk, self.alice_soon.pk})
+
+    @override_settings(EMAIL_BACKEND='catalog.tests.test_commands.LoanAddingEmailBackend')
+    def test_each_batch_is_sent_before_the_next_is_read(self):
+        out = StringIO()
+        call_command('process_overdue', '--batch-size', '1', stdout=out)
+        self.assertIn('5 emprunts, 3 emprunteurs, 2 rappels envoyés, 1 sans adresse', out.getvalue())
+        self.assertEqual([(message.to[0], message.subject) for message in mail.outbox],
+                         [('alice@example.com', 'Rappel : 2 livre(s) à rendre'),
+                          ('bob@example.com', 'Rappel : 2 livre(s) à rendre')])
+        self.assertFalse(BookAvailability.objects.filter(status='o', borrower=self.bob, reminded_on=None).exists())
+
+    def test_batch_size_must_be_positive(self):
+        with self.assertRaises(CommandError):
+            call_command('process_overdue', '--batch-size', '0', stdout=StringIO())
+
+    def test_rerun_is_idempotent(self):
+        call_command('process_overdue', stdout=StringIO())
+        mail.outbox = []
+        call_command('process_overdue', stdout=StringIO())
+        self.assertEqual(mail.outbox, [])
+
+    def test_dry_run_sends_nothing(self):
+        call_command('process_overdue', '--dry-run', stdout=StringIO())
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(BookAvailability.objects.filter(reminded_on__isnull=False).exists())
@@ -4,7 +4,10 @@ from django.test import TestCase
 # Create your tests here.
 
 import datetime
+from django.forms import modelform_factory
+
 from catalog.forms import RenewBookForm
+from catalog.models import Book
 
 
 class RenewBookFormTest(TestCase):
@@ -39,4 +42,24 @@ class RenewBookFormTest(TestCase):
         form = RenewBookForm()
         self.assertEqual(
             form.fields['renewal_date'].help_text,
-            "Entrez une date jusqu'au mois prochain maximum.")
\ No newline at end of file
+            "Entrez une date jusqu'au mois prochain maximum.")
+
+
+class BookFormISBNTest(TestCase):
+
+    def form(self, isbn):
+        form_class = modelform_factory(Book, fields=['title', 'year', 'content', 'isbn'])
+        return form_class(data={'title': 'La Peste', 'year': 1947, 'content': 'Oran', 'isbn': isbn})
+
+    def test_isbn_with_dashes_saved_as_isbn13(self):
+        form = self.form('2-07-036822-X')
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save().isbn, '9782070368228')
+
+    def test_invalid_isbn(self):
+        self.assertIn('isbn', self.form('978-2-07-036822-7').errors)
+        self.assertIn('isbn', self.form('ISBN1').errors)
+
+    def test_isbn_already_taken_in_another_form(self):
+        self.form('9782070368228').save()
+        self.assertIn('isbn', self.form('978-2-07-036822-8').errors)
@@ -0,0 +1,109 @@
+from django.test import TestCase
+
+# Create your tests here.
+
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import BookAvailability, Book, Category, Author
+from django.contrib.auth.models import User
+from django.contrib.auth.models import Permission
+from django.urls import reverse
+from django.core.cache import cache
+
+CATALOG_TABLES = ('catalog_book', 'catalog_author', 'catalog_bookavailability', 'catalog_book_category')
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTest(TestCase):
+    """
+    Runs each view and checks with EXPLAIN QUERY PLAN that its catalog
+    queries are index searches rather than table scans or sorts.
+    """
+
+    def setUp(self):
+        # Page versions are cached across tests, while the database is rolled back.
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='librarian', is_staff=True)
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        category = Category.objects.create(name='Fantastique')
+        cls.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        for book_id in range(12):
+            book = Book.objects.create(title='Book {0}'.format(book_id), year='1990', content='-',
+                                       isbn='ISBN{0}'.format(book_id), author=cls.author)
+            book.category.set([category])
+            for copy_id in range(2):
+                BookAvailability.objects.create(book=book, imprint='Plon', borrower=cls.librarian,
+                                                status='o' if copy_id else 'a',
+                                                due_back=datetime.date.today() + datetime.timedelta(days=book_id))
+        # No ANALYZE: without statistics SQLite plans as for large tables, which is what we want to check.
+        cls.book = Book.objects.first()
+
+    def plans_for(self, url, cursor=False):
+        self.client.force_login(self.librarian)
+        if cursor:
+            response = self.client.get(url)
+            url = url + '?cursor=' + response.context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        plans = {}
+        for query in context.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and any('"{0}"'.format(table) in sql for table in CATALOG_TABLES):
+                plans[sql] = query_plan(sql)
+        self.assertTrue(plans)
+        return plans
+
+    def assertUsesIndexes(self, url, cursor=False, allow_sort=False):
+        # Detail pages may sort the few rows belonging to one book or author.
+        for sql, plan in self.plans_for(url, cursor).items():
+            for step in plan:
+                if step.startswith('SCAN') and 'USING' not in step:
+                    self.fail('Table scan in {0!r} for {1}'.format(plan, sql))
+                if 'TEMP B-TREE' in step and not allow_sort:
+                    self.fail('Sort in {0!r} for {1}'.format(plan, sql))
+
+    def test_book_list(self):
+        self.assertUsesIndexes(reverse('books'))
+        self.assertUsesIndexes(reverse('books'), cursor=True)
+
+    def test_author_list(self):
+        for author_id in range(12):
+            Author.objects.create(first_name='A', last_name='Auteur {0}'.format(author_id))
+        self.assertUsesIndexes(reverse('authors'))
+        self.assertUsesIndexes(reverse('authors'), cursor=True)
+
+    def test_all_borrowed(self):
+        self.assertUsesIndexes(reverse('all-borrowed'))
+        self.assertUsesIndexes(reverse('all-borrowed'), cursor=True)
+
+    def test_my_borrowed(self):
+        self.assertUsesIndexes(reverse('my-borrowed'))
+        self.assertUsesIndexes(reverse('my-borrowed'), cursor=True)
+
+    def test_book_detail(self):
+        self.assertUsesIndexes(reverse('book-detail', args=[self.book.pk]), allow_sort=True)
+
+    def test_author_detail(self):
+        self.assertUsesIndexes(reverse('author-detail', args=[self.author.pk]), allow_sort=True)
+
+    def test_available_copies_count(self):
+        queryset = BookAvailability.objects.filter(status__exact='a')
+        sql, params = queryset.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN SELECT COUNT(*) FROM ({0})'.format(sql), params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any('availability_status_due_idx' in step for step in plan), plan)
+
@@ -3,7 +3,17 @@ from django.test import TestCase
 
 # Create your tests here.
 
-from catalog.models import Author, Category, Book
+import importlib
+import types
+from io import StringIO
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+
+from catalog.isbn import to_isbn13
+
+from catalog.models import Author, Category, Book, BookAvailability, CatalogCounters
 
 
 class AuthorModelTest(TestCase):
@@ -104,3 +114,153 @@ class BookModelTest(TestCase):
         book = Book.objects.get(id=1)
         max_length = book._meta.get_field('content').max_length
         self.assertEqual(max_length, 1000)
+
+
+class BookISBNTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Albert', last_name='Camus')
+
+    def book(self, isbn, **fields):
+        return Book(title='La Peste', year=1947, content='Oran', isbn=isbn, author=self.author, **fields)
+
+    def test_to_isbn13(self):
+        self.assertEqual(to_isbn13('978-2-07-036822-8'), '9782070368228')
+        self.assertEqual(to_isbn13('2-07-036822-X'), '9782070368228')
+        self.assertEqual(to_isbn13('0 306 40615 2'), '9780306406157')
+        for invalid in ('978-2-07-036822-7', '2070368228', '12345', '9772070368228', 'ISBN1'):
+            with self.assertRaises(ValueError):
+                to_isbn13(invalid)
+
+    def test_saved_as_isbn13_and_found_in_any_form(self):
+        book = self.book('2-07-036822-X')
+        book.save()
+        self.assertEqual(book.isbn, '9782070368228')
+        self.assertEqual(Book.objects.get(isbn='978-2-07-036822-8'), book)
+        # References which are not ISBNs are kept.
+        self.assertEqual(Book.objects.create(title='-', content='-', isbn='REF-1').isbn, 'REF-1')
+
+    def test_full_clean_checks_digits_and_uniqueness(self):
+        with self.assertRaises(ValidationError) as context:
+            self.book('978-2-07-036822-7').full_clean()
+        self.assertIn('isbn', context.exception.message_dict)
+        self.book('9782070368228').save()
+        with self.assertRaises(ValidationError) as context:
+            self.book('2070368229').full_clean()
+        self.assertIn('isbn', context.exception.message_dict)
+
+    def test_migration_normalizes_existing_rows(self):
+        Book.objects.bulk_create([self.book('A'), self.book('B'), self.book('C')])
+        for pk, isbn in zip(Book.objects.order_by('pk').values_list('pk', flat=True),
+                            ('2-07-036822-X', 'REF-2', '0-306-40615-2')):
+            # Raw values, as rows written before the migration.
+            with connection.cursor() as cursor:
+                cursor.execute('UPDATE catalog_book SET isbn = %s WHERE id = %s', [isbn, pk])
+        migration = importlib.import_module('catalog.migrations.0010_book_isbn13')
+        migration.normalize_isbns(apps, types.SimpleNamespace(connection=connection))
+        self.assertEqual(list(Book.objects.order_by('pk').values_list('isbn', flat=True)),
+                         ['9782070368228', 'REF-2', '9780306406157'])
+
+
+class CatalogCountersTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt',
+                                        isbn='2134567890', author=self.author)
+
+    def assertCounters(self, **expected):
+        counters = CatalogCounters.objects.get(pk=CatalogCounters.SINGLETON_ID)
+        for name, value in expected.items():
+            self.assertEqual(getattr(counters, name), value, name)
+        computed = CatalogCounters.compute()
+        self.assertEqual({name: getattr(counters, name) for name in computed}, computed)
+
+    def test_create_and_delete_are_counted(self):
+        self.assertCounters(num_books=1, num_authors=1, num_availabilities=0, num_availabilities_open=0)
+        copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+        BookAvailability.objects.create(book=self.book, imprint='Plon', status='o')
+        self.assertCounters(num_books=1, num_authors=1, num_availabilities=2, num_availabilities_open=1)
+        copy.delete()
+        self.assertCounters(num_books=1, num_authors=1, num_availabilities=1, num_availabilities_open=0)
+        BookAvailability.objects.all().delete()
+        self.book.delete()
+        self.author.delete()
+        self.assertCounters(num_books=0, num_authors=0, num_availabilities=0, num_availabilities_open=0)
+
+    def test_status_change_is_counted(self):
+        BookAvailability.objects.create(book=self.book, imprint='Plon', status='o')
+        copy = BookAvailability.objects.get()
+        copy.status = 'a'
+        copy.save()
+        copy.save()
+        self.assertCounters(num_availabilities=1, num_availabilities_open=1)
+        copy.status = 'o'
+        copy.save()
+        self.assertCounters(num_availabilities=1, num_availabilities_open=0)
+
+    def test_load_rebuilds_missing_row(self):
+        CatalogCounters.objects.all().delete()
+        self.assertEqual(CatalogCounters.load().num_books, 1)
+
+    def test_rebuild_counters_command_fixes_drift(self):
+        CatalogCounters.objects.update(num_books=42)
+        out = StringIO()
+        call_command('rebuild_counters', '--check', stdout=out)
+        self.assertIn('num_books: 42 -> 1', out.getvalue())
+        self.assertEqual(CatalogCounters.load().num_books, 42)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(CatalogCounters.load().num_books, 1)
+
+
+class BookCopyCountersTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt',
+                                        isbn='2134567890', author=self.author)
+        self.other = Book.objects.create(title='The Last Wish', year='1993', content='Geralt',
+                                         isbn='2134567891', author=self.author)
+
+    def assertCopies(self, book, total, available):
+        book.refresh_from_db()
+        self.assertEqual((book.total_copies, book.available_copies), (total, available))
+        self.assertFalse(Book.copy_counter_drift().exists())
+
+    def test_create_status_change_and_delete_are_counted(self):
+        copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+        BookAvailability.objects.create(book=self.book, imprint='Plon', status='o')
+        self.assertCopies(self.book, 2, 1)
+        copy.status = 'm'
+        copy.save()
+        copy.save()
+        self.assertCopies(self.book, 2, 0)
+        BookAvailability.objects.get(status__exact='o').delete()
+        self.assertCopies(self.book, 1, 0)
+
+    def test_move_to_another_book_is_counted(self):
+        copy = BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+        copy = BookAvailability.objects.get(pk=copy.pk)
+        copy.book = self.other
+        copy.save()
+        self.assertCopies(self.book, 0, 0)
+        self.assertCopies(self.other, 1, 1)
+
+    def test_saving_a_loaded_book_keeps_the_counters(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+        stale.title = 'Sword of Destiny'
+        stale.save()
+        self.assertCopies(self.book, 1, 1)
+        self.assertEqual(self.book.title, 'Sword of Destiny')
+
+    def test_reconcile_copies_command_fixes_drift(self):
+        BookAvailability.objects.create(book=self.book, imprint='Plon', status='a')
+        Book.objects.filter(pk=self.book.pk).update(total_copies=5, available_copies=3)
+        out = StringIO()
+        call_command('reconcile_copies', '--check', stdout=out)
+        self.assertIn('{0}: 3/5 -> 1/1'.format(self.book.pk), out.getvalue())
+        self.assertIn('1 livre(s) à corriger', out.getvalue())
+        call_command('reconcile_copies', '--batch-size', '1', stdout=StringIO())
+        self.assertCopies(self.book, 1, 1)
+        self.assertCopies(self.other, 0, 0)
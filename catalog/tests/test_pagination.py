@@ -0,0 +1,97 @@
+from django.test import TestCase
+
+# Create your tests here.
+
+import datetime
+
+from catalog.models import BookAvailability, Book, Author
+from django.contrib.auth.models import User
+from django.contrib.auth.models import Permission
+from django.urls import reverse
+
+
+class AuthorCursorPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Duplicated names so the id tiebreaker is exercised across page boundaries.
+        for author_id in range(25):
+            Author.objects.create(first_name='Andrzej {0}'.format(author_id % 2),
+                                  last_name='Sapkowski {0}'.format(author_id % 7))
+
+    def walk(self, url):
+        pages = []
+        response = self.client.get(url)
+        pages.append(list(response.context['author_list']))
+        while response.context['page_obj'].next_cursor:
+            response = self.client.get(url, {'cursor': response.context['page_obj'].next_cursor})
+            pages.append(list(response.context['author_list']))
+        return pages, response
+
+    def test_first_page_is_cursor_paginated(self):
+        response = self.client.get(reverse('authors'))
+        self.assertTrue(response.context['is_paginated'])
+        self.assertTrue(response.context['page_obj'].cursor_paginated)
+        self.assertFalse(response.context['page_obj'].has_previous())
+        self.assertEqual(len(response.context['author_list']), 10)
+
+    def test_forward_walk_returns_every_author_in_order(self):
+        pages, _ = self.walk(reverse('authors'))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        authors = [author for page in pages for author in page]
+        self.assertEqual(authors, list(Author.objects.order_by('last_name', 'first_name', 'id')))
+
+    def test_backward_walk_returns_previous_pages(self):
+        pages, response = self.walk(reverse('authors'))
+        cursor = response.context['page_obj'].previous_cursor
+        response = self.client.get(reverse('authors'), {'cursor': cursor})
+        self.assertEqual(list(response.context['author_list']), pages[1])
+        response = self.client.get(reverse('authors'), {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(response.context['author_list']), pages[0])
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_offset_pagination_still_available(self):
+        response = self.client.get(reverse('authors') + '?page=3')
+        self.assertEqual(len(response.context['author_list']), 5)
+        self.assertEqual(response.context['page_obj'].number, 3)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('authors'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class LoanCursorPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='librarian')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890',
+                                   author=author)
+        for copy_id in range(23):
+            # A few loans without a due date, sorted first.
+            due_back = None if copy_id < 3 else datetime.date.today() + datetime.timedelta(days=copy_id % 4)
+            BookAvailability.objects.create(book=book, imprint='Plon, 2016', due_back=due_back,
+                                            borrower=cls.librarian, status='o')
+
+    def test_walk_covers_all_loans_including_null_due_dates(self):
+        self.client.force_login(self.librarian)
+        seen = []
+        response = self.client.get(reverse('all-borrowed'))
+        seen.extend(response.context['bookavailability_list'])
+        while response.context['page_obj'].next_cursor:
+            response = self.client.get(reverse('all-borrowed'),
+                                       {'cursor': response.context['page_obj'].next_cursor})
+            seen.extend(response.context['bookavailability_list'])
+
+        self.assertEqual(len(seen), 23)
+        self.assertEqual(len(set(copy.pk for copy in seen)), 23)
+        self.assertEqual([copy.due_back for copy in seen[:3]], [None, None, None])
+        dates = [copy.due_back for copy in seen[3:]]
+        self.assertEqual(dates, sorted(dates))
+
+        response = self.client.get(reverse('all-borrowed'),
+                                   {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(response.context['bookavailability_list']), seen[10:20])
@@ -0,0 +1,129 @@
+from django.test import TestCase
+
+# Query budgets: each view must run a fixed number of queries whatever the data size.
+
+import datetime
+
+from catalog.models import BookAvailability, Book, Category, Author, Hold
+from django.contrib.auth.models import User
+from django.contrib.auth.models import Permission
+from django.urls import reverse
+from django.core.cache import cache
+
+
+class ViewQueryBudgetTest(TestCase):
+
+    def setUp(self):
+        # Page versions are cached across tests, while the database is rolled back.
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='librarian', is_staff=True)
+        permission = Permission.objects.get(name='Set book as returned')
+        cls.librarian.user_permissions.add(permission)
+
+        cls.borrower = User.objects.create_user(username='borrower', password='borrower')
+
+        categories = [Category.objects.create(name='Category {0}'.format(i)) for i in range(3)]
+        cls.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        other_author = Author.objects.create(first_name='Terry', last_name='Pratchett')
+
+        for book_id in range(12):
+            book = Book.objects.create(
+                title='Book {0}'.format(book_id),
+                year='1990',
+                content='Contenu {0}'.format(book_id),
+                isbn='ISBN{0}'.format(book_id),
+                author=cls.author if book_id % 2 else other_author,
+            )
+            book.category.set(categories)
+            for copy_id in range(3):
+                BookAvailability.objects.create(
+                    book=book, imprint='Plon, 2016',
+                    due_back=datetime.date.today() + datetime.timedelta(days=copy_id),
+                    borrower=cls.borrower, status='o' if copy_id else 'a')
+
+        cls.book = Book.objects.filter(author=cls.author).first()
+        cls.copy = BookAvailability.objects.filter(status='o').first()
+
+    def login(self, user):
+        """Log `user` in and make a first request, caching its session, user and permissions."""
+        self.client.force_login(user)
+        self.client.get(reverse('index'))
+
+    def assertViewQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_index(self):
+        self.assertViewQueries(1, reverse('index'))
+
+    def test_book_list(self):
+        # books, category facets, decade facets
+        self.assertViewQueries(3, reverse('books'))
+
+    def test_book_list_next_page(self):
+        response = self.client.get(reverse('books'))
+        cursor = response.context['page_obj'].next_cursor
+        self.assertViewQueries(3, reverse('books') + '?cursor=' + cursor)
+
+    def test_book_list_filtered(self):
+        category = Category.objects.first()
+        self.assertViewQueries(3, reverse('books') + '?category={0}&year_min=1980&available=on'.format(category.pk))
+
+    def test_book_search(self):
+        response = self.assertViewQueries(2, reverse('book-search') + '?q=book')
+        self.assertEqual(len(response.context['book_list']), 10)
+
+    def test_book_detail(self):
+        # version, book + author, categories, copies
+        self.assertViewQueries(4, reverse('book-detail', args=[self.book.pk]))
+        self.assertViewQueries(0, reverse('book-detail', args=[self.book.pk]))
+
+    def test_author_list(self):
+        self.assertViewQueries(1, reverse('authors'))
+
+    def test_author_detail(self):
+        self.assertViewQueries(3, reverse('author-detail', args=[self.author.pk]))
+        self.assertViewQueries(0, reverse('author-detail', args=[self.author.pk]))
+
+    def test_my_borrowed(self):
+        self.login(self.borrower)
+        # only the page: session, user and permissions come from the cache
+        self.assertViewQueries(1, reverse('my-borrowed'))
+
+    def test_my_holds(self):
+        for book in Book.objects.all():
+            Hold.objects.create(book=book, patron=self.librarian)
+            Hold.objects.create(book=book, patron=self.borrower)
+        self.login(self.borrower)
+        # holds with their positions, reserved copies
+        response = self.assertViewQueries(2, reverse('my-holds'))
+        self.assertEqual([hold.position for hold in response.context['hold_list']], [2] * 10)
+
+    def test_all_borrowed(self):
+        self.login(self.librarian)
+        self.assertViewQueries(1, reverse('all-borrowed'))
+
+    def test_renew_book_librarian(self):
+        self.login(self.librarian)
+        self.assertViewQueries(1, reverse('renew-book-librarian', args=[self.copy.pk]))
+
+    def test_book_create(self):
+        self.login(self.librarian)
+        self.assertViewQueries(2, reverse('book-create'))
+
+    def test_book_update(self):
+        self.login(self.librarian)
+        self.assertViewQueries(4, reverse('book-update', args=[self.book.pk]))
+
+    def test_author_update(self):
+        self.login(self.librarian)
+        self.assertViewQueries(1, reverse('author-update', args=[self.author.pk]))
+
+    def test_book_delete(self):
+        self.login(self.librarian)
+        self.assertViewQueries(1, reverse('book-delete', args=[self.book.pk]))
@@ -0,0 +1,27 @@
+from django.test import TestCase
+
+# Create your tests here.
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class SqliteTuningTest(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA {0}'.format(name))
+            return cursor.fetchone()[0]
+
+    def test_connection_is_tuned(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -64000)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+
+    def test_pragmas_are_not_logged(self):
+        connection.close()
+        with CaptureQueriesContext(connection) as context:
+            connection.ensure_connection()
+        self.assertEqual(context.captured_queries, [])
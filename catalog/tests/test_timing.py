@@ -0,0 +1,86 @@
+from django.test import TestCase, override_settings
+
+# Create your tests here.
+
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import reverse
+
+from catalog import timing
+from catalog.models import Author, Book
+
+
+class TimingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        timing.stats.clear()
+        author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890',
+                                        author=author)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        header = response['Server-Timing']
+        queries = int(re.search(r'desc="(\d+) queries"', header).group(1))
+        self.assertGreater(queries, 0)
+        for name in ('db', 'db-slowest', 'tpl', 'total'):
+            self.assertRegex(header, r'\b{0};dur=\d+\.\d\d'.format(name))
+        self.assertGreater(float(re.search(r'tpl;dur=([\d.]+)', header).group(1)), 0)
+
+    @override_settings(ROOT_URLCONF='djanbrary.urls_async')
+    async def test_async_views(self):
+        response = await self.async_client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertGreater(int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1)), 0)
+        self.assertEqual(timing.stats.summary()[0]['route'], 'book-detail')
+
+    @override_settings(DEBUG=True)
+    def test_asgi_middleware_chain_is_not_adapted(self):
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    @override_settings(CATALOG_SERVER_TIMING=False)
+    def test_header_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('books')))
+
+    def test_route_statistics(self):
+        for _ in range(3):
+            self.client.get(reverse('books'))
+        self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.client.get(reverse('login'))
+
+        report = timing.stats.report()
+        hottest = report['hottest']
+        self.assertEqual([route['route'] for route in hottest], ['books', 'book-detail'])
+        books = hottest[0]
+        self.assertEqual((books['requests'], books['window']), (3, 3))
+        self.assertGreater(books['queries_mean'], 0)
+        self.assertIn('SELECT', books['slowest_sql']['sql'])
+        self.assertEqual(sum(bucket['count'] for bucket in books['histogram']), 3)
+        self.assertEqual(len(report['slowest']), 2)
+
+    def test_window_is_bounded(self):
+        stats = timing.RouteStats(window=2)
+        measures = timing.RequestTiming()
+        for total in (0.001, 0.002, 0.003):
+            stats.add('books', measures, total)
+        books, = stats.summary()
+        self.assertEqual((books['requests'], books['window'], books['max_ms']), (3, 2, 3.0))
+
+    def test_stats_pages_are_staff_only(self):
+        for name in ('timing-stats', 'timing-stats-json'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 302)
+        self.client.force_login(User.objects.create_user(username='user1', password='user1'))
+        self.assertEqual(self.client.get(reverse('timing-stats')).status_code, 302)
+
+        self.client.force_login(User.objects.create_user(username='staff', password='staff', is_staff=True))
+        self.client.get(reverse('books'))
+        response = self.client.get(reverse('timing-stats'))
+        self.assertContains(response, 'Routes les plus lentes')
+        self.assertContains(response, '<td>books</td>', count=2)
+        data = self.client.get(reverse('timing-stats-json'), {'limit': 1}).json()
+        self.assertEqual(len(data['hottest']), 1)
+        self.assertEqual(data['window'], timing.stats.window)
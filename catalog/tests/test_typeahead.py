@@ -0,0 +1,143 @@
+from django.test import TestCase
+
+# Create your tests here.
+
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+
+from catalog import typeahead
+from catalog.models import Author, Book, BookAvailability
+
+
+class PrefixIndexTest(TestCase):
+
+    def setUp(self):
+        self.index = typeahead.PrefixIndex()
+        self.index.load(typeahead.book_entries(1, 'Le Sorceleur', '978-2-35294-119-6', 1)
+                        + typeahead.book_entries(2, 'Les Étoiles', '9782070360024', 3)
+                        + typeahead.author_entries(3, 'Émile', 'Zola', 2))
+
+    def test_normalize(self):
+        self.assertEqual(typeahead.normalize('  Les   ÉTOILES '), 'les etoiles')
+
+    def test_case_and_accent_insensitive(self):
+        self.assertEqual(self.index.lookup('les eto'), [(typeahead.BOOK, 2, 'Les Étoiles')])
+        self.assertEqual(self.index.lookup('EMI'), [(typeahead.AUTHOR, 3, 'Émile Zola')])
+        self.assertEqual(self.index.lookup('zol'), [(typeahead.AUTHOR, 3, 'Émile Zola')])
+
+    def test_isbn_without_dashes(self):
+        self.assertEqual(self.index.lookup('97823'), [(typeahead.ISBN, 1, 'Le Sorceleur')])
+
+    def test_ranking_and_kinds(self):
+        self.assertEqual([pk for _, pk, _ in self.index.lookup('le')], [2, 1])
+        self.assertEqual(self.index.lookup('97', kinds={typeahead.ISBN}, limit=1), [(typeahead.ISBN, 2, 'Les Étoiles')])
+        self.assertEqual(self.index.lookup('le', kinds={typeahead.AUTHOR}), [])
+        self.assertEqual(self.index.lookup(' '), [])
+
+    def test_replace(self):
+        self.index.replace((typeahead.BOOK, typeahead.ISBN), 1, typeahead.book_entries(1, 'Le Temps du mépris', '1', 5))
+        self.assertEqual(self.index.lookup('le s'), [])
+        self.assertEqual(self.index.lookup('le'), [(typeahead.BOOK, 1, 'Le Temps du mépris'),
+                                                   (typeahead.BOOK, 2, 'Les Étoiles')])
+        self.index.replace((typeahead.BOOK, typeahead.ISBN), 2, [])
+        self.assertEqual(len(self.index), 4)
+
+    def test_large_ranges_keep_their_best_entries(self):
+        index = typeahead.PrefixIndex()
+        count = typeahead.SCAN_LIMIT + 10
+        index.load([entry for pk in range(count) for entry in typeahead.book_entries(pk, 'Livre {0}'.format(pk), '', pk)])
+        self.assertEqual([pk for _, pk, _ in index.lookup('liv', 3)], [count - 1, count - 2, count - 3])
+
+        index.replace((typeahead.BOOK,), count, typeahead.book_entries(count, 'Livre nouveau', '', count))
+        self.assertEqual([pk for _, pk, _ in index.lookup('liv', 2)], [count, count - 1])
+        index.replace((typeahead.BOOK,), count, [])
+        index.replace((typeahead.BOOK,), count - 1, [])
+        self.assertEqual([pk for _, pk, _ in index.lookup('liv', 2)], [count - 2, count - 3])
+
+
+class SuggestEndpointTest(TestCase):
+
+    def setUp(self):
+        # The sequence of changes is cached across tests, while the database is rolled back.
+        cache.clear()
+        self.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890',
+                                        author=self.author)
+        BookAvailability.objects.create(book=self.book, imprint='Bragelonne', status='a')
+
+    def suggest(self, **params):
+        return self.client.get(reverse('api-suggest'), params)
+
+    def test_suggestions(self):
+        self.assertEqual(self.suggest(q='the w').json()['results'], [{
+            'kind': 'book', 'id': self.book.pk, 'label': 'The Witcher', 'url': self.book.get_absolute_url()}])
+        self.assertEqual(self.suggest(q='sap').json()['results'][0]['url'], self.author.get_absolute_url())
+        self.assertEqual(self.suggest(q='213', kinds='author').json()['results'], [])
+        self.assertEqual(self.suggest(q='213', kinds='isbn').json()['results'][0]['kind'], 'isbn')
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.suggest(q='the', limit='x').status_code, 400)
+        self.assertEqual(self.suggest(q='the', kinds='editor').status_code, 400)
+
+    def test_limit_is_at_least_one(self):
+        Book.objects.create(title='The Last Wish', year='1993', content='-', isbn='1', author=self.author)
+        Book.objects.create(title='The Tower of Swallows', year='1997', content='-', isbn='2', author=self.author)
+        for limit in (0, -1):
+            self.assertEqual(len(self.suggest(q='the', limit=limit).json()['results']), 1)
+
+    def test_follows_changes(self):
+        self.suggest(q='the')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'La Dame du lac'
+            self.book.save()
+            Author.objects.create(first_name='Terry', last_name='Pratchett')
+        self.assertEqual(self.suggest(q='the').json()['results'], [])
+        self.assertEqual(self.suggest(q='la dame').json()['results'][0]['id'], self.book.pk)
+        self.assertEqual(self.suggest(q='pratch').json()['results'][0]['label'], 'Terry Pratchett')
+
+        self.book.bookavailability_set.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+        self.assertEqual(self.suggest(q='la dame').json()['results'], [])
+
+    def test_rebuilt_after_cache_clear(self):
+        self.suggest(q='the')
+        cache.clear()
+        Book.objects.create(title='Thé vert', year='2000', content='-', isbn='1', author=self.author)
+        self.assertEqual(len(self.suggest(q='the').json()['results']), 2)
+
+    def test_rebuilt_once_too_old(self):
+        self.suggest(q='the')
+        # Saved by a process with its own cache: the change isn't recorded in this one.
+        Book.objects.filter(pk=self.book.pk).update(title='La Dame du lac')
+        self.assertEqual(self.suggest(q='la dame').json()['results'], [])
+        with mock.patch('time.monotonic', return_value=time.monotonic() + typeahead.MAX_AGE + 1):
+            self.assertEqual(self.suggest(q='la dame').json()['results'][0]['id'], self.book.pk)
+
+    def test_warm_suggestions_make_no_query(self):
+        self.suggest(q='the')
+        with self.assertNumQueries(0):
+            self.suggest(q='wit')
+
+
+class BenchTypeaheadCommandTest(TestCase):
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'typeahead.json')
+            call_command('bench_typeahead', '--titles', '300', '--queries', '20', '--updates', '10',
+                         '--output', path, stdout=StringIO())
+            with open(path, encoding='utf-8') as stream:
+                report = json.load(stream)
+
+        self.assertEqual(report['entries'], 600)
+        self.assertEqual(set(report['lookups']), {str(length) for length in range(1, 9)})
+        self.assertEqual(report['updates']['count'], 10)
@@ -1,15 +1,29 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 # Create your tests here.
 
 
 import datetime
+import importlib
+import json
+import types
+from io import StringIO
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.db.migrations.loader import MigrationLoader
 from django.utils import timezone
 
-from catalog.models import BookAvailability, Book, Category, Author
+from catalog import async_views, views
+from catalog.models import BookAvailability, Book, Category, CategoryFacet, Author, YearFacet
+from catalog.exports import iter_rows
 from django.contrib.auth.models import User
 from django.contrib.auth.models import Permission
-from django.urls import reverse
+from django.urls import resolve, reverse
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 import uuid
 
 
@@ -291,4 +305,450 @@ class AuthorCreateViewTest(TestCase):
         login = self.client.login(username='user2', password='user2')
         response = self.client.get(reverse('author-create'))
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'catalog/author_form.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'catalog/author_form.html')
+
+class BookSearchViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        sapkowski = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.witcher = Book.objects.create(title='Le Sorceleur', year='1989', isbn='9782811200000',
+                                          content='Les aventures de Geralt de Riv', author=sapkowski)
+        cls.lotr = Book.objects.create(title='Le Seigneur des Anneaux', year='1954', isbn='9782266000000',
+                                       content='Frodon et l\'anneau unique, en Terre du Milieu', author=tolkien)
+        cls.hobbit = Book.objects.create(title='Bilbo le Hobbit', year='1937', isbn='9782253000000',
+                                         content='Le voyage de Bilbo vers le Mont Solitaire et son anneau',
+                                         author=tolkien)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('book-search'), dict(q=query, **params))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_uses_correct_template(self):
+        response = self.search('')
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+        self.assertEqual(response.context['book_list'], [])
+
+    def test_matches_title_content_isbn_and_author(self):
+        self.assertEqual(self.search('sorceleur').context['book_list'], [self.witcher])
+        self.assertEqual(self.search('geralt').context['book_list'], [self.witcher])
+        self.assertEqual(self.search('9782266000000').context['book_list'], [self.lotr])
+        self.assertCountEqual(self.search('tolkien').context['book_list'], [self.lotr, self.hobbit])
+
+    def test_all_words_must_match_as_prefixes(self):
+        self.assertEqual(self.search('tolk hob').context['book_list'], [self.hobbit])
+
+    def test_accents_are_ignored(self):
+        self.assertEqual(self.search('frodon terre milieu').context['book_list'], [self.lotr])
+        self.assertEqual(self.search('SORCÉLEUR').context['book_list'], [self.witcher])
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('anneaux').context['book_list'], [self.lotr])
+        self.assertEqual(self.search('anneau').context['book_list'][0], self.lotr)
+
+    def test_operators_are_plain_words(self):
+        self.assertEqual(self.search('"geralt" OR NEAR(').context['book_list'], [])
+        self.assertEqual(self.search('title:geralt').context['book_list'], [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.witcher.title = 'Le Dernier Voeu'
+        self.witcher.save()
+        self.assertEqual(self.search('voeu').context['book_list'], [self.witcher])
+        self.assertEqual(self.search('sorceleur').context['book_list'], [])
+
+        Author.objects.filter(last_name='Tolkien').update(last_name='Tolkien-Reuel')
+        self.assertCountEqual(self.search('reuel').context['book_list'], [self.lotr, self.hobbit])
+
+        self.hobbit.delete()
+        self.assertEqual(self.search('reuel').context['book_list'], [self.lotr])
+
+    def test_results_are_paginated(self):
+        for book_id in range(12):
+            Book.objects.create(title='Hobbit {0}'.format(book_id), year='2000', content='-',
+                                isbn='HOB{0}'.format(book_id))
+        first = self.search('hobbit')
+        self.assertEqual(len(first.context['book_list']), 10)
+        self.assertTrue(first.context['has_next'])
+        second = self.search('hobbit', page=2)
+        self.assertEqual(len(second.context['book_list']), 3)
+        self.assertFalse(second.context['has_next'])
+        self.assertTrue(second.context['has_previous'])
+
+    def test_pages_past_the_maximum_are_404(self):
+        self.assertEqual(self.search('hobbit', page=views.SEARCH_MAX_PAGE).context['book_list'], [])
+        for page in (views.SEARCH_MAX_PAGE + 1, '99999999999999999999999'):
+            response = self.client.get(reverse('book-search'), {'q': 'hobbit', 'page': page})
+            self.assertEqual(response.status_code, 404)
+
+
+class ExportViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user1', password='user1')
+        cls.librarian = User.objects.create_user(username='librarian', password='librarian')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        category = Category.objects.create(name='Fantastique')
+        for book_id in range(5):
+            book = Book.objects.create(title='The Witcher {0}'.format(book_id), year='1989', content='Geralt',
+                                       isbn='ISBN{0}'.format(book_id), author=author)
+            book.category.set([category])
+            BookAvailability.objects.create(book=book, imprint='Plon, 2016', status='o', borrower=cls.user,
+                                            due_back=datetime.date(2030, 1, 1))
+
+    def export(self, dataset, file_format):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('catalog-export', args=[dataset, file_format]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_forbidden_without_permission(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('catalog-export', args=['loans', 'csv']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_dataset_is_404(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('catalog-export', args=['users', 'csv']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_books_csv(self):
+        lines = self.export('books', 'csv').splitlines()
+        self.assertEqual(lines[0], 'id,isbn,title,year,author_id,author__last_name,author__first_name,categories')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].endswith(',The Witcher 0,1989,{0},Sapkowski,Andrzej,Fantastique'.format(
+            Author.objects.get().pk)))
+
+    def test_loans_jsonl(self):
+        rows = [json.loads(line) for line in self.export('loans', 'jsonl').splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['borrower__username'], 'user1')
+        self.assertEqual(rows[0]['due_back'], '2030-01-01')
+
+    @override_settings(ROOT_URLCONF='djanbrary.urls_async')
+    def test_asgi_export(self):
+        self.client.force_login(self.librarian)
+        url = reverse('catalog-export', args=['books', 'csv'])
+        self.assertIs(resolve(url).func, async_views.export)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': url, 'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80), 'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', 'sessionid={0}'.format(self.client.cookies['sessionid'].value).encode()),
+            ],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        # As the test client, keep the connection of the test transaction.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        async_to_sync(ASGIHandler())(scope, receive, send)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn((b'Content-Disposition', b'attachment; filename="books.csv"'), messages[0]['headers'])
+        lines = b''.join(message.get('body', b'') for message in messages[1:]).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[5].startswith('{0},'.format(Book.objects.order_by('pk').last().pk)))
+
+    def test_chunks_cover_every_row_once(self):
+        rows = list(iter_rows('loans', chunk_size=2))
+        self.assertEqual(len({row['id'] for row in rows}), 5)
+
+
+class BookFacetsTest(TestCase):
+
+    def setUp(self):
+        self.fantasy = Category.objects.create(name='Fantasy')
+        self.novel = Category.objects.create(name='Roman')
+        for book_id, (year, categories, status) in enumerate([
+                (1986, [self.fantasy], 'a'), (1989, [self.fantasy, self.novel], 'o'), (1993, [self.novel], 'a')]):
+            book = Book.objects.create(title='Book {0}'.format(book_id), year=year, content='-',
+                                       isbn='ISBN{0}'.format(book_id))
+            book.category.set(categories)
+            BookAvailability.objects.create(book=book, imprint='Plon', status=status)
+        call_command('refresh_facets', stdout=StringIO())
+
+    def titles(self, **params):
+        return [book.title for book in self.client.get(reverse('books'), params).context['book_list']]
+
+    def test_facet_tables(self):
+        self.assertEqual(list(CategoryFacet.objects.order_by('category__name').values_list('num_books', 'num_available')),
+                         [(2, 1), (2, 1)])
+        self.assertEqual(list(YearFacet.objects.values_list('year', 'num_books', 'num_available')),
+                         [(1986, 1, 1), (1989, 1, 0), (1993, 1, 1)])
+
+    def test_migration_fills_the_tables(self):
+        CategoryFacet.objects.all().delete()
+        YearFacet.objects.all().delete()
+        migration = importlib.import_module('catalog.migrations.0011_populate_facets')
+        # With the models as they were at that migration.
+        state = MigrationLoader(connection).project_state(('catalog', '0011_populate_facets'))
+        migration.populate_facets(state.apps, types.SimpleNamespace(connection=connection))
+        self.assertEqual(CategoryFacet.objects.count(), 2)
+        self.assertEqual(list(YearFacet.objects.values_list('year', 'num_books', 'num_available')),
+                         [(1986, 1, 1), (1989, 1, 0), (1993, 1, 1)])
+
+    def test_filters(self):
+        self.assertEqual(self.titles(category=self.fantasy.pk), ['Book 0', 'Book 1'])
+        self.assertEqual(self.titles(year_min=1987, year_max=1999), ['Book 1', 'Book 2'])
+        self.assertEqual(self.titles(available='on'), ['Book 0', 'Book 2'])
+        self.assertEqual(self.titles(category=self.novel.pk, available='on', year_max=1990), [])
+
+    def test_invalid_year_range_is_ignored(self):
+        response = self.client.get(reverse('books'), {'year_min': 2000, 'year_max': 1990})
+        self.assertEqual(len(response.context['book_list']), 3)
+        self.assertContains(response, "Période invalide")
+
+    def test_out_of_range_filters_are_ignored(self):
+        for params in ({'year_min': '99999999999999999999999'}, {'year_max': -10000},
+                       {'category': '99999999999999999999999'}):
+            response = self.client.get(reverse('books'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['book_list']), 3)
+
+    def test_facet_counts_and_links(self):
+        response = self.client.get(reverse('books'), {'category': self.fantasy.pk})
+        self.assertEqual([(facet['name'], facet['count'], facet['selected']) for facet in response.context['category_facets']],
+                         [('Fantasy', 2, True), ('Roman', 2, False)])
+        self.assertEqual([(facet['decade'], facet['count']) for facet in response.context['decade_facets']],
+                         [(1990, 1), (1980, 2)])
+        self.assertContains(response, 'href="?category={0}&amp;year_min=1980&amp;year_max=1989"'.format(self.fantasy.pk))
+
+        response = self.client.get(reverse('books'), {'available': 'on'})
+        self.assertEqual([facet['count'] for facet in response.context['decade_facets']], [1, 1])
+
+    def test_pagination_keeps_filters(self):
+        for book_id in range(3, 13):
+            Book.objects.create(title='Book {0}'.format(book_id), year=1986, content='-', isbn='ISBN{0}'.format(book_id))
+        response = self.client.get(reverse('books'), {'year_max': 1989})
+        cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, '?year_max=1989&amp;cursor=')
+        self.assertEqual(self.titles(year_max=1989, cursor=cursor), ['Book 8', 'Book 9'])
+
+
+class ConditionalDetailViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890',
+                                        author=self.author)
+        self.copy = BookAvailability.objects.create(book=self.book, imprint='Plon, 2016', status='a')
+
+    def test_etag_and_last_modified_headers(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response.headers)
+        self.assertIn('Last-Modified', response.headers)
+        self.assertIn('Cookie', response.headers['Vary'])
+
+    def test_not_modified_without_queries(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        etag = self.client.get(url).headers['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_copy_change_invalidates_book_and_author_pages(self):
+        book_url = reverse('book-detail', args=[self.book.pk])
+        author_url = reverse('author-detail', args=[self.author.pk])
+        book_etag = self.client.get(book_url).headers['ETag']
+        author_etag = self.client.get(author_url).headers['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.copy.status = 'o'
+            self.copy.save()
+
+        response = self.client.get(book_url, HTTP_IF_NONE_MATCH=book_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'En location')
+        self.assertEqual(self.client.get(author_url, HTTP_IF_NONE_MATCH=author_etag).status_code, 200)
+
+    def test_author_rename_invalidates_book_page(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'Sapkowski')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.last_name = 'Sapkowsky'
+            self.author.save()
+        self.assertContains(self.client.get(url), 'Sapkowsky')
+
+    def test_category_change_invalidates_book_page(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.category.add(Category.objects.create(name='Fantastique'))
+        self.assertContains(self.client.get(url), 'Fantastique')
+
+    def test_deleted_book_is_404(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.copy.delete()
+            self.book.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_logged_in_pages_are_not_shared(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        anonymous_etag = self.client.get(url).headers['ETag']
+        user = User.objects.create_user(username='user1', password='user1')
+        self.client.force_login(user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=anonymous_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'user1')
+        # Pages showing the user must not be stored by shared caches.
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])['Cache-Control'],
+                         'private, no-cache')
+
+    def test_invalidation_waits_for_commit(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        etag = self.client.get(url).headers['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.copy.status = 'o'
+            self.copy.save()
+            # Until the commit, the cached version is still the committed one.
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'En location')
+
+
+@override_settings(ROOT_URLCONF='djanbrary.urls_async')
+class AsyncViewsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.books = [Book.objects.create(title='The Witcher {0:02d}'.format(book_id), year='1989', content='Geralt',
+                                          isbn='21345678{0:02d}'.format(book_id), author=self.author)
+                      for book_id in range(13)]
+        BookAvailability.objects.create(book=self.books[0], imprint='Plon, 2016', status='a')
+
+    def test_read_only_pages_are_async(self):
+        self.assertIs(resolve(reverse('books')).func, async_views.book_list)
+        self.assertIs(resolve(reverse('book-detail', args=[self.books[0].pk])).func, async_views.book_detail)
+        self.assertIs(resolve(reverse('author-create')).func.view_class, views.AuthorCreate)
+
+    async def test_index(self):
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_books'], 13)
+        self.assertEqual(response.context['num_availabilities_open'], 1)
+
+    async def test_book_list_cursor_pages(self):
+        response = await self.async_client.get(reverse('books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual([book.title for book in response.context['book_list']],
+                         ['The Witcher {0:02d}'.format(book_id) for book_id in range(10)])
+
+        response = await self.async_client.get(reverse('books'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual([book.title for book in response.context['book_list']],
+                         ['The Witcher 10', 'The Witcher 11', 'The Witcher 12'])
+        self.assertTrue(response.context['page_obj'].has_previous())
+
+    async def test_book_list_offset_page(self):
+        response = await self.async_client.get(reverse('books'), {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 3)
+
+    async def test_book_list_filters(self):
+        response = await self.async_client.get(reverse('books'), {'year_min': 1990})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 0)
+
+    async def test_book_detail_conditional(self):
+        url = reverse('book-detail', args=[self.books[0].pk])
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Plon, 2016')
+        # AsyncClient takes raw ASGI header names.
+        response = await self.async_client.get(url, **{'if-none-match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_missing_detail_is_404(self):
+        response = await self.async_client.get(reverse('author-detail', args=[self.author.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_author_detail(self):
+        response = await self.async_client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'The Witcher 12')
+
+    def test_logged_in_librarian_sidebar(self):
+        user = User.objects.create_user(username='librarian', password='librarian', is_staff=True)
+        user.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.force_login(user)
+        response = self.client.get(reverse('authors'))
+        self.assertContains(response, 'librarian')
+        self.assertContains(response, 'Tous les emprunts')
+
+
+class FragmentCacheTest(TestCase):
+    """Logged in users get no page cache, but the stable fragments of their pages are cached."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user1', password='user1')
+        self.client.force_login(self.user)
+        self.author = Author.objects.create(first_name='Andrzej', last_name='Sapkowski')
+        self.book = Book.objects.create(title='The Witcher', year='1989', content='Geralt', isbn='2134567890',
+                                        author=self.author)
+        self.copy = BookAvailability.objects.create(book=self.book, imprint='Plon, 2016', status='a')
+
+    def test_copies_fragment_is_cached_per_book_version(self):
+        self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.book.refresh_from_db()
+        key = make_template_fragment_key('book_copies', [self.book.pk, self.book.updated_at, self.user.pk, False])
+        self.assertIn('Plon, 2016', cache.get(key))
+
+    def test_copy_change_is_never_served_stale(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'Emprunter')
+        self.copy.status = 'd'
+        self.copy.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'En attente')
+        self.assertNotContains(response, 'Emprunter')
+
+    def test_checkout_changes_copies_fragment(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'Réserver')
+        self.client.post(reverse('checkout-book', args=[self.copy.pk]))
+        self.assertNotContains(self.client.get(url), 'Réserver')
+
+    def test_csrf_token_is_outside_the_fragment(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.client.get(url)
+        self.client.force_login(User.objects.create_user(username='user2', password='user2'))
+        response = self.client.get(url)
+        self.assertContains(response, 'csrfmiddlewaretoken', count=1)
+        self.assertContains(response, response.context['csrf_token'])
+
+    def test_bibliography_follows_book_changes(self):
+        url = reverse('author-detail', args=[self.author.pk])
+        self.assertContains(self.client.get(url), 'The Witcher')
+        self.book.title = 'The Last Wish'
+        self.book.save()
+        self.assertContains(self.client.get(url), 'The Last Wish')
+        BookAvailability.objects.create(book=self.book, imprint='Plon, 2017', status='a')
+        self.assertContains(self.client.get(url), '(2 sur 2 exemplaires disponibles)')
+
+    def test_staff_sidebar_per_permission_set(self):
+        url = reverse('authors')
+        self.assertNotContains(self.client.get(url), 'Tous les emprunts')
+        librarian = User.objects.create_user(username='librarian', password='librarian', is_staff=True)
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.force_login(librarian)
+        self.assertContains(self.client.get(url), 'Tous les emprunts')
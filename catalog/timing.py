@@ -0,0 +1,157 @@
+import collections
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+from .benchmark import percentile
+
+# Timings of the request being served, see TimingMiddleware. A context variable
+# also reaches the threads sync_to_async runs the queries of the async views in.
+_current = contextvars.ContextVar('catalog_request_timing', default=None)
+
+# Upper bounds, in ms, of the buckets of the route histograms.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class RequestTiming:
+    """Time spent by one request in SQL and in template rendering, in seconds."""
+    __slots__ = ('started', 'queries', 'sql', 'slowest', 'slowest_sql', 'template')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+        self.template = 0.0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self, total):
+        """Value of the Server-Timing header, durations in ms."""
+        return ('db;dur={0:.2f};desc="{1} queries", db-slowest;dur={2:.2f}, tpl;dur={3:.2f}, '
+                'total;dur={4:.2f}'.format(self.sql * 1000, self.queries, self.slowest * 1000,
+                                           self.template * 1000, total * 1000))
+
+
+def start():
+    """Record the timings of the current request until `stop`, return the token `stop` needs."""
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def record_sql(execute, sql, params, many, context):
+    """Execute wrapper, installed on every connection by catalog.signals."""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        timing.queries += 1
+        timing.sql += duration
+        if duration > timing.slowest:
+            timing.slowest = duration
+            timing.slowest_sql = sql
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend adding the render time of each template to the request timings."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class RouteStats:
+    """
+    Timings of the last `window` requests of each route, kept in memory: every
+    process has its own. Recording appends to a bounded deque; percentiles and
+    histograms are only computed when read.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, timing, total):
+        sample = (total, timing.sql, timing.queries, timing.template, timing.slowest, timing.slowest_sql)
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = [0, collections.deque(maxlen=self.window)]
+            entry[0] += 1
+            entry[1].append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def summary(self):
+        """Statistics of each route, durations in ms."""
+        with self._lock:
+            routes = {route: (count, list(samples)) for route, (count, samples) in self._routes.items()}
+        return [self._summarize(route, count, samples) for route, (count, samples) in routes.items()]
+
+    def _summarize(self, route, count, samples):
+        totals = [sample[0] * 1000 for sample in samples]
+        slowest = max(samples, key=lambda sample: sample[4])
+        histogram = collections.Counter(next((bound for bound in BUCKETS_MS if duration <= bound), None)
+                                        for duration in totals)
+
+        def mean(index, scale=1000):
+            return round(sum(sample[index] for sample in samples) / len(samples) * scale, 3)
+
+        return {
+            'route': route,
+            'requests': count,
+            'window': len(samples),
+            'mean_ms': round(sum(totals) / len(totals), 3),
+            'p50_ms': round(percentile(totals, 0.50), 3),
+            'p95_ms': round(percentile(totals, 0.95), 3),
+            'p99_ms': round(percentile(totals, 0.99), 3),
+            'max_ms': round(max(totals), 3),
+            'queries_mean': mean(2, scale=1),
+            'sql_ms_mean': mean(1),
+            'template_ms_mean': mean(3),
+            'slowest_sql': {'ms': round(slowest[4] * 1000, 3), 'sql': slowest[5]},
+            'histogram': [{'le_ms': bound, 'count': histogram[bound]} for bound in BUCKETS_MS + (None,)],
+        }
+
+    def report(self, limit=10):
+        """The `limit` most requested routes and the `limit` slowest ones, by p95."""
+        routes = self.summary()
+        return {
+            'window': self.window,
+            'hottest': sorted(routes, key=lambda route: route['requests'], reverse=True)[:limit],
+            'slowest': sorted(routes, key=lambda route: route['p95_ms'], reverse=True)[:limit],
+        }
+
+
+stats = RouteStats(getattr(settings, 'CATALOG_TIMING_WINDOW', 1000))
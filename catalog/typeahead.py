@@ -0,0 +1,246 @@
+"""
+In-process prefix index of book titles, ISBNs and author names, for the
+suggestions endpoint and the admin autocomplete.
+
+The index is a sorted array of normalized keys with parallel arrays of
+references and ranks: a prefix lookup is a binary search then a walk of the
+matching range, and needs no query. Each process builds its own on first use,
+then follows the changes recorded by catalog.signals in the cache
+(record_change), reloading only the objects that changed. With a cache per
+process (LocMemCache) the changes of the other processes are not seen: the
+index is also rebuilt once older than CATALOG_TYPEAHEAD_MAX_AGE.
+"""
+import array
+import bisect
+import heapq
+import random
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .caching import CACHE_TIMEOUT
+from .models import Author, Book
+
+BOOK, ISBN, AUTHOR = 0, 1, 2
+KINDS = {BOOK: 'book', ISBN: 'isbn', AUTHOR: 'author'}
+
+# Matching ranges longer than this are not scanned on every lookup: their
+# TOP_SIZE best entries are kept, and maintained by replace.
+SCAN_LIMIT = 500
+TOP_SIZE = 50
+
+# Changes a process applies one by one before rebuilding its index instead.
+MAX_CHANGES = 1000
+
+# Seconds after which an index is rebuilt whatever the recorded changes.
+MAX_AGE = getattr(settings, 'CATALOG_TYPEAHEAD_MAX_AGE', 300)
+
+SEQUENCE_KEY = 'catalog:typeahead:sequence'
+
+
+def change_key(sequence):
+    return 'catalog:typeahead:change:{0}'.format(sequence)
+
+
+def normalize(text):
+    """Case and accent insensitive form of `text`, with single spaces."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(char for char in text if not unicodedata.combining(char)).split())
+
+
+def current_sequence():
+    """Number of the last recorded change."""
+    sequence = cache.get(SEQUENCE_KEY)
+    if sequence is None:
+        # A random start, so that an index built before the cache was cleared can't take the changes
+        # recorded since for the ones it already applied.
+        cache.add(SEQUENCE_KEY, random.randrange(2 ** 48), None)
+        sequence = cache.get(SEQUENCE_KEY)
+    return sequence
+
+
+def record_change(model, pk):
+    """Tell the indexes of every process that an object changed."""
+    kind = AUTHOR if model is Author else BOOK
+    try:
+        sequence = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        current_sequence()
+        sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(change_key(sequence), (kind, pk), CACHE_TIMEOUT)
+
+
+class PrefixIndex:
+    """Sorted (key, reference, rank, label) entries; a reference is pk * 4 + kind."""
+
+    def __init__(self):
+        self.keys = []
+        self.labels = []
+        self.refs = array.array('q')
+        self.ranks = array.array('q')
+        self.entries = {}
+        self._top = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def entries_of(kind, pk, rank, label, *texts):
+        keys = {normalize(text) for text in texts if text}
+        return [(key, pk * 4 + kind, rank, label) for key in keys if key]
+
+    def load(self, entries):
+        """Replace the content of the index by `entries`, (key, reference, rank, label) tuples."""
+        entries = sorted(entries, key=lambda entry: (entry[0], entry[1]))
+        with self._lock:
+            self.keys = [entry[0] for entry in entries]
+            self.labels = [entry[3] for entry in entries]
+            self.refs = array.array('q', (entry[1] for entry in entries))
+            self.ranks = array.array('q', (entry[2] for entry in entries))
+            self.entries = {}
+            for key, ref, _, _ in entries:
+                self.entries.setdefault(ref >> 2, {}).setdefault(ref & 3, []).append(key)
+            self._top = {}
+
+    def replace(self, kind_group, pk, entries):
+        """Replace the entries of an object, `kind_group` being the kinds it owns."""
+        with self._lock:
+            owned = self.entries.get(pk, {})
+            for kind in kind_group:
+                for key in owned.pop(kind, []):
+                    self._remove(key, pk * 4 + kind)
+            for key, ref, rank, label in entries:
+                index = bisect.bisect_right(self.keys, key)
+                self.keys.insert(index, key)
+                self.labels.insert(index, label)
+                self.refs.insert(index, ref)
+                self.ranks.insert(index, rank)
+                owned.setdefault(ref & 3, []).append(key)
+                self._add_top(key, ref, rank, label)
+            if owned:
+                self.entries[pk] = owned
+            else:
+                self.entries.pop(pk, None)
+
+    def _remove(self, key, ref):
+        index = bisect.bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.refs[index] == ref:
+                del self.keys[index], self.labels[index], self.refs[index], self.ranks[index]
+                self._remove_top(key, ref)
+                return
+            index += 1
+
+    def _add_top(self, key, ref, rank, label):
+        # A new entry only displaces the last of the kept results it beats.
+        for length in range(1, len(key) + 1):
+            for kinds, top in self._top.get(key[:length], {}).items():
+                if kinds is None or ref & 3 in kinds:
+                    bisect.insort(top, (-rank, key, ref, label))
+                    del top[TOP_SIZE:]
+
+    def _remove_top(self, key, ref):
+        # A removed entry leaves a hole only the next lookup can fill.
+        for length in range(1, len(key) + 1):
+            tops = self._top.get(key[:length], {})
+            for kinds in [kinds for kinds, top in tops.items() if any(entry[2] == ref for entry in top)]:
+                del tops[kinds]
+
+    def lookup(self, prefix, limit=10, kinds=None):
+        """Best ranked entries whose key starts with `prefix`: (kind, pk, label) tuples."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        kinds = None if kinds is None else frozenset(kinds)
+        with self._lock:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + '\U0010ffff', start)
+            large = end - start > SCAN_LIMIT and limit <= TOP_SIZE
+            top = self._top.get(prefix, {}).get(kinds) if large else None
+            if top is None:
+                positions = range(start, end)
+                if kinds is not None:
+                    positions = (index for index in positions if self.refs[index] & 3 in kinds)
+                top = [(-self.ranks[index], self.keys[index], self.refs[index], self.labels[index])
+                       for index in self._best(positions, TOP_SIZE if large else limit)]
+                if large:
+                    self._top.setdefault(prefix, {})[kinds] = top
+            return [(ref & 3, ref >> 2, label) for _, _, ref, label in top[:limit]]
+
+    def _best(self, positions, limit):
+        keys, refs, ranks = self.keys, self.refs, self.ranks
+        return heapq.nsmallest(limit, positions, key=lambda index: (-ranks[index], keys[index], refs[index]))
+
+
+def book_entries(book_id, title, isbn, rank):
+    return (PrefixIndex.entries_of(BOOK, book_id, rank, title, title)
+            + PrefixIndex.entries_of(ISBN, book_id, rank, title, isbn.replace('-', '')))
+
+
+def author_entries(author_id, first_name, last_name, rank):
+    label = '{0} {1}'.format(first_name, last_name).strip()
+    return PrefixIndex.entries_of(AUTHOR, author_id, rank, label,
+                                  '{0} {1}'.format(last_name, first_name), '{0} {1}'.format(first_name, last_name))
+
+
+class CatalogIndex(PrefixIndex):
+    """PrefixIndex of the catalog: books ranked by number of copies, authors by number of books."""
+
+    def __init__(self):
+        super().__init__()
+        self.sequence = None
+        self.built_at = None
+
+    def build(self):
+        sequence = current_sequence()
+        entries = []
+        for pk, title, isbn, rank in Book.objects.values_list('pk', 'title', 'isbn', 'total_copies').iterator():
+            entries.extend(book_entries(pk, title, isbn, rank))
+        for pk, first_name, last_name, rank in self.authors().values_list('pk', 'first_name', 'last_name', 'rank'):
+            entries.extend(author_entries(pk, first_name, last_name, rank))
+        self.load(entries)
+        self.sequence = sequence
+        self.built_at = time.monotonic()
+
+    def authors(self):
+        return Author.objects.annotate(rank=Count('book')).order_by()
+
+    def sync(self):
+        """Build the index, or apply the changes other processes recorded since the last call."""
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        sequence = current_sequence()
+        if (self.sequence is None or not 0 <= sequence - self.sequence <= MAX_CHANGES
+                or time.monotonic() - self.built_at > MAX_AGE):
+            return self.build()
+        if sequence == self.sequence:
+            return
+        changes = cache.get_many([change_key(number) for number in range(self.sequence + 1, sequence + 1)])
+        if len(changes) < sequence - self.sequence:
+            # Expired changes: start over.
+            return self.build()
+        self.sequence = sequence
+        books = {pk for kind, pk in changes.values() if kind == BOOK}
+        authors = {pk for kind, pk in changes.values() if kind == AUTHOR}
+        found = {pk: (title, isbn, rank) for pk, title, isbn, rank in
+                 Book.objects.filter(pk__in=books).values_list('pk', 'title', 'isbn', 'total_copies')}
+        for pk in books:
+            self.replace((BOOK, ISBN), pk, book_entries(pk, *found[pk]) if pk in found else [])
+        found = {pk: (first_name, last_name, rank) for pk, first_name, last_name, rank in
+                 self.authors().filter(pk__in=authors).values_list('pk', 'first_name', 'last_name', 'rank')}
+        for pk in authors:
+            self.replace((AUTHOR,), pk, author_entries(pk, *found[pk]) if pk in found else [])
+
+    def suggest(self, prefix, limit=10, kinds=None):
+        self.sync()
+        return self.lookup(prefix, limit, kinds)
+
+
+index = CatalogIndex()
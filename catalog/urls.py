@@ -1,19 +1,38 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
+    path('search/', views.book_search, name='book-search'),
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(), name='author-detail'),
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
+    path('myholds/', views.HoldsByUserListView.as_view(), name='my-holds'),
     path(r'borrowed/', views.LoanedBooksAllListView.as_view(), name='all-borrowed'),
+    path('borrowed/bulk/', views.bulk_circulation, name='all-borrowed-bulk'),
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('book/<uuid:pk>/checkout/', views.checkout_book, name='checkout-book'),
+    path('book/<uuid:pk>/reserve/', views.reserve_book, name='reserve-book'),
+    path('book/<uuid:pk>/return/', views.return_book, name='return-book'),
+    path('book/<int:pk>/hold/', views.place_hold, name='place-hold'),
+    path('hold/<int:pk>/cancel/', views.cancel_hold, name='cancel-hold'),
+    path('export/<str:dataset>.<str:file_format>', views.export, name='catalog-export'),
+    path('stats/', views.timing_stats, name='timing-stats'),
+    path('stats.json', views.timing_stats_json, name='timing-stats-json'),
     path('author/create/', views.AuthorCreate.as_view(), name='author-create'),
     path('author/<int:pk>/update/', views.AuthorUpdate.as_view(), name='author-update'),
     path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author-delete'),
     path('book/create/', views.BookCreate.as_view(), name='book-create'),
     path('book/<int:pk>/update/', views.BookUpdate.as_view(), name='book-update'),
     path('book/<int:pk>/delete/', views.BookDelete.as_view(), name='book-delete'),
-]
\ No newline at end of file
+    path('api/books/', api.book_list, name='api-books'),
+    path('api/books/<int:pk>', api.book_detail, name='api-book-detail'),
+    path('api/books/isbn/', api.books_by_isbn, name='api-books-isbn'),
+    path('api/authors/', api.author_list, name='api-authors'),
+    path('api/authors/<int:pk>', api.author_detail, name='api-author-detail'),
+    path('api/categories/', api.category_list, name='api-categories'),
+    path('api/copies/', api.copy_list, name='api-copies'),
+    path('api/suggest/', api.suggest, name='api-suggest'),
+]
@@ -1,82 +1,226 @@
 from django.shortcuts import render, get_object_or_404
 from django.views import generic
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse, reverse_lazy
-from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.auth.decorators import login_required, permission_required, user_passes_test
+from django.contrib import messages
+from django.views.decorators.http import require_POST
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
-from .models import Book, Author, BookAvailability, Category
-from catalog.forms import RenewBookForm
+from django.db.models import F, Prefetch, Sum
+from .models import Book, Author, BookAvailability, Category, CatalogCounters, CategoryFacet, Hold, YearFacet
+from catalog.forms import BookFilterForm, BulkCirculationForm, RenewBookForm
+from catalog import circulation, timing
+from catalog.pagination import KeysetPaginationMixin
+from catalog.caching import ConditionalDetailMixin
+from catalog.routers import reads_primary
+from catalog.search import search_books
+from catalog.exports import DATASETS, FORMATS, iter_lines
 import datetime
 
+def index_context(counters):
+    return {
+        'num_books': counters.num_books,
+        'num_availabilities': counters.num_availabilities,
+        'num_availabilities_open': counters.num_availabilities_open,
+        'num_authors': counters.num_authors,
+    }
+
 def index(request):
- 
-    num_books = Book.objects.all().count()
-    num_availabilities = BookAvailability.objects.all().count()
 
-    num_availabilities_open = BookAvailability.objects.filter(status__exact='a').count()
+    counters = CatalogCounters.load()
+
+    return render(request, 'index.html', context=index_context(counters))
+
+
+def book_list_context(form, params):
+    """
+    Facets of the book list: counts of the category and decade filters, read
+    from CategoryFacet and YearFacet, with the query strings selecting them.
+    """
+    data = form.cleaned_data if form.is_valid() else {}
+    count = 'num_available' if data.get('available') else 'num_books'
+    params = params.copy()
+    for name in (KeysetPaginationMixin.cursor_kwarg, 'page'):
+        params.pop(name, None)
+
+    def query(**changes):
+        query = params.copy()
+        for name, value in changes.items():
+            if value is None:
+                query.pop(name, None)
+            else:
+                query[name] = value
+        return query.urlencode()
+
+    category_facets = [
+        {'name': facet.category.name, 'count': getattr(facet, count), 'query': query(category=facet.category_id),
+         'selected': facet.category_id == data.get('category')}
+        for facet in CategoryFacet.objects.select_related('category').order_by('category__name')
+        if getattr(facet, count)
+    ]
+    decades = (YearFacet.objects.annotate(decade=F('year') / 10 * 10).values('decade')
+               .annotate(count=Sum(count)).filter(count__gt=0).order_by('-decade'))
+    decade_facets = [
+        {'decade': row['decade'], 'count': row['count'],
+         'query': query(year_min=row['decade'], year_max=row['decade'] + 9),
+         'selected': (data.get('year_min'), data.get('year_max')) == (row['decade'], row['decade'] + 9)}
+        for row in decades
+    ]
+    return {
+        'filter_form': form,
+        'category_facets': category_facets,
+        'decade_facets': decade_facets,
+        'all_categories_query': query(category=None),
+        'all_years_query': query(year_min=None, year_max=None),
+        'pagination_query': params.urlencode(),
+    }
 
-    num_authors = Author.objects.count()
 
-    context = {
-        'num_books': num_books,
-        'num_availabilities': num_availabilities,
-        'num_availabilities_open': num_availabilities_open,
-        'num_authors': num_authors,
-    }
+class BookListView(KeysetPaginationMixin, generic.ListView):
+    model = Book
+    paginate_by = 10
+    keyset_ordering = ('title', 'id')
+    queryset = Book.objects.select_related('author').order_by('title', 'id')
 
-    return render(request, 'index.html', context=context)
+    def get_queryset(self):
+        self.filter_form = BookFilterForm(self.request.GET)
+        return self.filter_form.filter(super().get_queryset())
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(book_list_context(self.filter_form, self.request.GET))
+        return context
 
-class BookListView(generic.ListView):
-    model = Book
+
+# Deepest search result page: ranking past it costs more than it serves.
+SEARCH_MAX_PAGE = 1000
+
+
+def book_search(request):
+    query = request.GET.get('q', '').strip()
     paginate_by = 10
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    if page > SEARCH_MAX_PAGE:
+        raise Http404
+
+    # One extra row tells whether a next page exists without counting matches.
+    book_list = search_books(query, paginate_by + 1, (page - 1) * paginate_by) if query else []
+
+    context = {
+        'query': query,
+        'book_list': book_list[:paginate_by],
+        'page': page,
+        'has_previous': page > 1,
+        'has_next': len(book_list) > paginate_by,
+    }
+
+    return render(request, 'catalog/book_search.html', context)
 
 
-class BookDetailView(generic.DetailView):
+class BookDetailView(ConditionalDetailMixin, generic.DetailView):
     model = Book
+    queryset = Book.objects.select_related('author').prefetch_related('category', 'bookavailability_set')
 
 
-class AuthorListView(generic.ListView):
+class AuthorListView(KeysetPaginationMixin, generic.ListView):
     model = Author
     paginate_by = 10
+    keyset_ordering = ('last_name', 'first_name', 'id')
+    queryset = Author.objects.order_by('last_name', 'first_name', 'id')
 
 
-class AuthorDetailView(generic.DetailView):
+class AuthorDetailView(ConditionalDetailMixin, generic.DetailView):
     model = Author
+    queryset = Author.objects.prefetch_related(Prefetch('book_set', queryset=Book.objects.order_by('title', 'id')))
 
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+class LoanedBooksByUserListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     model = BookAvailability
     template_name = 'catalog/bookavailability_list_borrowed_user.html'
     paginate_by = 10
+    reads_primary = True
+    keyset_ordering = ('due_back', 'id')
+
+    def get_queryset(self):
+        return (BookAvailability.objects.select_related('book')
+                .filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back', 'id'))
+
+class HoldsByUserListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
+    """The holds of the user with their position in the queue, and the copies reserved for the user."""
+    model = Hold
+    template_name = 'catalog/hold_list_user.html'
+    paginate_by = 10
+    reads_primary = True
+    keyset_ordering = ('id',)
 
     def get_queryset(self):
-        return BookAvailability.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        return Hold.with_position(Hold.objects.select_related('book').filter(patron=self.request.user).order_by('id'))
 
-class LoanedBooksAllListView(PermissionRequiredMixin, generic.ListView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['reserved_list'] = (BookAvailability.objects.select_related('book')
+                                    .filter(borrower=self.request.user).filter(status__exact='r').order_by('id'))
+        return context
+
+class LoanedBooksAllListView(PermissionRequiredMixin, KeysetPaginationMixin, generic.ListView):
     model = BookAvailability
     permission_required = 'catalog.can_mark_returned'
     template_name = 'catalog/bookavailability_list_borrowed_all.html'
     paginate_by = 10
+    reads_primary = True
+    keyset_ordering = ('due_back', 'id')
 
     def get_queryset(self):
-        return BookAvailability.objects.filter(status__exact='o').order_by('due_back')
+        return (BookAvailability.objects.select_related('book', 'borrower')
+                .filter(status__exact='o').order_by('due_back', 'id'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['bulk_form'] = BulkCirculationForm(
+            initial={'renewal_date': datetime.date.today() + circulation.LOAN_PERIOD})
+        return context
 
+
+@require_POST
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def bulk_circulation(request):
+    """Renew or return the copies selected in the list of all loans, with one update."""
+    form = BulkCirculationForm(request.POST)
+    if form.is_valid():
+        copies = form.cleaned_data['copies']
+        if form.cleaned_data['action'] == 'renew':
+            count = circulation.bulk_renew(copies, form.cleaned_data['renewal_date'])
+        else:
+            count = circulation.bulk_return(copies)
+        messages.success(request, '{0} exemplaire(s) traité(s) sur {1}.'.format(count, len(copies)))
+    else:
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+    return HttpResponseRedirect(reverse('all-borrowed'))
+
+@reads_primary
 @login_required
 @permission_required('catalog.can_mark_returned', raise_exception=True)
 def renew_book_librarian(request, pk):
-    book_availability = get_object_or_404(BookAvailability, pk=pk)
+    book_availability = get_object_or_404(BookAvailability.objects.select_related('book', 'borrower'), pk=pk)
 
     if request.method == 'POST':
 
         form = RenewBookForm(request.POST)
 
         if form.is_valid():
-            book_availability.due_back = form.cleaned_data['renewal_date']
-            book_availability.save()
-
-            return HttpResponseRedirect(reverse('all-borrowed'))
+            try:
+                circulation.renew(book_availability.pk, form.cleaned_data['renewal_date'])
+            except circulation.CirculationError as error:
+                form.add_error(None, str(error))
+            else:
+                return HttpResponseRedirect(reverse('all-borrowed'))
             
     else:
         proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
@@ -90,6 +234,92 @@ def renew_book_librarian(request, pk):
     return render(request, 'catalog/book_renew_librarian.html', context)
 
 
+def _circulate(request, pk, operation, *args):
+    book_id = get_object_or_404(BookAvailability.objects.only('book_id'), pk=pk).book_id
+    try:
+        operation(pk, *args)
+    except circulation.CirculationError as error:
+        messages.error(request, str(error))
+    return book_id
+
+
+@require_POST
+@login_required
+def checkout_book(request, pk):
+    book_id = _circulate(request, pk, circulation.checkout, request.user)
+    return HttpResponseRedirect(reverse('book-detail', args=[book_id]))
+
+
+@require_POST
+@login_required
+def reserve_book(request, pk):
+    book_id = _circulate(request, pk, circulation.reserve, request.user)
+    return HttpResponseRedirect(reverse('book-detail', args=[book_id]))
+
+
+@require_POST
+@login_required
+def place_hold(request, pk):
+    book = get_object_or_404(Book.objects.only('pk'), pk=pk)
+    try:
+        hold = circulation.place_hold(book.pk, request.user)
+    except circulation.CirculationError as error:
+        messages.error(request, str(error))
+    else:
+        if hold is None:
+            messages.success(request, 'Un exemplaire vous est réservé.')
+        else:
+            messages.success(request, "Vous êtes en position {0} dans la file d'attente.".format(hold.position_in_queue()))
+    return HttpResponseRedirect(reverse('my-holds'))
+
+
+@require_POST
+@login_required
+def cancel_hold(request, pk):
+    try:
+        circulation.cancel_hold(pk, request.user)
+    except circulation.CirculationError as error:
+        messages.error(request, str(error))
+    return HttpResponseRedirect(reverse('my-holds'))
+
+
+@require_POST
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def return_book(request, pk):
+    _circulate(request, pk, circulation.return_copy)
+    return HttpResponseRedirect(reverse('all-borrowed'))
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def export(request, dataset, file_format):
+    if dataset not in DATASETS or file_format not in FORMATS:
+        raise Http404
+
+    response = StreamingHttpResponse(iter_lines(dataset, file_format), content_type=FORMATS[file_format])
+    response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(dataset, file_format)
+    return response
+
+
+def _stats_limit(request):
+    try:
+        return max(1, int(request.GET.get('limit', 10)))
+    except ValueError:
+        return 10
+
+
+@user_passes_test(lambda user: user.is_staff)
+def timing_stats(request):
+    """Most requested and slowest routes of the catalog, measured by this process."""
+    return render(request, 'catalog/timing_stats.html', {'report': timing.stats.report(_stats_limit(request))})
+
+
+@user_passes_test(lambda user: user.is_staff)
+def timing_stats_json(request):
+    return JsonResponse(timing.stats.report(_stats_limit(request)))
+
+
 class AuthorCreate(PermissionRequiredMixin, CreateView):
     model = Author
     fields = ['first_name', 'last_name', 'biography']
@@ -44,7 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'catalog.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -53,19 +55,30 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'djanbrary.urls'
+# djanbrary/asgi.py switches to djanbrary.urls_async, which serves the async views.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'djanbrary.urls')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, also timing renders for catalog.middleware.TimingMiddleware.
+        'BACKEND': 'catalog.timing.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'catalog.context_processors.fragment_cache',
+            ],
+            # Compiled templates are kept in memory instead of being read and
+            # parsed on every render. The runserver autoreloader still clears
+            # them when a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -77,13 +90,99 @@ WSGI_APPLICATION = 'djanbrary.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Seconds a worker keeps its database connection between requests. ASGI
+# serves each request from a new thread, which can't reuse it: djanbrary/asgi.py
+# sets it to 0.
+CONN_MAX_AGE = int(os.environ.get('DJANGO_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        # On disk rather than in memory, so that tests running concurrent
+        # transactions get SQLite's real file locking.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Read replica of the primary. Locally, a copy of db.sqlite3 kept up to
+    # date with manage.py refresh_replicas.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_replica.sqlite3',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['catalog.routers.PrimaryReplicaRouter']
+
+# Applied to every new SQLite connection (see catalog.signals):
+# - WAL: readers no longer block the writer nor wait for it;
+# - synchronous NORMAL: with WAL, fsync at checkpoints only, still safe from corruption;
+# - busy_timeout: a writer waits up to 5s for the lock instead of failing with "database is locked";
+# - mmap_size and cache_size (negative: KiB): reads served from memory.
+CATALOG_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'memory',
+}
+
+# Aliases of the databases serving catalog reads, comma separated, for example
+# DJANGO_REPLICAS=replica. None by default: everything goes to the primary.
+CATALOG_REPLICAS = [alias for alias in os.environ.get('DJANGO_REPLICAS', '').split(',') if alias]
+
+# Seconds a client keeps reading from the primary after a write; should
+# exceed the replication lag.
+CATALOG_PRIMARY_PIN_SECONDS = 10
+
+# Send the SQL, template and total time of each request in a Server-Timing
+# header (see catalog.middleware.TimingMiddleware), readable in the network
+# panel of browsers. The per-route statistics keep the last
+# CATALOG_TIMING_WINDOW requests of each route.
+CATALOG_SERVER_TIMING = True
+CATALOG_TIMING_WINDOW = 1000
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Use a cache shared by all workers (Memcached, Redis) in production so that
+# invalidations reach every process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Seconds book/author page versions, rendered pages and template fragments are cached.
+CATALOG_CACHE_TIMEOUT = 300
+
+# Seconds after which each process rebuilds its suggestions index (catalog.typeahead).
+# The changes saved by other processes reach it through the cache, or, with a cache
+# per process (LocMemCache), only at this rebuild.
+CATALOG_TYPEAHEAD_MAX_AGE = 300
+
+
+# Sessions are read from the cache, and from the database only on a cache miss.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# ModelBackend caching users and their permissions, see catalog.auth.
+AUTHENTICATION_BACKENDS = ['catalog.auth.CachedModelBackend']
+
+# Seconds users and their permissions are cached. The process saving a change
+# forgets them at once; with a cache per process (LocMemCache) the other
+# processes keep them, a deactivated user included, up to this delay.
+CATALOG_AUTH_CACHE_TIMEOUT = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -0,0 +1,11 @@
+"""djanbrary URL Configuration of the ASGI deployment
+
+Same as djanbrary.urls, with the catalog served by catalog.urls_async.
+"""
+from django.urls import path, include
+
+from djanbrary import urls
+
+urlpatterns = [
+    path('catalog/', include('catalog.urls_async')),
+] + [pattern for pattern in urls.urlpatterns if str(pattern.pattern) != 'catalog/']